@@ -83,9 +83,12 @@ from . import WHITE, YELLOW, BLACK, DARK_RED, DARK_CYAN, DARK_GREEN, GREEN, RED,
 from . import printinfo, printstatus
 from . src import eventMarker
 from . src import exp_utils
+from . src import input_utils
 from . src import lobbyManager
 from . src import log_utils
 from . src import pygameMediator
+from . src import sequence_utils
+from . src import severity_utils
 from . src.eventMarker import evmrk
 
 
@@ -383,18 +386,21 @@ def main():
         first_severity = random_severity_generator( int( sum( sum( NumTrials__blocks_x_sequences__2darray ) ) ), 2, 9 )
         if SAVE_INITIAL_SEVERITY_TO_FILE:   numpy.savetxt( InitialSeverityCsv, first_severity, fmt = '%d', delimiter = ',' )
     else:
-        first_severity = numpy.loadtxt( InitialSeverityCsv )
+        first_severity = numpy.array( input_utils.get_experiment_inputs()[ INITIAL_SEVERITY_FILE ] )
         first_severity = first_severity[ 0 : int( sum( sum( NumTrials__blocks_x_sequences__2darray ) ) ) ]
 
   # Passing to pygameMediator too, as provide_agent_response requires this to be set
     if VERBOSE: printinfo( f'__main__: Passing {ANSI.ORANGE}first_severity{ANSI.BLUE} to {ANSI.GREEN}pygameMediator{ANSI.BLUE} module' )
     pygameMediator.first_severity = first_severity
 
+  # Precompute the best/worst case baselines of every sequence, used by the performance metric
+    severity_utils.init_session_baselines( NumTrialsPerSequence_list, first_severity )
+
   ## Load optimal resource allocation and associated final severity
     # XXX How are these obtained? Are they relevant in the calculations, or just here for comparison?
     # These are obtained from the running of the neural network
-    optimal_resources_allocated = numpy.load( os.path.join( INPUTS_PATH, 'optimal_resources.npy' ), allow_pickle = True )
-    optimal_final_severity      = numpy.load( os.path.join( INPUTS_PATH, 'optimal_severity.npy'  ), allow_pickle = True )
+    optimal_resources_allocated = input_utils.get_experiment_inputs()[ 'optimal_resources.npy' ]
+    optimal_final_severity      = input_utils.get_experiment_inputs()[ 'optimal_severity.npy'  ]
 
 
   # Experiment Sessions
@@ -569,6 +575,11 @@ def main():
             ResourceAllocationsAtCurrentlyVisibleCities = []   # Resources currently allocated to each city in the map
             circle_radius = []
 
+          # Incremental messages, aggregation and scores for this sequence (see sequence_utils)
+            NumTrialsInSequence = int( NumTrials__blocks_x_sequences__2darray[ CurrentBlockIndex, CurrentSequenceIndex ] )
+            StartingIndex       = int( sum( NumTrialsPerSequence_list[ : AbsoluteSequenceIndex ] ) )
+            Sequence            = sequence_utils.SequenceState( first_severity[ StartingIndex : StartingIndex + NumTrialsInSequence ], call_nominated_aggregator, AbsoluteSequenceIndex )
+
 
           # Initialise the map with the two pre-trial cities and their severities (following random resource allocation)
 
@@ -775,15 +786,10 @@ def main():
 
 
               # Send a message to all other players (contains response, confidence, and final severities).
-                NumTrialsInSequence = int( NumTrialsPerSequence_list[ AbsoluteSequenceIndex ] )
-                StartingIndex = int( sum( NumTrialsPerSequence_list[ : AbsoluteSequenceIndex ] ) )
-                InitialSeveritiesInSequence = first_severity[ StartingIndex : AbsoluteTrialCount ].copy()
-
-                MyMessage = numpy.c_ [ response   [ CurrentBlockIndex ][ CurrentSequenceIndex ],
-                                       confidence [ CurrentBlockIndex ][ CurrentSequenceIndex ],
-                                       exp_utils.get_array_of_sequence_severities_from_allocations( response[ CurrentBlockIndex ][ CurrentSequenceIndex ], InitialSeveritiesInSequence ),
-                                       circle_radius [ INIT_NO_OF_CITIES : ]
-                                     ]
+                MyMessage = Sequence.add_my_trial( response   [ CurrentBlockIndex ][ CurrentSequenceIndex ][ -1 ],
+                                                   confidence [ CurrentBlockIndex ][ CurrentSequenceIndex ][ -1 ],
+                                                   circle_radius[ -1 ]
+                                                 )
 
               # Optimal final severity for this sequence
                 optimal_seq_final_severity = optimal_final_severity[AbsoluteSequenceIndex]
@@ -795,7 +801,7 @@ def main():
                 AllMessages  = [ MyMessage   ] + PlayerMessages
 
               # Obtain aggregated allocations/severity per step (note: severity of past cities keep changing!)
-                AggregatedAllocations, AggregatedFinalSeverities = call_nominated_aggregator( AllMessages, first_severity, AbsoluteSequenceIndex, AbsoluteTrialCount )
+                AggregatedAllocations, AggregatedFinalSeverities = Sequence.add_all_trials( AllMessages, first_severity, AbsoluteTrialCount )
 
                 if resources_left > 0:
 
@@ -831,18 +837,10 @@ def main():
             pygameMediator.show_message_and_wait( Message, colour = WHITE, wait = False )
 
 
-          ## Send a message to all other players (contains response, confidence, and final severities).
-            # This is used at the Feedback Screen
-            NumTrialsInSequence = int( NumTrialsPerSequence_list[ AbsoluteSequenceIndex ] )
-            StartingIndex = int( sum( NumTrialsPerSequence_list[ : AbsoluteSequenceIndex ] ) )
+          ## My message (response, confidence, and final severities) and those of all other players, as of the last trial.
+            # These are used at the Feedback Screen
             InitialSeveritiesInSequence = first_severity[ StartingIndex : AbsoluteTrialCount ].copy()
 
-            MyMessage = numpy.c_ [ response   [ CurrentBlockIndex ][ CurrentSequenceIndex ],
-                                   confidence [ CurrentBlockIndex ][ CurrentSequenceIndex ],
-                                   exp_utils.get_array_of_sequence_severities_from_allocations( response[ CurrentBlockIndex ][ CurrentSequenceIndex ], InitialSeveritiesInSequence ),
-                                   circle_radius [ INIT_NO_OF_CITIES : ]
-                                 ]
-
           # Optimal final severity for this sequence
             optimal_seq_final_severity = optimal_final_severity[AbsoluteSequenceIndex]
 
@@ -856,17 +854,11 @@ def main():
 
             if DISPLAY_FEEDBACK:
 
-                NumTrialsInSequence = int( NumTrialsPerSequence_list[ AbsoluteSequenceIndex ] )
-                StartingIndex = int( sum( NumTrialsPerSequence_list[ : AbsoluteSequenceIndex ] ) )
-                InitialSeveritiesInSequence = first_severity[ StartingIndex : AbsoluteTrialCount ].copy()
-
-                ( MyPerformance,
-                  WorstCaseSequenceSeverity,
-                  BestCaseSequenceSeverity ) = exp_utils.calculate_normalised_final_severity_performance_metric(
-                                                   MyMessage[ :, 2 ],
-                                                   InitialSeveritiesInSequence
-                                               )
+              # Scores of all players and of the aggregate, as cached over the sequence (last entry: the aggregate)
+                aggregated_allocations, aggregated_final_severity = AggregatedAllocations, AggregatedFinalSeverities
+                Performances = Sequence.get_performances()
 
+                MyPerformance = Performances[ 0 ]
                 MyPerformances.append( MyPerformance )
                 AllPerformances[0].append( MyPerformance )
                 log_utils.tee(
@@ -875,28 +867,15 @@ def main():
                    )
                 log_utils.tee()
 
-                count = 1
-                for _, PlayerId in Players.items():
-
-                    if (PlayerId != MySubjectId ):
-
-                      ## As lobby is sorted, we are accumulatting the values for all the players in the same order.
-                        # XXX however, we should change this, to also take into account Player Id, and create a proper
-                        # legend.
-                        Performance, *_ = exp_utils.calculate_normalised_final_severity_performance_metric(
-                            AllMessages[count][:,2],
-                            InitialSeveritiesInSequence
-                        )
-
-                        AllPerformances[count].append( Performance )
-                        count = count + 1
+              ## As lobby is sorted, we are accumulatting the values for all the players in the same order.
+                # XXX however, we should change this, to also take into account Player Id, and create a proper
+                # legend.
+                for count in range( 1, len( AllMessages ) ):
+                    AllPerformances[count].append( Performances[ count ] )
 
               # Add the aggregated performance.
-                aggregated_allocations, aggregated_final_severity = call_nominated_aggregator( AllMessages, first_severity, AbsoluteSequenceIndex, AbsoluteTrialCount )
-                AggregatedPerformance, *_ = exp_utils.calculate_normalised_final_severity_performance_metric(
-                                            aggregated_final_severity,
-                                            InitialSeveritiesInSequence
-                                        )
+                count = len( AllMessages )
+                AggregatedPerformance = Performances[ -1 ]
 
                 AllPerformances[count].append( AggregatedPerformance )
 
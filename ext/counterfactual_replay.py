@@ -0,0 +1,264 @@
+'''
+PES - Pandemic Experiment Scenario
+
+Counterfactual replay of recorded multi-player sessions.
+
+The recorded responses of the players of every session (OUTPUTS_PATH/<OUTPUT_FILE_PREFIX>responses_<ID>.txt) are
+re-aggregated at every trial under every aggregation method (METHODS) and, for each, the resources of every player are
+re-played under every allocation type (ALLOCATION_TYPES), following the bookkeeping of the experiment
+(exp_utils.get_actual_allocation_given_allocation_type and exp_utils.get_resources_left_given_allocation_type): once a
+player has run out of resources, nothing more is allocated on their map.
+
+Each method is aggregated once for all the sessions, the bookkeeping runs over all methods, allocation types, sessions,
+players and sequences at once (one step per trial position within a sequence), and every map is scored by the
+vectorised severity engine.  The recordings are parsed (and the MMA of every player, used by the fuzzy mean, computed)
+in parallel across subjects, and the Shapley values of the players of every session in parallel across sessions.  As in
+a live session, the fuzzy mean of a trial weighs every player by their MMA and Shapley value after the previous trial
+of the sequence (NEUTRAL_MMA and NEUTRAL_SHAPLEY_VALUE at its first trial).
+
+The group performance (mean performance of the players' maps) of every session, method, allocation type and sequence is
+written into counterfactual_performances.csv, in the outputs directory.  Sessions are given as comma-separated subject
+IDs, e.g. for two sessions of two players:
+
+    python3 -m PES.ext.counterfactual_replay 001,002 003,004
+'''
+
+import os, sys
+os.environ.setdefault('MPLBACKEND', 'Agg')   # no matplotlib windows, also in the worker processes
+
+import csv
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+
+from PES import OUTPUTS_PATH
+from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
+
+from PES.src.input_utils import get_experiment_inputs
+from PES.src.replay_utils import get_responses_filename, read_responses
+from PES.src.severity_utils import pad_sequences, get_padded_final_severities, sum_padded_sequences, get_baselines
+from PES.src.exp_utils import get_weighted_means, get_weighted_medians, get_weighted_modes
+from PES.src.allocationCalculator import get_fuzzy_weighted_mean
+from PES.src.shapleyCalculator import get_shapley_values
+from PES.src.mmaCalculator import get_mma_per_trial
+
+
+# The first 9 resources are consumed by the 'init' cities in the experiment
+AVAILABLE_RESOURCES = AVAILABLE_RESOURCES_PER_SEQUENCE - 9
+
+METHODS = ['confidence_weighted_median', 'confidence_weighted_mean', 'confidence_weighted_mode', 'fuzzy_weighted_mean']
+ALLOCATION_TYPES = ['shared', 'individual', 'penalised', 'proportional']
+
+FIELDS = ['session', 'method', 'allocation_type', 'sequence', 'performance']
+
+# What the fuzzy mean knows of a player before their first trial of a sequence: chance-level MMA (see
+# mmaCalculator.MMAEstimator), and the same Shapley value for every player
+NEUTRAL_MMA = 0.5
+NEUTRAL_SHAPLEY_VALUE = 1.0
+
+
+def get_complete_sequence_lengths(sequence_lengths, num_trials):
+    '''
+    The lengths of the sequences that fit entirely within the first num_trials trials.
+    '''
+    return sequence_lengths[:numpy.searchsorted(numpy.cumsum(sequence_lengths), num_trials, side='right')]
+
+
+def lag_sequences(values, sequence_lengths, first):
+    '''
+    The ( ... × trials ) values one trial later within every sequence: at each trial the value after the previous trial
+    of its sequence, and first at the first trial of every sequence.  The fuzzy mean of a trial can thus only use what
+    was known before that trial was played.
+    '''
+    lagged = numpy.roll(values, 1, axis=-1)
+    lagged[..., numpy.cumsum(sequence_lengths) - sequence_lengths] = first
+    return lagged
+
+
+def load_subject(subject_id, outputs_path, sequence_lengths):
+    '''
+    Recorded trials of a subject (in a worker process), and their MMA before every trial of the sequences they completed
+    (i.e. after the previous trial of the sequence).
+    '''
+    records = read_responses(get_responses_filename(subject_id, outputs_path))
+    sequence_lengths = get_complete_sequence_lengths(sequence_lengths, len(records))
+    records = records[:sequence_lengths.sum()]
+    mmas = get_mma_per_trial(records['response'][None], records['confidence'][None], records['initial_severity'], sequence_lengths)
+    return records, lag_sequences(mmas[0], sequence_lengths, NEUTRAL_MMA)
+
+
+def get_session_shapley_values(responses, confidences, initial_severities, sequence_lengths):
+    '''
+    ( players × trials ) Shapley values of the players of a session (in a worker process) before every trial, i.e. their
+    contribution to the trials of the sequence played so far.
+    '''
+    offsets = numpy.concatenate(([0], numpy.cumsum(sequence_lengths)))
+    shapleys = numpy.hstack([get_shapley_values(responses[:, start:end], confidences[:, start:end], initial_severities[start:end])
+                             for start, end in zip(offsets[:-1], offsets[1:])])
+    return lag_sequences(shapleys, sequence_lengths, NEUTRAL_SHAPLEY_VALUE)
+
+
+def stack_sessions(sessions, subjects):
+    '''
+    ( sessions × players × trials ) responses, confidences and MMAs of the players of every session, padded to the
+    largest and longest session, with the ( sessions × players ) mask of actual players, the ( sessions × trials )
+    initial severities (those recorded for the first player of each session), and the number of trials of every session
+    (that of its shortest recording).
+    '''
+    num_players = max(len(session) for session in sessions)
+    num_trials = numpy.asarray([min(len(subjects[subject_id][0]) for subject_id in session) for session in sessions])
+
+    responses = numpy.zeros((len(sessions), num_players, num_trials.max()))
+    confidences = numpy.full(responses.shape, -1.0)
+    mmas = numpy.full(responses.shape, NEUTRAL_MMA)
+    players = numpy.zeros((len(sessions), num_players), dtype=bool)
+    initial_severities = numpy.zeros((len(sessions), num_trials.max()))
+
+    for s, (session, n) in enumerate(zip(sessions, num_trials)):
+        for p, subject_id in enumerate(session):
+            records, subject_mmas = subjects[subject_id]
+            responses[s, p, :n], confidences[s, p, :n], mmas[s, p, :n] = records['response'][:n], records['confidence'][:n], subject_mmas[:n]
+            players[s, p] = True
+
+        initial_severities[s, :n] = subjects[session[0]][0]['initial_severity'][:n]
+
+    return responses, confidences, mmas, players, initial_severities, num_trials
+
+
+def aggregate_sessions(responses, confidences, players, shapleys, mmas):
+    '''
+    ( methods × sessions × trials ) aggregated allocations of every session, as in the experiment (see
+    exp_utils.get_confidence_weighted_median etc., and allocationCalculator.get_fuzzy_weighted_mean).  Each method is
+    computed once for all the sessions, the players of every session being the only ones taken into account.
+    '''
+    num_sessions, num_players, num_trials = responses.shape
+    flatten = lambda values: values.transpose(1, 0, 2).reshape(num_players, -1)   # players × ( sessions × trials )
+
+    actual = players[:, :, None]
+    valid_confidences = numpy.where(actual, confidences, -1.0)
+
+    # Where none of the players of a session has a valid confidence, the aggregate of all of them (and only them)
+    fallback_confidences = numpy.where(numpy.all(valid_confidences == -1, axis=1, keepdims=True) & actual, 1.0, valid_confidences)
+
+    aggregates = {'confidence_weighted_median': lambda: numpy.round(get_weighted_medians(flatten(responses), flatten(fallback_confidences))),
+                  'confidence_weighted_mean'  : lambda: numpy.round(get_weighted_means(flatten(responses), flatten(fallback_confidences))),
+                  'confidence_weighted_mode'  : lambda: get_weighted_modes(flatten(responses), flatten(fallback_confidences)),
+                  'fuzzy_weighted_mean'       : lambda: get_fuzzy_weighted_mean(flatten(valid_confidences), flatten(shapleys), flatten(mmas), flatten(responses))}
+
+    return numpy.stack([aggregates[method]().reshape(num_sessions, num_trials) for method in METHODS])
+
+
+def replay_allocations(aggregates, responses, confidences, players, sequence_lengths):
+    '''
+    ( allocation types × methods × sessions × players × sequences × trials ) allocations actually made on the map of
+    every player, given the ( methods × sessions × trials ) aggregates and the ( sessions × players × trials ) responses
+    and confidences, following the resource bookkeeping of every allocation type.
+    '''
+    aggregates, mask = pad_sequences(aggregates, sequence_lengths)
+    responses, _ = pad_sequences(responses, sequence_lengths)
+    confidences, _ = pad_sequences(numpy.where(players[:, :, None], confidences, -1.0), sequence_lengths)
+
+    aggregates = aggregates[:, :, None]   # methods × sessions × 1 (players) × sequences × trials
+
+    # The share of the aggregate of every player, under the 'proportional' allocation type
+    valid_confidences = numpy.where(confidences != -1, confidences, 0)
+    sums_of_confidences = valid_confidences.sum(axis=1, keepdims=True)
+    ratios = numpy.divide(valid_confidences, sums_of_confidences, out=numpy.zeros(valid_confidences.shape), where=sums_of_confidences > 0)
+
+    shape = (len(ALLOCATION_TYPES),) + numpy.broadcast_shapes(aggregates.shape, responses.shape)
+    allocations = numpy.zeros(shape)
+    resources_left = numpy.full(shape[:-1], float(AVAILABLE_RESOURCES))
+    individual = numpy.asarray(ALLOCATION_TYPES)[:, None, None, None, None] == 'individual'
+
+    for j in range(mask.shape[-1]):
+        aggregate, response, ratio = aggregates[..., j], responses[..., j], ratios[..., j]
+
+        allocated = numpy.where(individual, numpy.trunc(response), numpy.trunc(aggregate))
+        allocations[..., j] = numpy.where(resources_left > 0, allocated, 0)
+
+        shared = numpy.trunc(resources_left - aggregate)
+        own = numpy.trunc(resources_left - response)
+        left = numpy.stack([shared[0], own[1], numpy.minimum(shared, own)[2], numpy.round(resources_left - aggregate * ratio)[3]])
+
+        resources_left = numpy.where(mask[:, j], left, resources_left)
+
+    return allocations
+
+
+def score_allocations(allocations, initial_severities, sequence_lengths, num_trials):
+    '''
+    Normalised performance of every sequence (last axis but one) of the ( ... × sessions × players × sequences ×
+    trials ) allocations, given the ( sessions × trials ) initial severities of every session and its number of trials
+    (NaN for the sequences a session did not complete).
+    '''
+    padded_initial_severities, mask = pad_sequences(initial_severities, sequence_lengths)
+    final_severities = get_padded_final_severities(allocations, padded_initial_severities[:, None], mask)
+    sequence_severities = sum_padded_sequences(final_severities, sequence_lengths)
+
+    baselines = numpy.full((len(initial_severities), 2, len(sequence_lengths)), numpy.nan)   # sessions × ( worst, best ) × sequences
+    for s, (severities, n) in enumerate(zip(initial_severities, num_trials)):
+        session_sequence_lengths = get_complete_sequence_lengths(sequence_lengths, n)
+        baselines[s, :, :len(session_sequence_lengths)] = get_baselines(session_sequence_lengths, severities)
+    worst, best = baselines[:, 0, None], baselines[:, 1, None]
+
+    return (worst - sequence_severities) / (worst - best)
+
+
+def run_counterfactual_replay(sessions, outputs_path=OUTPUTS_PATH, sequence_lengths=None, max_workers=None):
+    '''
+    Returns the ( methods × allocation types × sessions × players × sequences ) performances of the map of every player
+    of every session (NaN for the players a session does not have, and for the sequences it did not complete, every
+    session being cut to its shortest recording), and the ( methods × allocation types × sessions × sequences ) group
+    performances (mean over the players of each session).
+    '''
+    if sequence_lengths is None: sequence_lengths = get_experiment_inputs().SequenceLengths
+    sequence_lengths = numpy.atleast_1d(numpy.asarray(sequence_lengths).astype(numpy.int64))
+
+    subject_ids = sorted({subject_id for session in sessions for subject_id in session})
+
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        subjects = dict(zip(subject_ids, executor.map(load_subject, subject_ids, [outputs_path] * len(subject_ids), [sequence_lengths] * len(subject_ids))))
+
+        responses, confidences, mmas, players, initial_severities, num_trials = stack_sessions(sessions, subjects)
+        session_sequence_lengths = [get_complete_sequence_lengths(sequence_lengths, n) for n in num_trials]
+        sequence_lengths = get_complete_sequence_lengths(sequence_lengths, responses.shape[-1])
+
+        for session, n in zip(sessions, num_trials):
+            if n == 0: raise ValueError(f"Session {'-'.join(session)} has no complete sequence")
+
+        shapleys = numpy.zeros(responses.shape)
+        for s, session_shapleys in enumerate(executor.map(get_session_shapley_values,
+                                                          [responses[s, players[s], :n] for s, n in enumerate(num_trials)],
+                                                          [confidences[s, players[s], :n] for s, n in enumerate(num_trials)],
+                                                          [initial_severities[s, :n] for s, n in enumerate(num_trials)],
+                                                          session_sequence_lengths)):
+            shapleys[s, players[s], :num_trials[s]] = numpy.maximum(session_shapleys, 0)   # a player who only hurts the group gets no weight
+
+    aggregates = aggregate_sessions(responses, confidences, players, shapleys, mmas)
+    allocations = replay_allocations(aggregates, responses, confidences, players, sequence_lengths)
+    performances = score_allocations(allocations, initial_severities, sequence_lengths, num_trials).swapaxes(0, 1)
+    performances[:, :, ~players] = numpy.nan
+
+    group_performances = numpy.sum(performances, axis=3, where=players[:, :, None]) / players.sum(axis=1)[:, None]
+
+    return performances, group_performances
+
+
+def write_group_performances(filename, sessions, group_performances):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for (m, a, s, q), performance in numpy.ndenumerate(group_performances):
+            if numpy.isnan(performance): continue   # a sequence the session did not complete
+            writer.writerow(dict(session='-'.join(sessions[s]), method=METHODS[m], allocation_type=ALLOCATION_TYPES[a], sequence=q, performance=performance))
+
+
+if __name__=='__main__':
+
+    sessions = [argument.split(',') for argument in sys.argv[1:]]
+
+    _, group_performances = run_counterfactual_replay(sessions)
+    write_group_performances(os.path.join(OUTPUTS_PATH, 'counterfactual_performances.csv'), sessions, group_performances)
+
+    for m, method in enumerate(METHODS):
+        for a, allocation_type in enumerate(ALLOCATION_TYPES):
+            print(f'{method: <28} {allocation_type: <12} {numpy.nanmean(group_performances[m, a]):.4f}')
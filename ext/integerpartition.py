@@ -5,9 +5,12 @@ This code calculates the number of available partitions of integers divisions
 given a constraint in the number of available resources.
 
 This is the combinatorial program that needs to be solved in this experiment.
+The program itself is solved exactly (without enumerating the partitions) by optimal_allocator.py
 
 """
 
+from PES.ext.optimal_allocator import count_allocations
+
 
 
 
@@ -31,11 +34,12 @@ lst = partition(n,d,limitsize)
 print (lst)
 print('Length: ' + str(len(lst)))
 
+# Only count them (see optimal_allocator.py), as materialising all of them explodes with the length.
 lengths = []
 for N in range(0,10):
-    lst = partition(n, N, limitsize)
-    print('Length %03e:  %d' % (N, len(lst)))
-    lengths.append(len(lst))
+    count = count_allocations(n, N, 0, limitsize)
+    print('Length %03e:  %d' % (N, count))
+    lengths.append(count)
 
 print( lengths )
 
@@ -0,0 +1,111 @@
+'''
+PES - Pandemic Experiment Scenario
+
+Exact optimal allocator.
+
+For a known sequence of cities, the allocation that minimises the sum of the final severities of the sequence is found by dynamic programming
+over (position in the sequence, resources left), instead of enumerating every integer partition of the resources (see integerpartition.py).
+All the sequences of the experiment are solved at once, and the optimal allocations and final severities are stored into
+optimal_resources.npy and optimal_severity.npy in the INPUTS_PATH directory.
+
+The number of possible allocations (the partition statistics) can be obtained with count_allocations, without materialising them.
+
+    python3 -m PES.ext.optimal_allocator
+'''
+
+import numpy
+import os
+from functools import lru_cache
+
+from PES import INPUTS_PATH
+from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
+from PES import MAX_ALLOCATABLE_RESOURCES, MIN_ALLOCATABLE_RESOURCES
+
+from PES.src.input_utils import get_experiment_inputs
+from PES.src.severity_utils import get_final_severities, get_sequence_final_severities
+
+
+# The first 9 resources are consumed by the 'init' cities in the experiment
+AVAILABLE_RESOURCES = AVAILABLE_RESOURCES_PER_SEQUENCE - 9
+
+
+def get_optimal_allocations(trials_per_sequence, severities, resources=AVAILABLE_RESOURCES, min_allocation=MIN_ALLOCATABLE_RESOURCES, max_allocation=MAX_ALLOCATABLE_RESOURCES):
+    '''
+    Exact severity-minimising integer allocations for every sequence (severities are given as the session-like flat vector).
+    Each allocation is within [min_allocation, max_allocation], and the allocations of a sequence add up to no more than
+    resources.  When several allocations are optimal, the smallest one is picked at each trial (saving resources).
+
+    Returns the list of allocations of each sequence, and the minimal sum of final severities of each sequence.
+    '''
+    trials_per_sequence = numpy.asarray(trials_per_sequence).astype(numpy.int64)
+    severities = numpy.asarray(severities, dtype=numpy.float64)
+    num_sequences, longest = trials_per_sequence.shape[0], int(trials_per_sequence.max())
+
+    if min_allocation * longest > resources:
+        raise ValueError(f'{resources} resources are not enough to allocate at least {min_allocation} on each of {longest} trials')
+
+    # Right-align the sequences, so that the position p has longest-p updates left for every sequence; the padding
+    # (on the left) is skipped.
+    offsets = numpy.concatenate(([0], numpy.cumsum(trials_per_sequence)))
+    position = numpy.arange(longest)[None,:] - (longest - trials_per_sequence)[:,None]
+    padding = position < 0
+    aligned = numpy.where(padding, 0, severities[numpy.clip(offsets[:-1,None] + position, 0, severities.shape[0]-1)])
+
+    allocations = numpy.arange(min_allocation, max_allocation+1)
+    left = numpy.arange(resources+1)
+    remaining = left[:,None] - allocations[None,:]
+    feasible = remaining >= 0
+
+    # best[s, r]: minimal severity of the rest of the sequence s with r resources left
+    best = numpy.zeros((num_sequences, resources+1))
+    choice = numpy.zeros((longest, num_sequences, resources+1), dtype=numpy.int64)
+
+    for p in reversed(range(longest)):
+        cost = get_final_severities(aligned[:,p,None], allocations[None,:], longest - p)
+
+        total = numpy.where(feasible[None,:,:], cost[:,None,:] + best[:, numpy.maximum(remaining, 0)], numpy.inf)
+        choice[p] = numpy.argmin(total, axis=2)
+        best = numpy.where(padding[:,p,None], best, numpy.take_along_axis(total, choice[p][:,:,None], axis=2)[:,:,0])
+
+    # Walk the decisions forward from the full amount of resources
+    rows = numpy.arange(num_sequences)
+    left = numpy.full((num_sequences,), resources)
+    optimal = numpy.zeros((num_sequences, longest), dtype=numpy.int64)
+    for p in range(longest):
+        optimal[:,p] = numpy.where(padding[:,p], 0, allocations[choice[p][rows, left]])
+        left = left - optimal[:,p]
+
+    return [optimal[s, longest-n:] for s, n in enumerate(trials_per_sequence)], best[:, resources]
+
+
+@lru_cache(maxsize=None)
+def count_allocations(resources, length, min_allocation=MIN_ALLOCATABLE_RESOURCES, max_allocation=MAX_ALLOCATABLE_RESOURCES):
+    '''
+    Number of allocations of length trials, each within [min_allocation, max_allocation], that add up to no more than
+    resources (i.e. len(partition(resources, length, max_allocation)) in integerpartition.py).
+    '''
+    if length == 0:
+        return 1
+    return sum(count_allocations(resources - a, length - 1, min_allocation, max_allocation)
+               for a in range(min_allocation, min(max_allocation, resources) + 1))
+
+
+if __name__=='__main__':
+
+    trials_per_sequence = get_experiment_inputs().SequenceLengths
+    all_severities = get_experiment_inputs()['initial_severity.csv']
+
+    optimal_resources, optimal_total_severity = get_optimal_allocations(trials_per_sequence, all_severities)
+
+    optimal_severity = [get_sequence_final_severities(optimal_resources[s], get_experiment_inputs().get_sequence_severities(s)).tolist() for s in range(len(trials_per_sequence))]
+
+    for s, n in enumerate(trials_per_sequence):
+        print(f'Sequence {s:02d}: {optimal_resources[s]} -> {optimal_total_severity[s]:6.2f} ({count_allocations(AVAILABLE_RESOURCES, int(n))} possible allocations)')
+
+    # Same format as before: object arrays with one entry per sequence
+    resources_array, severity_array = numpy.empty((len(trials_per_sequence),), dtype=object), numpy.empty((len(trials_per_sequence),), dtype=object)
+    resources_array[:] = [r.astype(numpy.float64) for r in optimal_resources]
+    severity_array[:] = optimal_severity
+
+    numpy.save( os.path.join( INPUTS_PATH, 'optimal_resources.npy'), resources_array)
+    numpy.save( os.path.join( INPUTS_PATH, 'optimal_severity.npy'), severity_array)
@@ -8,8 +8,12 @@ of other different allocations and reported confidences (provided by somebody
 else) it provides the OPTIMAL reported confidence that MAXIMIZES the performance 
 of a group of two players working together on the Pandemic Scenario (with weighting average).
 
+train_joint_games trains it on padded batches of recorded joint games (pad_joint_games), each batch played at 
+once by a compiled step (make_train_joint_batch), see train_calibrator.py.
+
 """
 import os
+import time
 import numpy
 import pickle
 from pickle import dumps, loads
@@ -21,6 +25,9 @@ from .. import INPUTS_PATH
 from .. import RESPONSE_MULTIPLIER
 from .. import SEVERITY_MULTIPLIER
 
+from ..src.severity_utils import pad_sequences
+from ..src.Agent import damage_cities
+
 
 
 # create the neural network
@@ -47,6 +54,13 @@ class Calibrator():
             x = tf.math.sigmoid(W @ x + b)
         return tf.squeeze(x) * self.output_range
 
+    def batch_call(self, severity, city_number, resources_remaining, allocation, tpaired_allocation, tpaired_confidence):
+        # Same as __call__, for 1-D tensors of inputs (one entry per game); it is traced as part of make_train_joint_batch.
+        x = tf.stack([severity, city_number, resources_remaining, allocation, tpaired_allocation, tpaired_confidence])
+        for W, b in zip(self.Ws, self.bs):
+            x = tf.math.sigmoid(W @ x + b)
+        return x[0] * self.output_range
+
     def save(self):
 
         with open( self.Weights_tfFile, 'wb') as f:
@@ -124,3 +138,84 @@ def train_one_joint_game(calibrator, optimizer, severities, initial_resources, a
 
     return damage
 
+
+
+
+def pad_joint_games(trials_per_sequence, severities, allocations, paired_allocations, paired_confidences):
+    '''
+    Splits the session-like vectors of a joint game (one value per trial) into zero-padded (sequences, max_cities)
+    arrays (see severity_utils.pad_sequences), which are returned in the same order, followed by the mask of actual cities.
+    '''
+    padded = [pad_sequences(values, trials_per_sequence) for values in (severities, allocations, paired_allocations, paired_confidences)]
+    mask = padded[0][1]
+    return tuple(values.astype(numpy.float32) for values, _ in padded) + (mask.astype(numpy.float32),)
+
+def get_joint_batch_damage(calibrator, severities, allocations, paired_allocations, paired_confidences, mask, initial_resources):
+    '''
+    Total damage of each joint game of a padded batch, played city by city as in train_one_joint_game: the resources
+    allocated are the confidence-weighted combination of both allocations.
+    '''
+    number_cities = tf.reduce_sum(mask, axis=1)
+    resources_remaining = tf.fill(tf.shape(number_cities), initial_resources)
+    damage = tf.zeros_like(number_cities)
+    for k in range(severities.shape[1]):
+        city_number = tf.fill(tf.shape(number_cities), float(k + 1))
+        reported_confidence = calibrator.batch_call(severities[:,k], city_number, resources_remaining, allocations[:,k], paired_allocations[:,k], paired_confidences[:,k])
+
+        # when both confidences are 0, both allocations count the same
+        no_confidence = tf.equal(paired_confidences[:,k] + reported_confidence, 0.)
+        reported_confidence = tf.where(no_confidence, 1., reported_confidence)
+        paired_confidence = tf.where(no_confidence, 1., paired_confidences[:,k])
+
+        resources_allocated = allocations[:,k] * reported_confidence + paired_allocations[:,k] * paired_confidence
+        # padded cities receive no resources and do no damage
+        resources_effectively_allocated = tf.math.minimum(resources_allocated, resources_remaining) * mask[:,k]
+        time_damage_accumulates = number_cities + 1 - city_number
+        damage = damage + mask[:,k] * damage_cities(severities[:,k], resources_effectively_allocated, time_damage_accumulates)
+        resources_remaining = resources_remaining - resources_effectively_allocated
+    return damage
+
+def make_train_joint_batch(calibrator, optimizer, max_cities):
+    '''
+    Compiled (tf.function) training step on a padded batch of joint games of max_cities (see pad_joint_games): one
+    gradient step on the mean damage of the batch. Returns the damage of each game.
+    '''
+    spec = tf.TensorSpec([None, max_cities], tf.float32)
+    @tf.function(input_signature=[spec, spec, spec, spec, spec, tf.TensorSpec([], tf.float32)])
+    def train_joint_batch(severities, allocations, paired_allocations, paired_confidences, mask, initial_resources):
+        with tf.GradientTape(watch_accessed_variables=False) as tape:
+            tape.watch(calibrator.trainable_variables)
+            damage = get_joint_batch_damage(calibrator, severities, allocations, paired_allocations, paired_confidences, mask, initial_resources)
+            loss = tf.reduce_mean(damage)
+        grads = tape.gradient(loss, calibrator.trainable_variables)
+        optimizer.apply_gradients(zip(grads, calibrator.trainable_variables))
+        return damage
+
+    return train_joint_batch
+
+def train_joint_games(calibrator, optimizer, joint_games, epochs, initial_resources, batch_size=64, report_every=10.0):
+    '''
+    Trains the calibrator on the padded joint games (as returned by pad_joint_games, possibly stacked from several
+    sessions), batch_size games per gradient step, shuffled on every epoch. Throughput (games/sec) is reported every
+    report_every seconds.
+
+    Returns the damage of each game played, per epoch.
+    '''
+    joint_games = [numpy.asarray(values, dtype=numpy.float32) for values in joint_games]
+    num_games, max_cities = joint_games[0].shape
+    train_joint_batch = make_train_joint_batch(calibrator, optimizer, max_cities)
+    initial_resources = tf.constant(initial_resources, dtype=tf.float32)
+
+    damage = numpy.zeros((epochs, num_games))
+    start = last_report = time.time()
+    for epoch in range(epochs):
+        order = numpy.random.permutation(num_games)
+        for i in range(0, num_games, batch_size):
+            batch = order[i:i+batch_size]
+            damage[epoch, batch] = train_joint_batch(*[tf.constant(values[batch]) for values in joint_games], initial_resources).numpy()
+
+        if time.time() - last_report >= report_every or epoch == epochs - 1:
+            last_report = time.time()
+            print('Epoch {} Average Damage: {:.4f} ({:.0f} games/sec)'.format(epoch+1, numpy.mean(damage[epoch]), (epoch+1) * num_games / (last_report - start)))
+
+    return damage
@@ -3,8 +3,13 @@ PES - Pandemic Experiment Scenario
 
 This is the Pandemic Scenario represented as a custom scenario of OpenAI's Gym environment.
 
+VecPandemic Class:
+    N independent episodes of the game held in contiguous arrays, all of them stepped at once with a single step(actions[N]) call.
+    Finished episodes can be automatically reset with a freshly sampled sequence (auto_reset).
+
 Pandemic Class:
     This can be used to perform simulations on the game given the current parameters that it may have now.  
+    It is a thin single-episode view over VecPandemic.
     It relies on 
         'calculate_normalised_final_severity_performance_metric' from exp_utils 
         'get_updated_severity' from exp_utils.
@@ -26,22 +31,37 @@ import time
 from PES import VERBOSE
 from PES import INPUTS_PATH
 from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
+from PES import RESPONSE_MULTIPLIER
+from PES import SEVERITY_MULTIPLIER
 
 from PES.src.pygameMediator import convert_globalseq_to_seqs
 from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric
 from PES.src.exp_utils import get_updated_severity
+from PES.src.severity_utils import score_sequences, sum_padded_sequences, pad_sequences, get_final_severities
 
 from PES.src import Agent
 from PES.src.Agent import agent_meta_cognitive
 from PES.src.Agent import adjust_response_decay, boltzmann_decay
-from PES.ext.tools import entropy_from_pdf 
+from PES.ext.tools import entropy_from_pdf, build_rl_decision_table 
 
 
 
-class Pandemic(Env):
-    def __init__(self):
-        super(Pandemic, self).__init__()
-        
+class VecPandemic():
+    def __init__(self, num_envs, auto_reset=True, record_evolution=True, seed=None):
+        '''
+        num_envs episodes are played side by side.  Every per-episode quantity is a row of a contiguous array, and sequences
+        are zero-padded up to the current capacity (max_seq_length, grown on demand by ensure_capacity).
+
+        auto_reset: finished episodes get a new random sequence and are reset within the same step call.  The observation
+                    that finished them is returned in info['final_observation'].  Otherwise, finished episodes are left
+                    untouched (their actions are ignored) until they are reset.
+        record_evolution: keep the (num_envs × capacity+1 × capacity) severity_evolution buffer updated.
+        '''
+        self.num_envs = int(num_envs)
+        self.auto_reset = auto_reset
+        self.record_evolution = record_evolution
+        self.rng = numpy.random.default_rng(seed)
+
         self.max_resources = AVAILABLE_RESOURCES_PER_SEQUENCE-9         # Number of available resources at the beginning (9 are preassigned)
         self.max_seq_length = 12        # Length of the longer possible sequence
         self.max_severity = 10          # Ten severities, from 0 to 10
@@ -50,16 +70,227 @@ class Pandemic(Env):
         self.available_resources_states = self.max_resources + 1
         self.trial_no_states = self.max_seq_length+1
         self.severity_states = self.max_severity+1
-        
-        # Define a 3-D observation space
+
+        # Define a 3-D observation space (for each one of the episodes)
         self.observation_shape = (self.available_resources_states, self.trial_no_states, self.severity_states)
         self.observation_space = spaces.Box(low = numpy.zeros(self.observation_shape), 
                                             high = numpy.ones(self.observation_shape),
                                             dtype = numpy.float16)
-    
-        
-        # Define an action space 
+
+        # Define an action space (for each one of the episodes)
         self.action_space = spaces.Discrete(self.max_allocation+1,)
+
+        self.number_cities_prob = numpy.asarray([], dtype=numpy.float64)
+        self.severity_prob = numpy.asarray([], dtype=numpy.float64)
+
+        self.capacity = 0
+        self.initial_severities = numpy.zeros((self.num_envs, 0))
+        self.allocations = numpy.zeros((self.num_envs, 0), dtype=numpy.int64)
+        self.resources = numpy.zeros((self.num_envs, 0), dtype=numpy.int64)
+        self.severities = numpy.zeros((self.num_envs, 0))
+        self.severity_evolution = numpy.zeros((self.num_envs, 1, 0))
+        self.ensure_capacity(self.max_seq_length)
+
+        self.seq_length = numpy.zeros((self.num_envs,), dtype=numpy.int64)
+        self.available_resources = numpy.full((self.num_envs,), self.max_resources, dtype=numpy.int64)
+        self.iteration = numpy.zeros((self.num_envs,), dtype=numpy.int64)
+        self.ep_return = numpy.zeros((self.num_envs,), dtype=numpy.int64)
+        self.done = numpy.ones((self.num_envs,), dtype=bool)
+
+    def get_envs(self, envs=None):
+        # All the episodes, a boolean mask or a list of indices
+        if envs is None:
+            return numpy.arange(self.num_envs)
+        envs = numpy.asarray(envs)
+        if envs.dtype == bool:
+            return numpy.flatnonzero(envs)
+        return envs.astype(numpy.int64).reshape(-1)
+
+    def ensure_capacity(self, length):
+        # Grow (zero-padded) the per-trial buffers so that sequences of this length fit in.
+        length = int(length)
+        if length <= self.capacity:
+            return
+        grow = length - self.capacity
+        self.initial_severities = numpy.pad(self.initial_severities, ((0,0),(0,grow)))
+        self.allocations = numpy.pad(self.allocations, ((0,0),(0,grow)))
+        self.resources = numpy.pad(self.resources, ((0,0),(0,grow)))
+        self.severities = numpy.pad(self.severities, ((0,0),(0,grow)))
+        if self.record_evolution:
+            self.severity_evolution = numpy.pad(self.severity_evolution, ((0,0),(0,grow),(0,grow)))
+        self.capacity = length
+
+    def random_sequences(self, envs=None):
+        envs = self.get_envs(envs)
+        if envs.shape[0] == 0:
+            return
+
+        if (self.number_cities_prob.shape[0] == 0):
+            lengths = self.rng.integers(3, self.max_seq_length, size=envs.shape[0])
+            longest = int(lengths.max())
+            severities = self.rng.integers(0, self.max_severity, size=(envs.shape[0], longest)).astype(numpy.float64)
+        else:
+            lengths = self.rng.choice(self.number_cities_prob[:,0], size=envs.shape[0], p=self.number_cities_prob[:,1]).astype(numpy.int64)
+            longest = int(lengths.max())
+            severities = self.rng.choice(self.severity_prob[:,0], size=(envs.shape[0], longest), p=self.severity_prob[:,1])
+        allocations = self.rng.integers(0, self.max_allocation+1, size=(envs.shape[0], longest))
+
+        self.ensure_capacity(longest)
+        mask = numpy.arange(longest)[None,:] < lengths[:,None]
+
+        self.seq_length[envs] = lengths
+        self.initial_severities[envs] = 0
+        self.initial_severities[envs, :longest] = numpy.where(mask, severities, 0)
+        self.allocations[envs] = 0
+        self.allocations[envs, :longest] = numpy.where(mask, allocations, 0)
+
+    def set_fixed_sequence(self, env, length, init_severities, allocs=None):
+        self.seq_length[env] = int(length)
+        self.ensure_capacity(self.seq_length[env])
+        self.set_initial_severities(env, init_severities)
+
+        if allocs is None:
+            self.allocations[env] = 0
+            self.allocations[env, :self.seq_length[env]] = self.rng.integers(0, self.max_allocation+1, size=self.seq_length[env])
+        else:
+            self.set_fixed_allocations(env, allocs)
+
+    def set_fixed_sequences(self, trials_per_sequence, severities, allocations=None):
+        # One sequence per episode, given as session-like flat vectors (see severity_utils.pad_sequences)
+        trials_per_sequence = numpy.asarray(trials_per_sequence).astype(numpy.int64)
+        assert trials_per_sequence.shape[0] == self.num_envs, f'Expected {self.num_envs} sequences'
+
+        padded_severities, mask = pad_sequences(severities, trials_per_sequence)
+        self.ensure_capacity(mask.shape[1])
+
+        self.seq_length[:] = trials_per_sequence
+        self.initial_severities[:] = 0
+        self.initial_severities[:, :mask.shape[1]] = numpy.where(mask, padded_severities, 0)
+        self.allocations[:] = 0
+        if allocations is None:
+            self.allocations[:, :mask.shape[1]] = numpy.where(mask, self.rng.integers(0, self.max_allocation+1, size=mask.shape), 0)
+        else:
+            padded_allocations, _ = pad_sequences(allocations, trials_per_sequence)
+            self.allocations[:, :mask.shape[1]] = numpy.where(mask, padded_allocations, 0)
+
+    def set_fixed_allocations(self, env, allocs):
+        allocs = numpy.asarray(allocs).reshape(-1)
+        self.ensure_capacity(allocs.shape[0])
+        self.allocations[env] = 0
+        self.allocations[env, :allocs.shape[0]] = allocs
+
+    def set_initial_severities(self, env, init_severities):
+        init_severities = numpy.asarray(init_severities, dtype=numpy.float64).reshape(-1)
+        self.ensure_capacity(init_severities.shape[0])
+        self.initial_severities[env] = 0
+        self.initial_severities[env, :init_severities.shape[0]] = init_severities
+
+    def sample(self):
+        # The prescribed allocation of the current city of each episode
+        return self.allocations[numpy.arange(self.num_envs), numpy.minimum(self.iteration, self.capacity-1)]
+
+    def get_observations(self):
+        running = self.iteration < self.seq_length
+        new_severity = numpy.where(running, self.initial_severities[numpy.arange(self.num_envs), numpy.minimum(self.iteration, self.capacity-1)], 0)
+        return numpy.stack((self.available_resources, self.iteration, new_severity.astype(numpy.int64)), axis=1)
+
+    def reset(self, envs=None):
+        envs = self.get_envs(envs)
+
+        self.available_resources[envs] = self.max_resources
+        self.ep_return[envs] = 0
+        self.iteration[envs] = 0
+        self.resources[envs] = 0
+        self.severities[envs] = 0
+        if self.record_evolution:
+            self.severity_evolution[envs] = 0
+        self.done[envs] = False
+
+        # Get a new city with its own severity, and keep going....
+        self.severities[envs, 0] = self.initial_severities[envs, 0]
+
+        # return the observations (of every episode)
+        return self.get_observations()
+
+    def step(self, actions):
+        actions = numpy.broadcast_to(numpy.asarray(actions, dtype=numpy.int64), (self.num_envs,))
+
+        # Assert that these are valid actions
+        assert ((actions >= 0) & (actions < self.action_space.n)).all(), f'Invalid Actions {actions}'
+
+        envs = numpy.flatnonzero(~self.done)
+        iteration = self.iteration[envs]
+
+        actions = actions[envs]
+        actions = numpy.where((self.available_resources[envs]-actions) <= 0, self.available_resources[envs], actions)
+
+        self.available_resources[envs] -= actions
+        self.resources[envs, iteration] = actions
+
+        if self.record_evolution:
+            self.severity_evolution[envs, iteration] = self.severities[envs]
+
+        # Cities that have not appeared yet have zero severity and zero resources, so they stay at zero.
+        self.severities[envs] = numpy.maximum(SEVERITY_MULTIPLIER * self.severities[envs] - RESPONSE_MULTIPLIER * self.resources[envs], 0)
+
+        # Increment the episodic return
+        self.ep_return[envs] += 1
+        self.iteration[envs] += 1
+        iteration = iteration + 1
+
+        rewards = numpy.zeros((self.num_envs,))
+        rewards[envs] = (-1) * sum_padded_sequences(self.severities[envs], iteration)
+
+        # If the length of the sequence was achieved, stop
+        finished = iteration == self.seq_length[envs]
+        ending, running = envs[finished], envs[~finished]
+
+        if self.record_evolution:
+            # Update the evolution of the severity one more time for the final severity of all the cities.
+            self.severity_evolution[ending, self.iteration[ending]] = self.severities[ending]
+
+        # Get a new city with its own severity, and keep going....
+        self.severities[running, self.iteration[running]] = self.initial_severities[running, self.iteration[running]]
+
+        self.done[ending] = True
+        dones = numpy.zeros((self.num_envs,), dtype=bool)
+        dones[ending] = True
+
+        observations = self.get_observations()
+        info = {}
+
+        if self.auto_reset and ending.shape[0] > 0:
+            info['final_observation'] = observations.copy()
+            self.random_sequences(ending)
+            observations = self.reset(ending)
+
+        return observations, rewards, dones, info
+
+    def close(self):
+        pass
+
+
+
+
+class Pandemic(Env):
+    def __init__(self):
+        super(Pandemic, self).__init__()
+
+        # The state of the episode lives in the first (and only) row of a VecPandemic
+        self.vec = VecPandemic(1, auto_reset=False)
+
+        self.max_resources = self.vec.max_resources
+        self.max_seq_length = self.vec.max_seq_length
+        self.max_severity = self.vec.max_severity
+        self.max_allocation = self.vec.max_allocation
+
+        self.available_resources_states = self.vec.available_resources_states
+        self.trial_no_states = self.vec.trial_no_states
+        self.severity_states = self.vec.severity_states
+
+        self.observation_shape = self.vec.observation_shape
+        self.observation_space = self.vec.observation_space
+        self.action_space = self.vec.action_space
                         
         # Create a canvas to render the environment images upon 
         self.canvas = numpy.ones(self.observation_shape) * 1
@@ -68,76 +299,84 @@ class Pandemic(Env):
         self.elements = []
 
         self.verbose = True
+        self.done = False
 
-        self.number_cities_prob = numpy.asarray([], dtype=numpy.float64)
-        self.severity_prob = numpy.asarray([], dtype=numpy.float64)
+    @property
+    def number_cities_prob(self):
+        return self.vec.number_cities_prob
 
-    def random_sequence(self):
-        if (self.number_cities_prob.shape[0] == 0):
-            self.seq_length = random.randrange(int(3), int(self.max_seq_length))
-            #print(f'Length:{self.seq_length}')
-            self.allocations = [self.action_space.sample() for s in range(self.seq_length)]
-            self.initial_severities = [random.randrange(int(0), int(self.max_severity)) for s in range(self.seq_length)]
-        else:
-            self.seq_length = int(numpy.random.choice(self.number_cities_prob[:,0], p=(self.number_cities_prob[:,1])))
-            self.initial_severities = numpy.random.choice(self.severity_prob[:,0], size=(self.seq_length,), p=self.severity_prob[:,1])
+    @number_cities_prob.setter
+    def number_cities_prob(self, value):
+        self.vec.number_cities_prob = value
 
+    @property
+    def severity_prob(self):
+        return self.vec.severity_prob
 
+    @severity_prob.setter
+    def severity_prob(self, value):
+        self.vec.severity_prob = value
 
-    def set_fixed_sequence(self, length, init_severities, allocs=None):
-        self.seq_length = int(length)
-        #print(f'Length:{self.seq_length}')
-        self.set_initial_severities(init_severities)
+    @property
+    def seq_length(self):
+        return int(self.vec.seq_length[0])
 
-        if allocs is None:
-            self.allocations = [self.action_space.sample() for s in range(self.seq_length)]
-        else:
-            self.set_fixed_allocations(allocs)
-            
+    @property
+    def available_resources(self):
+        return int(self.vec.available_resources[0])
 
-    def set_fixed_allocations(self, allocs):
-        self.allocations = allocs 
+    @property
+    def iteration(self):
+        return int(self.vec.iteration[0])
 
-    def set_initial_severities(self, init_severities):
-        self.initial_severities = init_severities
+    @property
+    def ep_return(self):
+        return int(self.vec.ep_return[0])
 
-    def new_city(self):
-        return self.initial_severities[self.iteration]
+    @property
+    def initial_severities(self):
+        return self.vec.initial_severities[0, :self.seq_length].tolist()
 
-    def sample(self):
-        return self.allocations[self.iteration]
+    @property
+    def allocations(self):
+        return self.vec.allocations[0, :self.seq_length].tolist()
 
-    def reset(self):
-        # Reset the fuel consumed
-        self.available_resources = self.max_resources
+    @property
+    def severities(self):
+        # The cities that have already appeared (including the current one)
+        return self.vec.severities[0, :min(self.iteration+1, self.seq_length)].tolist()
 
-        # Reset the reward
-        self.ep_return  = 0
+    @property
+    def resources(self):
+        return self.vec.resources[0, :self.iteration].tolist()
 
-        # City number
-        self.iteration = 0
+    @property
+    def severity_evolution(self):
+        return self.vec.severity_evolution[0, :self.seq_length+1, :self.seq_length].copy()
 
-        # Length of the sequence
-        #self.seq_length = random.randrange(int(3), int(self.max_seq_length))
+    def random_sequence(self):
+        self.vec.random_sequences()
 
-        #self.initial_severities = []
+    def set_fixed_sequence(self, length, init_severities, allocs=None):
+        self.vec.set_fixed_sequence(0, length, init_severities, allocs)
 
-        #self.allocations = []
+    def set_fixed_allocations(self, allocs):
+        self.vec.set_fixed_allocations(0, allocs)
 
-        self.severities = []
-        self.resources = []
+    def set_initial_severities(self, init_severities):
+        self.vec.set_initial_severities(0, init_severities)
 
-        self.severity_evolution = numpy.zeros((len(self.initial_severities)+1, len(self.initial_severities)))
-        self.severity_city_counter = 0
+    def new_city(self):
+        return self.vec.initial_severities[0, self.iteration]
 
-        self.done = False
+    def sample(self):
+        return int(self.vec.allocations[0, self.iteration])
 
-        # Get a new city with its own severity, and keep going....
-        new_severity = self.new_city()
-        self.severities.append( new_severity )
+    def reset(self):
+        self.done = False
 
         # return the observation
-        return [self.available_resources, self.iteration, int(new_severity)] 
+        return self.vec.reset()[0].tolist()
 
     def render(self, mode = "human"):
         if (self.done):
@@ -159,50 +398,17 @@ class Pandemic(Env):
 
 
     def step(self, action):
-        # Flag that marks the termination of an episode
-        done = False
-    
         # Assert that it is a valid action 
         assert self.action_space.contains(action), f'Invalid Action {action}'
-        
-        # Reward for executing a step.
-        reward = 0  
-
-        if ( (self.available_resources-action)<= 0):
-            action = self.available_resources
-            #reward += -100
 
-        self.available_resources -= action
-        self.resources.append( action )
+        state, reward, done, info = self.vec.step([action])
 
-        if (self.verbose): self.render()
+        if (self.verbose):
+            # Severities right before the update, as stored in the evolution matrix
+            trial = self.iteration-1
+            print("{:02d}".format(trial+1) , ':' , ":".join(["{:5.2f}".format(sev) for sev in self.vec.severity_evolution[0, trial, :trial+1]]), '->', self.resources[-1])
 
-        self.severity_evolution[self.severity_city_counter][:len(self.severities)] = self.severities 
-        self.severities = get_updated_severity(len(self.severities), self.resources, self.severities)
-        self.severity_city_counter=self.severity_city_counter+1
-
-
-        # Increment the episodic return
-        self.ep_return += 1
-        self.iteration += 1 
-
-        # Get a new city with its own severity, and keep going....
-        reward = (-1) * numpy.sum(self.severities)
-
-
-        # If the length of the sequence was achieved, stop
-        if (self.iteration) == self.seq_length:
-            done = True
-            #reward = (-1) * numpy.sum(self.damage())
-            new_severity = 0
-
-            # Update the evolution of the severity one more time for the final severity of all the cities.
-            self.severity_evolution[self.severity_city_counter][:len(self.severities)] = self.severities 
-        else:
-            new_severity = self.new_city()
-            self.severities.append( new_severity )
-
-        return [self.available_resources, self.iteration, int(new_severity)], reward, done, []
+        return state[0].tolist(), reward[0], bool(done[0]), []
 
 
     def plot_severity_evolution(self, sev_evolution):
@@ -281,8 +487,8 @@ def run_experiment(env,actionfunction,RandomSequences=True, trials_per_sequence=
         env.set_fixed_sequence(trials_per_sequence[seqid],sevs[seqid])
     state = env.reset()
     seqs = []
-    perfs = []
     seq_ev=[]
+    played_lengths, played_allocations, played_severities = [], [], []
     ITERATIONS=NumberOfIterations
     while seqid<ITERATIONS:
         print(f'State: {state}')
@@ -293,8 +499,9 @@ def run_experiment(env,actionfunction,RandomSequences=True, trials_per_sequence=
             env.done = True
             env.render()
             seqs.append(  numpy.sum(env.severities) )
-            perf = calculate_normalised_final_severity_performance_metric( env.severities, env.initial_severities)
-            perfs.append( perf[0] )
+            played_lengths.append( env.seq_length )
+            played_allocations.extend( env.resources )
+            played_severities.extend( env.initial_severities[:env.seq_length] )
             seq_ev.append( env.severity_evolution )
             seqid = seqid+1
             if seqid<ITERATIONS: 
@@ -311,6 +518,10 @@ def run_experiment(env,actionfunction,RandomSequences=True, trials_per_sequence=
     print( seqs )
     env.close()
 
+    # Score all the played sequences at once
+    perfs, *_ = score_sequences( played_allocations, played_lengths, played_severities )
+    perfs = perfs.tolist()
+
     return seqs, perfs, seq_ev
 
 # Define Q-learning function
@@ -326,7 +537,7 @@ def QLearning(env, learning, discount, epsilon, min_eps, episodes, UsePreloadedR
     # Initialize variables to track rewards
     reward_list = []
     ave_reward_list = []
-    conf_list = []
+    visited = []
 
 
     # Calculate episodic reduction in epsilon
@@ -352,8 +563,7 @@ def QLearning(env, learning, discount, epsilon, min_eps, episodes, UsePreloadedR
             else:
                 action = numpy.random.randint(0, env.action_space.n)
 
-            _, confidence, _,_ = rl_agent_meta_cognitive( Q[state[0], state[1], int(state[2])], state[0], 10000)
-            conf_list.append( confidence )
+            visited.append( (state[0], state[1], int(state[2])) )
 
             # Get next state and reward
             state2, reward, done, info = env.step(action) 
@@ -394,7 +604,221 @@ def QLearning(env, learning, discount, epsilon, min_eps, episodes, UsePreloadedR
             print('Episode {} Average Reward: {}'.format(i+1, ave_reward))
             
     env.close()
+
+    # Confidences of the visited states, computed offline from the final Q table (see build_rl_decision_table)
+    conf_list = list(rl_confidences(Q)[tuple(numpy.asarray(visited, dtype=numpy.int64).T)])
     
     return ave_reward_list, Q, conf_list
 
 
+
+def rl_confidences(Q):
+    '''
+    Confidence that rl_agent_meta_cognitive reports for every state of the Q table (the options are on the last axis).
+    It is used to compute the confidences offline, once training is over, instead of on every training step.
+    '''
+    return build_rl_decision_table(Q, mask_infeasible=False)['confidence']
+
+def average_per_pair(shape, index, values):
+    '''
+    Flat indices of the distinct entries of an array of the given shape that the (s0, s1, s2, action) index hits, and
+    the mean of the values that hit each of them.
+    '''
+    flat_index = numpy.ravel_multi_index(index, shape)
+    pairs, inverse = numpy.unique(flat_index, return_inverse=True)
+    return pairs, numpy.bincount(inverse, weights=values, minlength=pairs.shape[0]) / numpy.bincount(inverse, minlength=pairs.shape[0])
+
+def save_qlearning_checkpoint(q_file, rewards_file, Q, ave_reward_list, episodes_done, pending_rewards, visits):
+    # Written to temporary files first, so that an interrupted save never leaves a corrupted checkpoint behind.
+    for filename, value in ((q_file, Q), (rewards_file, numpy.asarray(ave_reward_list))):
+        with open(filename + '.tmp', 'wb') as f:
+            numpy.save(f, value)
+        os.replace(filename + '.tmp', filename)
+
+    with open(q_file + '.progress.tmp', 'wb') as f:
+        numpy.savez(f, episodes=episodes_done, pending_rewards=pending_rewards, visits=numpy.zeros((0,)) if visits is None else visits)
+    os.replace(q_file + '.progress.tmp', q_file + '.progress.npz')
+
+# Define batched Q-learning function
+def QLearningBatch(env, learning, discount, epsilon, min_eps, episodes, UsePreloadedReward=False, R=None, record_visits=False, q_file=None, rewards_file=None, checkpoint_every=1000000, report_every=10.0):
+    '''
+    Same Q-learning as QLearning, but over all the episodes of a VecPandemic (with auto_reset) at once: every step
+    updates the Q table synchronously for the whole batch.  The episodes that visit the same (state, action) pair in a step
+    make a single update with the mean of their deltas, so that the learning rate does not grow with the number of
+    episodes (with a single episode, this is exactly QLearning).
+
+    record_visits: count the visits to every state, so that the confidences can be computed offline (see rl_confidences).
+    q_file, rewards_file: the Q table and the average rewards are checkpointed there every checkpoint_every episodes (plus
+                          a q_file.progress.npz file), and training resumes from them if they are already there.  With
+                          record_visits, a q_file without a matching visits counter (ValueError) is never resumed from.
+    report_every: seconds between progress reports (episodes/sec).
+
+    Returns the average rewards (every 10000 episodes), the Q table and the visits counter (None if not recorded).
+    '''
+    REWARD_WINDOW = 10000
+
+    # Initialize Q table
+    Q = env.rng.uniform(low = -1, high = 1, 
+                        size = (  env.available_resources_states, 
+                                    env.trial_no_states, 
+                                    env.severity_states,
+                                            env.action_space.n))
+
+    visits = numpy.zeros(Q.shape[:3], dtype=numpy.int64) if record_visits else None
+
+    # Initialize variables to track rewards
+    ave_reward_list = []
+    pending_rewards = numpy.zeros((0,))
+    episodes_done = 0
+
+    if q_file is not None and os.path.isfile(q_file):
+        Q = numpy.load(q_file)
+        ave_reward_list = list(numpy.load(rewards_file)) if os.path.isfile(rewards_file) else []
+        if os.path.isfile(q_file + '.progress.npz'):
+            progress = numpy.load(q_file + '.progress.npz')
+            episodes_done = int(progress['episodes'])
+            pending_rewards = progress['pending_rewards']
+            if record_visits:
+                if progress['visits'].shape != visits.shape:
+                    raise ValueError(f'The checkpoint of {q_file} has no visits counter of shape {visits.shape} to resume from (was it saved without record_visits?): remove it to train from scratch')
+                visits = progress['visits']
+        elif record_visits:
+            raise ValueError(f'{q_file} has no progress information (e.g. it was written by solve_rl), hence no visits counter to resume from: remove it to train from scratch')
+        else:
+            # A Q table without progress information is a finished one.
+            episodes_done = episodes
+        print(f'Resuming Q-learning from episode {episodes_done}')
+
+    # Calculate episodic reduction in epsilon
+    reduction = (epsilon - min_eps)/episodes
+
+    tot_reward = numpy.zeros((env.num_envs,))
+    next_checkpoint = (episodes_done // checkpoint_every + 1) * checkpoint_every
+    start, last_report, start_episodes = time.time(), time.time(), episodes_done
+
+    env.random_sequences()
+    state = env.reset()
+
+    # Run Q learning algorithm
+    while episodes_done < episodes:
+        s0, s1, s2 = state[:,0], state[:,1], state[:,2]
+
+        # Determine next action - epsilon greedy strategy
+        current_epsilon = max(min_eps, epsilon - reduction * episodes_done)
+        greedy = env.rng.random(env.num_envs) < 1 - current_epsilon
+        actions = numpy.where(greedy, numpy.argmax(Q[s0, s1, s2], axis=1), env.rng.integers(0, env.action_space.n, size=env.num_envs))
+
+        if record_visits:
+            numpy.add.at(visits, (s0, s1, s2), 1)
+
+        # Get next states and rewards (finished episodes are already reset)
+        state2, reward, done, info = env.step(actions)
+
+        if (UsePreloadedReward):
+            reward = R[s0, s1, s2, actions]
+
+        # Adjust Q values for the current states (all the updates are computed from the same Q table, and the episodes
+        # that visit the same (state, action) pair make a single update, with the mean of their deltas)
+        running = ~done
+        delta = (reward[running] + 
+                 discount*numpy.max(Q[state2[running,0], state2[running,1], state2[running,2]], axis=1) - 
+                 Q[s0[running], s1[running], s2[running], actions[running]])
+        pairs, mean_delta = average_per_pair(Q.shape, (s0[running], s1[running], s2[running], actions[running]), delta)
+        Q.flat[pairs] += learning*mean_delta
+
+        #Allow for terminal states (the mean reward of the episodes that end at the same pair)
+        pairs, mean_reward = average_per_pair(Q.shape, (s0[done], s1[done], s2[done], actions[done]), reward[done])
+        Q.flat[pairs] = mean_reward
+
+        # Update variables
+        tot_reward += reward
+        if done.any():
+            pending_rewards = numpy.concatenate((pending_rewards, tot_reward[done]))
+            tot_reward[done] = 0
+            episodes_done += int(done.sum())
+
+            # Track rewards
+            while pending_rewards.shape[0] >= REWARD_WINDOW:
+                ave_reward_list.append(numpy.mean(pending_rewards[:REWARD_WINDOW]))
+                pending_rewards = pending_rewards[REWARD_WINDOW:]
+
+        state = state2
+
+        if time.time() - last_report >= report_every:
+            last_report = time.time()
+            ave_reward = ave_reward_list[-1] if ave_reward_list else numpy.nan
+            print('Episode {} Average Reward: {} ({:.0f} episodes/sec)'.format(episodes_done, ave_reward, (episodes_done - start_episodes) / (last_report - start)))
+
+        if q_file is not None and episodes_done >= next_checkpoint:
+            save_qlearning_checkpoint(q_file, rewards_file, Q, ave_reward_list, episodes_done, pending_rewards, visits)
+            next_checkpoint = (episodes_done // checkpoint_every + 1) * checkpoint_every
+
+    if q_file is not None:
+        save_qlearning_checkpoint(q_file, rewards_file, Q, ave_reward_list, episodes_done, pending_rewards, visits)
+
+    env.close()
+
+    return ave_reward_list, Q, visits
+
+# Define exact (backward induction) Q function
+def QBackwardInduction(env, discount=1.0, final_severity=False):
+    '''
+    Exact Q table for the game, computed by backward induction over (available resources × trial × severity × action)
+    with the known dynamics, the sequence-length distribution (env.number_cities_prob) and the severity distribution
+    (env.severity_prob).  It has the same layout as the tables learned by QLearning, and it takes a second to compute.
+
+    Q holds the expected (discounted) sum of the step rewards (minus the sum of the severities after each step) from now
+    on, counting the cities still to be played plus the current one.  The severities of the cities that were already
+    played do not depend on the current decision (nor are they part of the observation), so they are left out.
+    final_severity: count only the severity of each city at the end of the sequence (the quantity that the performance
+                    metric scores) instead of its severity after every step.
+    '''
+    lengths = env.number_cities_prob[:,0].astype(numpy.int64)
+    severities = env.severity_prob[:,0]
+    severity_prob = env.severity_prob[:,1]
+    severity_states = severities.astype(numpy.int64)      # The severity is observed as int(severity)
+
+    # P(n) and P(n >= k), for sequence lengths n, k in 0..max_length
+    max_length = int(lengths.max())
+    length_prob = numpy.zeros((max_length+2,))
+    numpy.add.at(length_prob, lengths, env.number_cities_prob[:,1])
+    survival = numpy.cumsum(length_prob[::-1])[::-1]
+
+    actions = numpy.arange(env.action_space.n)
+    steps = numpy.arange(1, max_length+1)
+    resources = numpy.arange(env.available_resources_states)
+
+    # Severity of a city after 1..max_length updates, and its cost when the city is in play for 1..max_length steps
+    F = get_final_severities(severities[:,None,None], actions[None,:,None], steps[None,None,:])
+    cost = F if final_severity else numpy.cumsum(F * discount ** (steps - 1), axis=-1)
+
+    # The environment assigns whatever is left when the action exceeds (or matches) the available resources
+    effective = numpy.minimum(actions[None,:], resources[:,None])
+    left = resources[:,None] - effective
+
+    Q = numpy.zeros((env.available_resources_states, env.trial_no_states, env.severity_states, env.action_space.n))
+    state_prob = numpy.bincount(severity_states, weights=severity_prob, minlength=env.severity_states)
+    observed = state_prob > 0
+
+    # Expected value of the next trial (before its severity is known), for every amount of resources left
+    V = numpy.zeros((env.available_resources_states,))
+
+    for t in reversed(range(max_length)):
+        if survival[t+1] == 0:
+            continue
+
+        # Trial t is played when n >= t+1; the city then stays in play for n-t steps, and trial t+1 comes when n >= t+2.
+        expected_cost = cost[:, :, :max_length-t] @ (length_prob[t+1:max_length+1] / survival[t+1])
+        continuation = survival[t+2] / survival[t+1]
+
+        Qv = -expected_cost[:, effective] + discount * continuation * V[left][None,:,:]
+
+        # Average the severities observed as the same state
+        Qs = numpy.zeros((env.severity_states,) + Qv.shape[1:])
+        numpy.add.at(Qs, severity_states, severity_prob[:,None,None] * Qv)
+        Qs[observed] /= state_prob[observed][:,None,None]
+
+        Q[:, t] = Qs.transpose(1, 0, 2)
+        V = numpy.sum(state_prob[:,None] * numpy.max(Qs, axis=2), axis=0)
+
+    return Q
@@ -16,6 +16,7 @@ print(tf.__version__)
 from PES.src.Agent import *
 from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric
 from PES.src.exp_utils import get_updated_severity
+from PES.src.input_utils import get_experiment_inputs
 
 
 from PES import VERBOSE
@@ -23,8 +24,8 @@ from PES import INPUTS_PATH
 from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
 
 initial_resources = tf.constant(AVAILABLE_RESOURCES_PER_SEQUENCE-9, dtype=tf.float32)
-trials_per_sequence = np.loadtxt(os.path.join( INPUTS_PATH,'sequence_lengths.csv'), delimiter=',')
-all_severities = np.loadtxt(os.path.join( INPUTS_PATH, 'initial_severity.csv'), delimiter=',')
+trials_per_sequence = get_experiment_inputs()['sequence_lengths.csv']
+all_severities = get_experiment_inputs()['initial_severity.csv']
 print(trials_per_sequence.shape, all_severities.shape, sum(trials_per_sequence))
 
 val_cities, count_cities = np.unique(trials_per_sequence, return_counts=True)
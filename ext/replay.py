@@ -94,10 +94,11 @@ from PES import INPUTS_PATH
 from PES.src.pygameMediator import convert_globalseq_to_seqs
 from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric
 from PES.src.exp_utils import get_updated_severity
+from PES.src.input_utils import get_experiment_inputs
 
 # Read the "cannonical" sequence of sequences.
-trials_per_sequence = np.loadtxt(os.path.join( INPUTS_PATH,'sequence_lengths.csv'), delimiter=',')
-all_severities = np.loadtxt(os.path.join( INPUTS_PATH, 'initial_severity.csv'), delimiter=',')
+trials_per_sequence = get_experiment_inputs()['sequence_lengths.csv']
+all_severities = get_experiment_inputs()['initial_severity.csv']
 
 sevs = convert_globalseq_to_seqs(trials_per_sequence, all_severities)
 
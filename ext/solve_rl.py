@@ -0,0 +1,61 @@
+'''
+PES - Pandemic Experiment Scenario
+
+This script computes the exact Q-Table for the RL Agent, by backward induction over the (tiny) state space of the pandemic scenario.
+It uses the empirical distributions of sequence lengths and severities of the experiment (as train_rl does), and it takes seconds instead of a 10M-episode training run.
+
+The Q-Table is stored into the INPUTS_PATH directory, as q_exact.npy or the filename given as the first argument (q.npy to have the RL Agent use it).
+If the sampled Q-Table of the RL Agent (q.npy) is there, the agreement of both greedy policies and their performance on the experiment sequences are reported first.
+
+    python3 -m PES.ext.solve_rl [q_exact.npy]
+'''
+
+import numpy
+import os, sys
+
+from PES import INPUTS_PATH
+
+from PES.src.input_utils import get_experiment_inputs
+from PES.src.severity_utils import score_sequences
+from PES.ext.pandemic import VecPandemic, QBackwardInduction
+from PES.ext.tools import get_empirical_distributions, get_policy_agreement
+
+
+def play_greedy_policy(Q, trials_per_sequence, all_severities):
+    # Play all the sequences of the experiment at once, always picking the best option of the Q-Table
+    env = VecPandemic(len(trials_per_sequence), auto_reset=False, record_evolution=False)
+    env.set_fixed_sequences(trials_per_sequence, all_severities)
+    state = env.reset()
+
+    while not env.done.all():
+        state, reward, done, info = env.step(numpy.argmax(Q[state[:,0], state[:,1], state[:,2]], axis=1))
+
+    allocations = numpy.concatenate([env.resources[i, :length] for i, length in enumerate(trials_per_sequence)])
+    performances, *_ = score_sequences(allocations, trials_per_sequence, all_severities)
+    return performances
+
+
+if __name__=='__main__':
+
+    qfile = os.path.join( INPUTS_PATH, 'q.npy')
+    exact_qfile = os.path.join( INPUTS_PATH, sys.argv[1] if len(sys.argv) > 1 else 'q_exact.npy')
+
+    trials_per_sequence = get_experiment_inputs().SequenceLengths
+    all_severities = get_experiment_inputs()['initial_severity.csv']
+
+    env = VecPandemic(1)
+    env.number_cities_prob, env.severity_prob = get_empirical_distributions(trials_per_sequence, all_severities)
+
+    Q = QBackwardInduction(env, discount=1.0)
+
+    performances = play_greedy_policy(Q, trials_per_sequence, all_severities)
+    print(f'Exact Q-Table: average normalised performance {numpy.mean(performances):.4f}')
+
+    if os.path.isfile(qfile):
+        Q_sampled = numpy.load(qfile)
+        performances = play_greedy_policy(Q_sampled, trials_per_sequence, all_severities)
+        print(f'Sampled Q-Table ({qfile}): average normalised performance {numpy.mean(performances):.4f}')
+        print(f'Policy agreement with the exact Q-Table: {get_policy_agreement(Q_sampled, Q):.4f}')
+
+    numpy.save( exact_qfile, Q)
+    print(f'Exact Q-Table stored in {exact_qfile}')
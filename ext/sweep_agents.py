@@ -0,0 +1,246 @@
+'''
+PES - Pandemic Experiment Scenario
+
+Hyper-parameter and seed sweep for the agents of the experiment.
+
+Many variants of the NN-Agent (hidden layers sizes, learning rate) and of the RL-Agent (Q-learning learning rate, discount
+and epsilon) are trained, with several seeds each, in parallel on all the cores.  Every variant is scored by playing the
+fixed 360-trial schedule of the experiment (sequence_lengths.csv, initial_severity.csv); the NN-Agent, which is trained
+without noise, once for every AGENT_NOISE_VARIANCE (one row of the results table each).
+
+The results table (results.csv) and the weights of every variant are written into the sweep directory (OUTPUTS_PATH/sweep,
+or the directory given as the first argument), together with the best weights of each agent (best_weights.npz for the
+NN-Agent, in the format of agent_utils, and best_q.npy for the RL-Agent).  The sweep runs headless, and it can be
+interrupted at any time: when it is run again, the variants already in results.csv are skipped.
+
+    python3 -m PES.ext.sweep_agents [sweep directory]
+'''
+
+import os, sys
+os.environ.setdefault('MPLBACKEND', 'Agg')   # no matplotlib windows, also in the worker processes
+
+import csv
+import time
+import shutil
+import itertools
+import multiprocessing
+import numpy
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PES import OUTPUTS_PATH
+from PES import AVAILABLE_RESOURCES_PER_SEQUENCE, MAX_ALLOCATABLE_RESOURCES
+
+from PES.src.input_utils import get_experiment_inputs
+from PES.src.severity_utils import score_sequences
+from PES.src.agent_utils import NumpyModel, initseed, agent_meta_cognitive, calibrated_metacognitive_response_from_agent
+from PES.ext.tools import get_empirical_distributions, convert_globalseq_to_seqs
+
+
+# The first 9 resources are consumed by the 'init' cities in the experiment
+AVAILABLE_RESOURCES = AVAILABLE_RESOURCES_PER_SEQUENCE - 9
+
+SEEDS = [0, 1, 2]
+
+NN_HIDDEN_LAYERS_SIZES = [(4,4), (8,8), (16,), (16,16)]
+NN_LEARNING_RATES = [0.001, 0.003, 0.01]
+NN_NOISE_VARIANCES = [0.0, 2.0]
+NN_GAMES = 20000
+NN_BATCH_SIZE = 64
+
+RL_LEARNING = [0.1, 0.2]
+RL_DISCOUNT = [0.9, 1.0]
+RL_EPSILON = [0.5, 0.8]
+RL_EPISODES = 1000000
+RL_NUM_ENVS = 1024
+
+FIELDS = ['variant', 'agent', 'hidden_layers_sizes', 'learning_rate', 'noise_variance', 'learning', 'discount', 'epsilon',
+          'seed', 'performance', 'performance_std', 'seconds', 'weights']
+
+
+def get_variants():
+    '''
+    All the variants of the sweep, as dicts of parameters (with a unique 'variant' name).
+    '''
+    variants = []
+    for hidden, rate, seed in itertools.product(NN_HIDDEN_LAYERS_SIZES, NN_LEARNING_RATES, SEEDS):
+        variants.append(dict(variant=f'nn_h{"-".join(map(str, hidden))}_lr{rate}_s{seed}', agent='nn',
+                             hidden_layers_sizes=hidden, learning_rate=rate, seed=seed))
+    for learning, discount, epsilon, seed in itertools.product(RL_LEARNING, RL_DISCOUNT, RL_EPSILON, SEEDS):
+        variants.append(dict(variant=f'rl_l{learning}_d{discount}_e{epsilon}_s{seed}', agent='rl',
+                             learning=learning, discount=discount, epsilon=epsilon, seed=seed))
+    return variants
+
+
+def load_schedule():
+    trials_per_sequence = get_experiment_inputs().SequenceLengths
+    all_severities = get_experiment_inputs()['initial_severity.csv']
+    return trials_per_sequence, all_severities
+
+
+def play_nn_agent(model, noise_variance, seed, trials_per_sequence, all_severities):
+    '''
+    Allocations of the NN-Agent (a NumpyModel) on the whole schedule, as in the experiment: humanised with the given
+    AGENT_NOISE_VARIANCE (no noise at all when it is 0).
+    '''
+    initseed(seed, noise_variance)
+    allocations = []
+    for seq_no, sequence in enumerate(convert_globalseq_to_seqs(trials_per_sequence, all_severities)):
+        resources_left = AVAILABLE_RESOURCES
+        for trial_no, severity in enumerate(sequence):
+            response, *_ = agent_meta_cognitive(model(severity, trial_no, resources_left), MAX_ALLOCATABLE_RESOURCES+1, resources_left, 0)
+            if noise_variance > 0:
+                _, response = calibrated_metacognitive_response_from_agent(seq_no + 1, response, resources_left)
+            allocations.append(response)
+            resources_left -= response
+    return numpy.asarray(allocations, dtype=numpy.float64)
+
+
+def train_nn_agent(variant, trials_per_sequence, all_severities):
+    '''
+    Returns the trained NN-Agent (as a NumpyModel).  Noise only enters when it plays (see play_nn_agent).
+    '''
+    import tensorflow as tf
+    from tensorflow.keras import optimizers
+    from PES.src.Agent import Game, Model, train_games
+
+    numpy.random.seed(variant['seed'])
+    tf.random.set_seed(variant['seed'])
+
+    game = Game(*get_empirical_distributions(trials_per_sequence, all_severities))
+    model = Model(list(variant['hidden_layers_sizes']), 10)
+    train_games(model, optimizers.Adam(learning_rate=variant['learning_rate']), game, NN_GAMES, AVAILABLE_RESOURCES, batch_size=NN_BATCH_SIZE, report_every=numpy.inf)
+
+    return NumpyModel.from_model(model)
+
+
+def train_rl_agent(variant, trials_per_sequence, all_severities):
+    '''
+    Returns the Q table of the RL-Agent and the performances of its greedy policy on each sequence of the schedule.
+    '''
+    from PES.ext.pandemic import VecPandemic, QLearningBatch
+    from PES.ext.solve_rl import play_greedy_policy
+
+    env = VecPandemic(RL_NUM_ENVS, auto_reset=True, record_evolution=False, seed=variant['seed'])
+    env.number_cities_prob, env.severity_prob = get_empirical_distributions(trials_per_sequence, all_severities)
+    numpy.random.seed(variant['seed'])
+
+    _, Q, _ = QLearningBatch(env, variant['learning'], variant['discount'], variant['epsilon'], 0, RL_EPISODES, report_every=numpy.inf)
+
+    return Q, play_greedy_policy(Q, trials_per_sequence, all_severities)
+
+
+def get_num_rows(variant):
+    '''
+    Number of rows of the results table of a variant (one per AGENT_NOISE_VARIANCE for the NN-Agent).
+    '''
+    return len(NN_NOISE_VARIANCES) if variant['agent'] == 'nn' else 1
+
+
+def run_variant(variant, sweep_path):
+    '''
+    Trains and scores a single variant (in a worker process).  Its weights are stored into the sweep directory, and its
+    rows of the results table are returned.
+    '''
+    start = time.time()
+    trials_per_sequence, all_severities = load_schedule()
+
+    if variant['agent'] == 'nn':
+        model = train_nn_agent(variant, trials_per_sequence, all_severities)
+        weights = os.path.join('variants', variant['variant'] + '.npz')
+        model.save(os.path.join(sweep_path, weights + '.tmp.npz'))
+        os.replace(os.path.join(sweep_path, weights + '.tmp.npz'), os.path.join(sweep_path, weights))
+
+        # The same trained model, played at every noise level
+        scores = []
+        for noise_variance in NN_NOISE_VARIANCES:
+            allocations = play_nn_agent(model, noise_variance, variant['seed'], trials_per_sequence, all_severities)
+            performances, *_ = score_sequences(allocations, trials_per_sequence, all_severities)
+            scores.append((dict(variant, noise_variance=noise_variance), performances))
+    else:
+        Q, performances = train_rl_agent(variant, trials_per_sequence, all_severities)
+        weights = os.path.join('variants', variant['variant'] + '.npy')
+        numpy.save(os.path.join(sweep_path, weights + '.tmp.npy'), Q)
+        os.replace(os.path.join(sweep_path, weights + '.tmp.npy'), os.path.join(sweep_path, weights))
+        scores = [(variant, performances)]
+
+    rows = []
+    for scored_variant, performances in scores:
+        row = {field: scored_variant.get(field, '') for field in FIELDS}
+        row.update(performance=numpy.mean(performances), performance_std=numpy.std(performances), seconds=time.time() - start, weights=weights)
+        rows.append(row)
+    return rows
+
+
+def init_worker():
+    # The cores are shared among the workers
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def read_results(results_file):
+    if not os.path.isfile(results_file):
+        return []
+    with open(results_file, newline='') as f:
+        # A row cut short by an interruption is dropped (and its variant is run again)
+        return [row for row in csv.DictReader(f) if row.get('weights')]
+
+
+def run_sweep(sweep_path, variants, max_workers=None):
+    '''
+    Runs all the variants that are not in the results table of sweep_path yet, and appends their rows as they finish.
+    Returns the whole results table.
+    '''
+    os.makedirs(os.path.join(sweep_path, 'variants'), exist_ok=True)
+    results_file = os.path.join(sweep_path, 'results.csv')
+
+    # A variant is finished once all its rows are in the table (the rows of any other variant are dropped, and it is run again)
+    results = read_results(results_file)
+    num_rows = {variant['variant']: get_num_rows(variant) for variant in variants}
+    finished = {name for name in num_rows if sum(row['variant'] == name for row in results) == num_rows[name]}
+    results = [row for row in results if row['variant'] in finished]
+    pending = [variant for variant in variants if variant['variant'] not in finished]
+    print(f'{len(finished)} variants already finished, {len(pending)} to go')
+
+    # Rewrite the table, so that it ends with a complete row
+    with open(results_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    # TensorFlow does not survive a fork: the workers are spawned
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'), initializer=init_worker) as executor:
+        futures = {executor.submit(run_variant, variant, sweep_path): variant for variant in pending}
+        with open(results_file, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            for future in as_completed(futures):
+                rows = future.result()
+                writer.writerows(rows)
+                f.flush()
+                finished.add(futures[future]['variant'])
+                for row in rows:
+                    results.append({field: str(value) for field, value in row.items()})
+                    noise = f' (noise {row["noise_variance"]})' if row['agent'] == 'nn' else ''
+                    print(f'[{len(finished)}/{len(variants)}] {row["variant"]}{noise}: performance {row["performance"]:.4f} ({row["seconds"]:.0f} s)')
+
+    return results
+
+
+def store_best_weights(sweep_path, results):
+    '''
+    Copies the weights of the best variant of each agent (highest average performance) into the sweep directory.
+    '''
+    for agent, best_file in [('nn', 'best_weights.npz'), ('rl', 'best_q.npy')]:
+        rows = [row for row in results if row['agent'] == agent]
+        if rows:
+            best = max(rows, key=lambda row: float(row['performance']))
+            shutil.copyfile(os.path.join(sweep_path, best['weights']), os.path.join(sweep_path, best_file))
+            print(f'Best {agent} variant: {best["variant"]} (performance {float(best["performance"]):.4f}) -> {best_file}')
+
+
+if __name__=='__main__':
+
+    sweep_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join( OUTPUTS_PATH, 'sweep')
+
+    results = run_sweep(sweep_path, get_variants())
+    store_best_weights(sweep_path, results)
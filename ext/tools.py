@@ -24,7 +24,9 @@ from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
 from PES import MAX_ALLOCATABLE_RESOURCES, MIN_ALLOCATABLE_RESOURCES
 
 from PES.src.exp_utils import get_array_of_sequence_severities_from_allocations
+from PES.src.exp_utils import get_sequence_severity_from_allocations
 from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric 
+from PES.src.severity_utils import score_sequences, get_sequence_baselines
 import statsmodels.api as sm
 
 DATA_PATH = '.'
@@ -33,10 +35,7 @@ DATA_PATH = '.'
 def calculate_sequence_performance( SeveritiesFromSequence, InitialSequenceSeverities ):
 
     FinalSequenceSeverity     = numpy.sum( SeveritiesFromSequence )
-    BestCaseAllocations       = numpy.full_like( SeveritiesFromSequence, MAX_ALLOCATABLE_RESOURCES )
-    WorstCaseAllocations      = numpy.full_like( SeveritiesFromSequence, MIN_ALLOCATABLE_RESOURCES )
-    BestCaseSequenceSeverity  = numpy.asarray( get_sequence_severity_from_allocations( BestCaseAllocations , InitialSequenceSeverities ) )
-    WorstCaseSequenceSeverity = numpy.asarray( get_sequence_severity_from_allocations( WorstCaseAllocations, InitialSequenceSeverities ) )
+    WorstCaseSequenceSeverity, BestCaseSequenceSeverity = get_sequence_baselines( InitialSequenceSeverities )
     Performance               = (WorstCaseSequenceSeverity - FinalSequenceSeverity) / (WorstCaseSequenceSeverity - BestCaseSequenceSeverity )
 
     return Performance
@@ -90,6 +89,88 @@ def entropy(x, bins=None):
     return H
 
 
+def get_empirical_distributions(trials_per_sequence, all_severities):
+    '''
+    Returns the empirical distributions of the sequence lengths and of the severities, as 2-D vectors (value, probability).
+    '''
+    val_cities, count_cities = numpy.unique(trials_per_sequence, return_counts=True)
+    val_severity, count_severity = numpy.unique(all_severities, return_counts=True)
+    number_cities_prob = numpy.asarray((val_cities, count_cities/len(trials_per_sequence))).T
+    severity_prob = numpy.asarray((val_severity, count_severity/len(all_severities))).T
+    return number_cities_prob, severity_prob
+
+
+def get_policy_agreement(Q, Q_reference, visits=None):
+    '''
+    Fraction of states where the greedy actions of both Q tables agree.  Only the states where the reference has a
+    single best action are counted, weighted by the number of visits to each state if they are provided.
+    '''
+    best = numpy.max(Q_reference, axis=-1, keepdims=True)
+    decisive = numpy.sum(Q_reference == best, axis=-1) == 1
+
+    agree = numpy.argmax(Q, axis=-1) == numpy.argmax(Q_reference, axis=-1)
+    weights = decisive.astype(numpy.float64) if visits is None else decisive * visits
+
+    return numpy.sum(agree * weights) / numpy.sum(weights)
+
+
+# Decision of the RL Agent in a state: the response, the reported confidence and the mean of the reaction times
+RL_DECISION_DTYPE = numpy.dtype([('response', numpy.int8), ('confidence', numpy.float64), ('rt_mu', numpy.float64)])
+
+
+def get_entropies_from_pdfs(pdfs):
+    '''
+    Same as entropy_from_pdf, for every pdf along the last axis at once.
+    '''
+    pdfs = pdfs + numpy.abs(numpy.min(pdfs, axis=-1, keepdims=True))
+    p = pdfs / numpy.sum(pdfs, axis=-1, keepdims=True)
+    p[ p==0 ] += 0.000001
+    return -numpy.sum(p * numpy.log2(p), axis=-1)
+
+
+def build_rl_decision_table(Q, mask_infeasible=True):
+    '''
+    Precomputes what rl_agent_meta_cognitive decides for every (resources_left, trial_no, severity) state of the Q table:
+    an array of RL_DECISION_DTYPE with the response, the confidence and the mean reaction time (rt_mu) of each state.
+
+    mask_infeasible: the options above resources_left are set to 0.00001 first, as the live RL Agent does (pygameMediator).
+    Q itself (possibly a read-only memory-mapped array) is not modified.
+    '''
+    options = numpy.array(Q, dtype=numpy.float64)
+    if mask_infeasible:
+        infeasible = numpy.arange(options.shape[-1])[None,:] > numpy.arange(options.shape[0])[:,None]
+        options[numpy.broadcast_to(infeasible[:,None,None,:], options.shape)] = 0.00001
+
+    # Min entropy from a univalue distribution (0), and max entropy from a uniform distribution (3.55....)
+    m_entropy = numpy.zeros((options.shape[-1],),)
+    m_entropy[0] = 1
+    m_entropy = entropy_from_pdf(m_entropy)
+    M_entropy = entropy_from_pdf(numpy.ones((options.shape[-1],),))
+
+    confidence = (1./(m_entropy-M_entropy)) * (get_entropies_from_pdfs(options) - M_entropy)
+
+    table = numpy.empty(options.shape[:-1], dtype=RL_DECISION_DTYPE)
+    table['response'] = numpy.argmax(options, axis=-1)
+    table['confidence'] = confidence
+    table['rt_mu'] = numpy.trunc((confidence * (-2) + 1) * 10)
+    return table
+
+
+def get_rl_agent_decision(decision_table, resources_left, trial_no, severity, response_timeout):
+    '''
+    Same as rl_agent_meta_cognitive, looked up in a table of build_rl_decision_table: only the reaction times are drawn.
+    '''
+    decision = decision_table[int(resources_left), int(trial_no), int(severity)]
+
+    rt_hold = numpy.random.normal(decision['rt_mu'], 3, 1)[0]
+    rt_release = rt_hold + numpy.random.normal(decision['rt_mu'], 1, 1)[0]
+
+    rt_hold = numpy.clip( rt_hold, 0, response_timeout/1000.0)
+    rt_release = numpy.clip( rt_release, 0, response_timeout/1000.0)
+
+    return int(decision['response']), float(decision['confidence']), rt_hold, rt_release
+
+
 def convert_globalseq_to_seqs(sequence_map,seqin360):
     rsp = []
     offset = 0
@@ -211,20 +292,19 @@ def get_normalised_performance_for_subject(sequence_length, response, initial_se
     All the lists must contain the same number of elements and all of them are a list of lists.
     '''
     
-    perfs = []
     seqlen = sequence_length[:num_seq]
-    rs = convert_globalseq_to_seqs( seqlen, response[:] )
     init_severities = initial_severities[:num_seq]
-    for seqindex, seq in enumerate(init_severities):
-        
-        # Adjust the responses assumming a more realistic approach on the decision.  This is a caveat to solve the problem of the broken causality in the replay when each player play by itself.
-        if (EnableRealisticAssumption): rs[seqindex] = adjust_unrealistic_responses_wrt_actual_resources( rs[seqindex] )
-        final_severities = get_array_of_sequence_severities_from_allocations( rs[seqindex], init_severities[seqindex] )
+    responses = response
 
-        perf, _, _ = calculate_normalised_final_severity_performance_metric( final_severities, init_severities[seqindex])
-        perfs.append( perf )
+    # Adjust the responses assumming a more realistic approach on the decision.  This is a caveat to solve the problem of the broken causality in the replay when each player play by itself.
+    if (EnableRealisticAssumption):
+        rs = convert_globalseq_to_seqs( seqlen, response[:] )
+        responses = numpy.concatenate( [ adjust_unrealistic_responses_wrt_actual_resources( rs[seqindex] ) for seqindex in range(len(init_severities)) ] )
 
-    return perfs 
+    # All the sequences are scored in one vectorised call.
+    perfs, *_ = score_sequences( responses, seqlen, numpy.concatenate( init_severities ) )
+
+    return perfs.tolist()
 
 def movingaverage(interval, window_size):
     window = numpy.ones( int(window_size)) / float(window_size)
@@ -485,52 +565,89 @@ def calibrate_confidence(confidences, uniform_pdf = False, a=0.5, b=0.5):
     return MappedConfidences
 
 
-def setup_human_reported_confidence( Allocations1, Confidences1, Allocations2, Confidences2, Allocations3, Confidences3):
-
-
-    lookuptable = {}
+def setup_human_reported_confidence( *AllocationsAndConfidences ):
+    '''
+    Builds the lookup table of the confidences reported by humans for each allocation (0 to 10), from any number of
+    (Allocations, Confidences) pairs of subject arrays, e.g.
 
-    for alloc in range(11):
-        lookuptable[alloc] = []
+        setup_human_reported_confidence( Allocations1, Confidences1, Allocations2, Confidences2, ... )
 
-    for i in range(len(Allocations1)):
-        allocation = Allocations1[i]
-        for alloc in range(11):
-            filtered_confidences = Confidences1[i][allocation==alloc]
-            lookuptable[alloc].extend( filtered_confidences )
+    and stores it into reported_confidence_lookuptable.pickle.
+    '''
+    global human_confidence_sampler
 
-    for i in range(len(Allocations2)):
-        allocation = Allocations2[i]
-        for alloc in range(11):
-            filtered_confidences = Confidences2[i][allocation==alloc]
-            lookuptable[alloc].extend( filtered_confidences )
+    assert len(AllocationsAndConfidences) % 2 == 0, 'Allocations and confidences must be provided in pairs.'
 
+    allocations = numpy.concatenate( [ numpy.ravel(allocation) for Allocations in AllocationsAndConfidences[0::2] for allocation in Allocations ] + [[]] )
+    confidences = numpy.concatenate( [ numpy.ravel(confidence) for Confidences in AllocationsAndConfidences[1::2] for confidence in Confidences ] + [[]] )
 
-    for i in range(len(Allocations3)):
-        allocation = Allocations3[i]
-        for alloc in range(11):
-            filtered_confidences = Confidences3[i][allocation==alloc]
-            lookuptable[alloc].extend( filtered_confidences )
+    # The confidences of each allocation, in the order of the subjects
+    lookuptable = { alloc: list( confidences[allocations==alloc] ) for alloc in range(11) }
 
     with open( os.path.join( INPUTS_PATH, 'reported_confidence_lookuptable.pickle'), 'wb') as output:
         pickle.dump( lookuptable, output )
+    human_confidence_sampler = None
+
+
 
+class HumanConfidenceSampler:
+    '''
+    Sampler of the confidences reported by humans for each allocation, from the lookup table of
+    setup_human_reported_confidence (every recorded confidence of an allocation being equally likely).
+
+    The confidences of all the allocations are held in a single array, so that a whole batch of allocations is sampled at
+    once, with a dedicated numpy.random.Generator.
+    '''
+    def __init__(self, lookuptable, seed=None):
+        lengths = [ len(lookuptable.get(alloc, [])) for alloc in range(11) ]
+        self.confidences = numpy.concatenate( [ numpy.asarray(lookuptable.get(alloc, []), dtype=numpy.float64) for alloc in range(11) ] )
+        self.offsets = numpy.concatenate( ([0], numpy.cumsum(lengths)[:-1]) )
+        self.lengths = numpy.asarray(lengths)
+        self.rng = numpy.random.default_rng(seed)
+
+    def sample(self, allocation, size=None):
+        '''
+        A reported confidence for each of the given allocations (a single one, or an array), or size of them.
+        '''
+        allocation = numpy.asarray(allocation, dtype=numpy.int64)
+        assert numpy.all(allocation >= 0) and numpy.all(allocation <= 10), 'Provided allocation is out of bounds.'
+        if size is not None:
+            allocation = numpy.broadcast_to(allocation, size)
+        assert numpy.all(self.lengths[allocation] > 0), 'No reported confidence for the provided allocation.'
+
+        index = self.rng.integers(self.lengths[allocation])
+        return self.confidences[self.offsets[allocation] + index]
+
+
+human_confidence_sampler = None
+
+
+def get_human_confidence_sampler():
+    '''
+    Returns the HumanConfidenceSampler of reported_confidence_lookuptable.pickle, loaded only once.
+    '''
+    global human_confidence_sampler
+
+    if human_confidence_sampler is None:
+        with open( os.path.join( INPUTS_PATH, 'reported_confidence_lookuptable.pickle'), 'rb') as input:
+            human_confidence_sampler = HumanConfidenceSampler(pickle.load(input))
+
+    return human_confidence_sampler
 
 
 def pick_human_reported_confidence(allocation):
 
     assert allocation >= 0 and allocation <= 10, 'Provided allocation is out of bounds.'
 
-    with open( os.path.join( INPUTS_PATH, 'reported_confidence_lookuptable.pickle'), 'rb') as input:
-        lookuptable = pickle.load(input)
-
-    return lookuptable[allocation][numpy.random.randint(len(lookuptable[allocation]))]
+    return get_human_confidence_sampler().sample(allocation)[()]
 
 
 def setup_humanise_reported_confidence(confidences):
+    global humanised_confidence_mapper
 
     with open( os.path.join( INPUTS_PATH, 'reported_confidences.pickle'), 'wb') as output:
         pickle.dump( confidences, output) 
+    humanised_confidence_mapper = None
 
     ecdf = ECDF( confidences )
 
@@ -545,21 +662,75 @@ def setup_humanise_reported_confidence(confidences):
 
     return MappedConfidences
 
-def humanise_this_reported_confidence(reported_confidence):
-    with open( os.path.join( INPUTS_PATH,'reported_confidences.pickle'),'rb') as input:
-        confidences = pickle.load(input)
 
-    confidences = numpy.concatenate( ([ confidences, reported_confidence]), axis=0 )
+class HumanisedConfidenceMapper:
+    '''
+    Precompiled version of the humanising transform of reported confidences (see humanise_this_reported_confidence):
+    the queried values are appended to the corpus of human reported confidences, mapped through the beta ppf of the
+    ECDF of the joint corpus, and rescaled to [0, 1].
 
-    ecdf = ECDF( confidences )
+    The corpus is kept sorted, so that the ECDF of a query is a binary search, and the beta ppf of every possible ECDF
+    value is tabulated once per query size.  The results are equal, to within 1 ulp, to mapping the query through a new
+    ECDF of the whole corpus (the ECDF values are not built the same way by every version of statsmodels).
+    '''
+    def __init__(self, confidences, a=5.0, b=1.8):
+        self.corpus = numpy.sort(numpy.asarray(confidences, dtype=numpy.float64).ravel())
+        self.a, self.b = a, b
+        self.tables = {}    # query size -> beta ppf of every ECDF value of the joint corpus
+
+    def get_table(self, query_size):
+        if query_size not in self.tables:
+            nobs = len(self.corpus) + query_size
+            # The ECDF values of statsmodels' ECDF, to within 1 ulp (0 below the smallest observation)
+            self.tables[query_size] = beta.ppf(numpy.r_[0., numpy.linspace(1./nobs, 1, nobs)], self.a, self.b)
+        return self.tables[query_size]
+
+    def add(self, confidences):
+        '''
+        Adds confidences to the corpus (e.g. as they are reported during a session).
+        '''
+        confidences = numpy.sort(numpy.asarray(confidences, dtype=numpy.float64).ravel())
+        self.corpus = numpy.insert(self.corpus, numpy.searchsorted(self.corpus, confidences), confidences)
+        self.tables = {}
+
+    def __call__(self, reported_confidence):
+        '''
+        Humanised confidences of the (1D array of) reported confidences, which are all appended to the corpus at once.
+        '''
+        reported_confidence = numpy.asarray(reported_confidence, dtype=numpy.float64)
+        table = self.get_table(len(reported_confidence))
+        query = numpy.sort(reported_confidence)
+
+        def count(values):
+            # Number of observations of the joint corpus <= values, i.e. the index of their ECDF value into the table
+            return numpy.searchsorted(self.corpus, values, 'right') + numpy.searchsorted(query, values, 'right')
+
+        I = table[count(reported_confidence)]
+        lowest = table[count(min(self.corpus[0], query[0]) if len(self.corpus) else query[0])]
+        highest = table[-1]
+
+        rescaled = (I - lowest )* (  (1.0 - 0.0) / ( highest - lowest) ) + 0.0
+        return numpy.clip( rescaled, 0.0, 1.0)
+
+
+humanised_confidence_mapper = None
+
+
+def get_humanised_confidence_mapper():
+    '''
+    Returns the HumanisedConfidenceMapper of reported_confidences.pickle, loaded only once.
+    '''
+    global humanised_confidence_mapper
 
-    MappedConfidences = beta.ppf( ecdf(confidences), 5.0, 1.8 )  
+    if humanised_confidence_mapper is None:
+        with open( os.path.join( INPUTS_PATH,'reported_confidences.pickle'),'rb') as input:
+            humanised_confidence_mapper = HumanisedConfidenceMapper(pickle.load(input))
 
-    I = MappedConfidences
-    rescaled = (I - numpy.min(I) )* (  (1.0 - 0.0) / ( numpy.max(I) - numpy.min(I)) ) + 0.0
-    MappedConfidences = numpy.clip( rescaled, 0.0, 1.0)
+    return humanised_confidence_mapper
 
-    return MappedConfidences[-reported_confidence.shape[0]:]
+
+def humanise_this_reported_confidence(reported_confidence):
+    return get_humanised_confidence_mapper()(reported_confidence)
 
 
 
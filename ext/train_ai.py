@@ -13,14 +13,15 @@ print(tf.__version__)
 
 
 from PES.src.Agent import *
+from PES.src.input_utils import get_experiment_inputs
 
 from PES import VERBOSE
 from PES import INPUTS_PATH
 from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
 
 initial_resources = tf.constant(AVAILABLE_RESOURCES_PER_SEQUENCE-9, dtype=tf.float32)
-trials_per_sequence = np.loadtxt(os.path.join( INPUTS_PATH,'sequence_lengths.csv'), delimiter=',')
-all_severities = np.loadtxt(os.path.join( INPUTS_PATH, 'initial_severity.csv'), delimiter=',')
+trials_per_sequence = get_experiment_inputs()['sequence_lengths.csv']
+all_severities = get_experiment_inputs()['initial_severity.csv']
 print(trials_per_sequence.shape, all_severities.shape, sum(trials_per_sequence))
 
 val_cities, count_cities = np.unique(trials_per_sequence, return_counts=True)
@@ -36,12 +37,10 @@ model = Model([4,4],10)
 optimizer = optimizers.Adam()
 
 games = 20000
+batch_size = 64
 
-log=[]
-damage = np.zeros((games,))
-for i in range(games):
-    severities = tf.constant(game(), dtype=tf.float32)
-    damage[i] = train_one_game(model, optimizer, severities, initial_resources, log=log)
+# Games are played batch_size at a time by a compiled training step (see train_games), instead of one by one with train_one_game.
+damage = train_games(model, optimizer, game, games, initial_resources, batch_size=batch_size)
 
 model.save()
 print('Model Saved in weights file.')
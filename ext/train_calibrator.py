@@ -0,0 +1,46 @@
+'''
+PES - Pandemic Experiment Scenario
+
+Train the Oracle Agent Calibrator (see oracle_agent_calibrator.py) on recorded sessions: the confidence it reports for the
+allocations of the NN-Agent is learnt to minimise the damage of the joint (confidence-weighted) allocations together with
+the recorded human allocations and confidences.
+
+    python3 -m PES.ext.train_calibrator PES_full_responses_001.txt [PES_full_responses_002.txt ...]
+'''
+import os,sys
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import optimizers
+print(tf.__version__)
+
+
+from PES.ext.oracle_agent_calibrator import *
+from PES.ext.tools import getSubjectsData
+from PES.src.input_utils import get_experiment_inputs
+
+from PES import INPUTS_PATH
+from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
+
+initial_resources = AVAILABLE_RESOURCES_PER_SEQUENCE-9
+trials_per_sequence = get_experiment_inputs().SequenceLengths
+
+# Sessions recorded in format_v2 (human allocations and confidences, together with the ones of the NN-Agent)
+InitialSeverities, Confidences, Allocations, PressEvents, ReleaseEvents, AgentAllocations, AgentConfidences = getSubjectsData( DataPath='.', SubjectFiles=sys.argv[1:], format_v2=True )
+
+# The human did not respond (-1) on some trials: nothing is allocated there, with no confidence.
+joint_games = [ pad_joint_games(trials_per_sequence, InitialSeverities, agent_allocations, np.clip(allocations, 0, None), np.clip(confidences, 0, None))
+                for allocations, confidences, agent_allocations in zip(Allocations, Confidences, AgentAllocations) ]
+joint_games = [ np.concatenate(values) for values in zip(*joint_games) ]
+print(f'{len(joint_games[0])} joint games from {len(sys.argv[1:])} sessions')
+
+calibrator = Calibrator([4,4],1)
+optimizer = optimizers.Adam()
+
+epochs = 200
+batch_size = 64
+
+# Games are played batch_size at a time by a compiled training step (see train_joint_games).
+damage = train_joint_games(calibrator, optimizer, joint_games, epochs, initial_resources, batch_size=batch_size)
+
+calibrator.save()
+print('Calibrator Saved in weights file.')
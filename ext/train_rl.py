@@ -28,33 +28,33 @@ from PES import AVAILABLE_RESOURCES_PER_SEQUENCE
 from PES.src.pygameMediator import convert_globalseq_to_seqs
 from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric
 from PES.src.exp_utils import get_updated_severity
+from PES.src.input_utils import get_experiment_inputs
 
 from PES.src import Agent
 from PES.src.Agent import agent_meta_cognitive
 from PES.src.Agent import adjust_response_decay, boltzmann_decay
 from PES.ext.pandemic import Pandemic, rl_agent_meta_cognitive, run_experiment, QLearning  
+from PES.ext.pandemic import VecPandemic, QLearningBatch, rl_confidences
 from PES.ext.tools import plot_confidences 
 from PES.ext.tools import humanise_this_reported_confidence 
+from PES.ext.tools import get_empirical_distributions
 
 if __name__=='__main__':
         
-    trials_per_sequence = numpy.loadtxt(os.path.join( INPUTS_PATH,'sequence_lengths.csv'), delimiter=',')
-    all_severities = numpy.loadtxt(os.path.join( INPUTS_PATH, 'initial_severity.csv'), delimiter=',')
+    trials_per_sequence = get_experiment_inputs()['sequence_lengths.csv']
+    all_severities = get_experiment_inputs()['initial_severity.csv']
     print(trials_per_sequence.shape, all_severities.shape, sum(trials_per_sequence))
 
     sevs = convert_globalseq_to_seqs(trials_per_sequence, all_severities)
 
-    val_cities, count_cities = numpy.unique(trials_per_sequence, return_counts=True)
-    val_severity, count_severity = numpy.unique(all_severities, return_counts=True)
-    number_cities_prob = numpy.asarray((val_cities, count_cities/len(trials_per_sequence))).T
-    severity_prob = numpy.asarray((val_severity, count_severity/len(all_severities))).T
+    number_cities_prob, severity_prob = get_empirical_distributions(trials_per_sequence, all_severities)
 
     env = Pandemic()
 
     def qf(env, state, seqid):
         return env.sample()
 
-    seqs1, perfs1 = run_experiment(env, qf, False, trials_per_sequence,sevs)
+    seqs1, perfs1, _ = run_experiment(env, qf, False, trials_per_sequence,sevs)
 
     plt.plot(seqs1)
     plt.xlabel('Trial')
@@ -78,14 +78,16 @@ if __name__=='__main__':
     env.severity_prob = severity_prob
     env.verbose = False
 
-    # Run Q-learning algorithm
-    if os.path.isfile(os.path.join( INPUTS_PATH,'q3.npy')):
-        Q = numpy.load(os.path.join( INPUTS_PATH,'q3.npy'))
-        rewards = numpy.load(os.path.join( INPUTS_PATH,'rewards.npy'))
-    else:
-        rewards, Q, confsrl = QLearning(env, 0.2, 0.9, 0.8, 0, 10000000) # 100000000
-        numpy.save( os.path.join( INPUTS_PATH,'q3.npy'), Q)
-        numpy.save( os.path.join( INPUTS_PATH,'rewards3.npy'), rewards)
+    # Run Q-learning algorithm (on a batch of episodes at once).  It resumes from q3.npy/rewards3.npy if they are there.
+    vec = VecPandemic(1024, auto_reset=True, record_evolution=False)
+    vec.number_cities_prob = number_cities_prob
+    vec.severity_prob = severity_prob
+
+    rewards, Q, visits = QLearningBatch(vec, 0.2, 0.9, 0.8, 0, 10000000, record_visits=True, # 100000000
+                                        q_file=os.path.join( INPUTS_PATH,'q3.npy'), rewards_file=os.path.join( INPUTS_PATH,'rewards3.npy'))
+
+    # Confidences are computed offline, for every visited state
+    confsrl = numpy.repeat( rl_confidences(Q).ravel(), visits.ravel() )
 
 
     # Plot Rewards
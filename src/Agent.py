@@ -8,10 +8,12 @@ This is a basic implementation of a MLP with sigmoid activation function that op
 * The seed is fixed through random package.
 * Game: this class generates random individual sequences of severities that follow the a specific distributions of length (i.e. number of cities) and severity values.
 * damage_city: This is the function that implements the dynamic of the pandemic, and it is used as the loss function to optimize. 
-* Reported Confidence: the remaining functions are used to add noise to the Agent's responses and to measure that noise as metacogntive information.
+* train_games: mini-batched training, where padded batches of games (Game.batch) are played at once by a compiled step (make_train_batch), with the damage in closed form (damage_cities).
+* Reported Confidence: the functions used to add noise to the Agent's responses and to measure that noise as metacogntive information are defined in agent_utils (re-exported here).
 """
 
 import os
+import time
 import numpy
 import pickle
 from pickle import dumps, loads
@@ -29,22 +31,11 @@ from .. import MAX_ALLOCATABLE_RESOURCES
 from PES.ext.tools import humanise_this_reported_confidence, pick_human_reported_confidence  
 
 
-AGENT_NOISE_VARIANCE = 2.0
-
-
-# I am fixing a random seed to the generation of random responses for the NN-Agent because otherwise we loose the ability of generate predictable responses.
-import random
-#seed = input()
-# Use me if you want to test with differnt neural networks
-#random.seed(seed)
-#random.seed(383831)
-
-randominstance = random.Random()
-
-def initseed(seed, noise):
-    randominstance.seed( seed )
-    global AGENT_NOISE_VARIANCE 
-    AGENT_NOISE_VARIANCE= noise 
+# The numpy-only helpers (responses, confidences, noise) live in agent_utils, and are re-exported from here.
+from .agent_utils import randominstance, initseed
+from .agent_utils import agent_meta_cognitive, adjust_response_decay, boltzmann_decay, get_random_confidence
+from .agent_utils import get_calibrated_reported_confidence, calibrated_metacognitive_response_from_agent
+from .agent_utils import NumpyModel, WEIGHTS_NPZ_FILE
 
 
 class Game():
@@ -63,6 +54,18 @@ class Game():
         severities = numpy.random.choice(self.severity_prob[:,0], size=(number_cities,), p=self.severity_prob[:,1])
         return severities
 
+    def batch(self, batch_size, max_cities=None):
+        '''
+        batch_size games at once, zero-padded to max_cities (by default, the largest number of cities) as a
+        (batch_size, max_cities) array of severities, together with the (batch_size, max_cities) mask of actual cities.
+        '''
+        if max_cities is None:
+            max_cities = int(numpy.max(self.number_cities_prob[:,0]))
+        number_cities = numpy.random.choice(self.number_cities_prob[:,0], size=(batch_size,), p=self.number_cities_prob[:,1]).astype(numpy.int64)
+        severities = numpy.random.choice(self.severity_prob[:,0], size=(batch_size, max_cities), p=self.severity_prob[:,1])
+        mask = numpy.arange(max_cities)[None,:] < number_cities[:,None]
+        return numpy.where(mask, severities, 0.).astype(numpy.float32), mask.astype(numpy.float32)
+
 
 
 
@@ -90,12 +93,22 @@ class Model():
             x = tf.math.sigmoid(W @ x + b)
         return tf.squeeze(x) * self.output_range
 
+    def batch_call(self, severity, city_number, resources_remaining):
+        # Same as __call__, for 1-D tensors of inputs (one entry per game); it is traced as part of make_train_batch.
+        x = tf.stack([severity, city_number, resources_remaining])
+        for W, b in zip(self.Ws, self.bs):
+            x = tf.math.sigmoid(W @ x + b)
+        return x[0] * self.output_range
+
     def save(self):
 
         with open( self.Weights_tfFile, 'wb') as f:
             pickle.dump(self.Ws, f)
             pickle.dump(self.bs, f)
 
+        # Keep the numpy-only copy of the weights (see agent_utils) in sync
+        NumpyModel.from_model(self).save(WEIGHTS_NPZ_FILE)
+
     def load(self):
         with open( self.Weights_tfFile ,'rb') as f:
             self.Ws = pickle.load(f)
@@ -123,6 +136,16 @@ def damage_city(severity, resources_allocated, time_damage_accumulates):
     damage = severity
     return damage
 
+def damage_cities(severity, resources_allocated, time_damage_accumulates):
+    # Same as damage_city, in closed form (see severity_utils) instead of a loop over time_damage_accumulates, so that
+    # it works elementwise on tensors of cities with different times. Allocations are never negative, so once the
+    # severity reaches 0 it stays there, and clipping only the final value is exact (gradients included).
+    α = RESPONSE_MULTIPLIER
+    β = SEVERITY_MULTIPLIER
+    growth = β ** time_damage_accumulates
+    accumulated_response = time_damage_accumulates if β == 1 else (growth - 1) / (β - 1)
+    return tf.math.maximum(0., severity * growth - resources_allocated * α * accumulated_response)
+
 def train_one_game(model, optimizer, severities, initial_resources, log=None):
 
     with tf.GradientTape(watch_accessed_variables=False) as tape:
@@ -148,106 +171,61 @@ def train_one_game(model, optimizer, severities, initial_resources, log=None):
 
     return damage
 
-def agent_meta_cognitive(action, output_value_range, resources_left, response_timeout):
-    # What are we doing here is mapping the distance to the boundary of each decision, as
-    # the level of confidence that the NN-Agent has on this decision.
-    # This can be done because the output of the NN-Agent is continuos.
-    centers = [r for r in range(output_value_range)]
-    center = numpy.asarray( centers, dtype=numpy.float32)
-
-    closer = center-action
-    closer = numpy.abs( closer )
-    closervalue = center[numpy.argmin(closer)]
-
-    action = numpy.clip(action, 1, resources_left)
-
-    f = lambda x: x * (-2) + 1
-
-    distance = numpy.clip(numpy.abs(closervalue-action),0,0.5)
-
-    confidence = f( distance )
-
-    response = int(round(action))
-
-    mu, sigma = int(distance * 10), 3
-
-    rt_hold = numpy.random.normal(mu, sigma, 1)[0]
-    rt_release = rt_hold + numpy.random.normal(mu, 1, 1)[0]
-
-    rt_hold = numpy.clip( rt_hold, 0, response_timeout/1000.0)
-    rt_release = numpy.clip( rt_release, 0, response_timeout/1000.0)
-
-    return response, confidence, rt_hold, rt_release
-
-def adjust_response_decay( resp, decay, resources_left):
-    
-    rand = numpy.random.random(1)
-
-    COIN_FLIPPING       = 1
-    GAUSSIAN_VARIANCE   = 2
-    NON_HUMANISED       = 3
-
-    modality = GAUSSIAN_VARIANCE 
-
-    if (modality == COIN_FLIPPING):
-        if (rand > decay):
-            resp = randominstance.randrange(0,MAX_ALLOCATABLE_RESOURCES+1)
-            resp = numpy.clip( resp, 0, resources_left)
-
-    if (modality == GAUSSIAN_VARIANCE):
-        variance = 1.0-decay
-        variance = int(variance*AGENT_NOISE_VARIANCE)
-        #if (variance>1):
-        delta = randominstance.gauss(resp, variance)
-        resp = numpy.clip( delta, 0, min(resources_left, MAX_ALLOCATABLE_RESOURCES))
-        #else:
-            # 0 is a valid response (delegate response)
-        #    delta = randominstance.uniform(-1,1+1)
-        #    resp = numpy.clip( resp+delta, 0, min(resources_left, MAX_ALLOCATABLE_RESOURCES))
-    
-    return resp 
-
-def boltzmann_decay( global_seq_no ):
-    # 75 and 4.0 here are parameters that push the shape of the boltzmann decay (as function of temperature, the sequence number in this case).
-    return numpy.exp( ( -75.0) / (4.0 * global_seq_no ) )
-
-def get_random_confidence(value):
-    return (randominstance.randrange(value)+1 )/10.0
-
-
-def get_calibrated_reported_confidence( right_response, noisy_response):
-    distance = numpy.clip( numpy.abs( right_response - noisy_response),0,MAX_ALLOCATABLE_RESOURCES)
-    dist = distance
-    distance = -distance
-    confidence = (distance - (-(3.0))) / (3.0)
-
-    confidence = numpy.clip( confidence, 0.0, 1.0 )
-
-    return confidence, dist
-
-
-
-
-def calibrated_metacognitive_response_from_agent(g_seq_no, right_response, resources_left):
-    decay = boltzmann_decay( g_seq_no )
-    noisy_response = adjust_response_decay( right_response, decay, resources_left)
-
-    confidence = get_calibrated_reported_confidence( right_response, noisy_response)
-
-    resp = noisy_response
-    
-    if (numpy.abs( noisy_response - right_response ) >3):
-        resp = right_response - 3
-        resp = numpy.clip( resp, 0, resources_left)
-
-    if (resp == 0):
-        confidence = -1.0
-
-    resp = round(resp)
-
-    return confidence, resp 
-
 
 
+def get_batch_damage(model, severities, mask, initial_resources):
+    '''
+    Total damage of each game of a padded batch (see Game.batch), played city by city as in train_one_game.
+    '''
+    number_cities = tf.reduce_sum(mask, axis=1)
+    resources_remaining = tf.fill(tf.shape(number_cities), initial_resources)
+    damage = tf.zeros_like(number_cities)
+    for k in range(severities.shape[1]):
+        city_number = tf.fill(tf.shape(number_cities), float(k + 1))
+        resources_allocated = model.batch_call(severities[:,k], city_number, resources_remaining)
+        # padded cities receive no resources and do no damage
+        resources_effectively_allocated = tf.math.minimum(resources_allocated, resources_remaining) * mask[:,k]
+        time_damage_accumulates = number_cities + 1 - city_number
+        damage = damage + mask[:,k] * damage_cities(severities[:,k], resources_effectively_allocated, time_damage_accumulates)
+        resources_remaining = resources_remaining - resources_effectively_allocated
+    return damage
 
+def make_train_batch(model, optimizer, max_cities):
+    '''
+    Compiled (tf.function) training step on a padded batch of games of max_cities: one gradient step on the mean
+    damage of the batch. Returns the damage of each game.
+    '''
+    @tf.function(input_signature=[tf.TensorSpec([None, max_cities], tf.float32), tf.TensorSpec([None, max_cities], tf.float32), tf.TensorSpec([], tf.float32)])
+    def train_batch(severities, mask, initial_resources):
+        with tf.GradientTape(watch_accessed_variables=False) as tape:
+            tape.watch(model.trainable_variables)
+            damage = get_batch_damage(model, severities, mask, initial_resources)
+            loss = tf.reduce_mean(damage)
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        return damage
+
+    return train_batch
+
+def train_games(model, optimizer, game, games, initial_resources, batch_size=64, report_every=10.0):
+    '''
+    Trains the model on games sampled from game (a Game), batch_size games per gradient step, instead of one game per
+    step as train_one_game. Throughput (games/sec) is reported every report_every seconds.
+
+    Returns the damage of each game played.
+    '''
+    max_cities = int(numpy.max(game.number_cities_prob[:,0]))
+    train_batch = make_train_batch(model, optimizer, max_cities)
+    initial_resources = tf.constant(initial_resources, dtype=tf.float32)
+
+    damage = numpy.zeros((games,))
+    start = last_report = time.time()
+    for i in range(0, games, batch_size):
+        severities, mask = game.batch(min(batch_size, games - i), max_cities)
+        damage[i:i+len(mask)] = train_batch(tf.constant(severities), tf.constant(mask), initial_resources).numpy()
+
+        if time.time() - last_report >= report_every or i + batch_size >= games:
+            last_report = time.time()
+            print('Game {} Average Damage: {:.4f} ({:.0f} games/sec)'.format(i+len(mask), numpy.mean(damage[max(0, i+len(mask)-1000):i+len(mask)]), (i+len(mask)) / (last_report - start)))
 
+    return damage
@@ -0,0 +1,290 @@
+"""
+PES - Pandemic Experiment Scenario
+
+NumPy-only inference for the NN-Agent (see Agent.Model), plus the agent's response / confidence helpers, none of which
+require TensorFlow. This allows AI (and humanised-AI) players to run without importing TensorFlow at all.
+
+The network is a small sigmoid MLP ( [severity, city_number, resources_remaining] -> hidden layers -> 1 ), whose
+weights are trained with TensorFlow (see ext/train_ai.py) and pickled into 'weights.tf'. Here they are read once into
+plain numpy arrays, which are also exported to (and preferably imported from) 'weights.npz'.
+
+Functions defined here:
+ • adjust_response_decay
+ • agent_meta_cognitive
+ • as_numpy_model
+ • boltzmann_decay
+ • calibrated_metacognitive_response_from_agent
+ • get_agent_model
+ • get_calibrated_reported_confidence
+ • get_random_confidence
+ • initseed
+ • load_tf_weights
+
+Classes defined here:
+ • NumpyModel
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import os
+import numpy
+import pickle
+import random
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .. import INPUTS_PATH
+from .. import MAX_ALLOCATABLE_RESOURCES
+
+
+# -----------------------
+# module-global variables
+# -----------------------
+
+WEIGHTS_TF_FILE  = os.path.join( INPUTS_PATH, 'weights.tf'  )
+WEIGHTS_NPZ_FILE = os.path.join( INPUTS_PATH, 'weights.npz' )
+
+AGENT_NOISE_VARIANCE = 2.0
+
+AgentModels = {}   # ( hidden layer sizes, output range ) -> NumpyModel, see get_agent_model
+
+
+# I am fixing a random seed to the generation of random responses for the NN-Agent because otherwise we loose the ability of generate predictable responses.
+randominstance = random.Random()
+
+
+
+####################
+### Module classes
+####################
+
+class NumpyModel():
+    """
+    NumPy twin of Agent.Model: same weights (float32), same forward pass, no TensorFlow. Inputs can be scalars or arrays
+    (broadcast against each other), in which case all of them are evaluated at once.
+    """
+
+    def __init__( self, Ws, bs, output_range ):
+        self.Ws           = [ numpy.asarray( W, dtype = numpy.float32 ) for W in Ws ]
+        self.bs           = [ numpy.asarray( b, dtype = numpy.float32 ) for b in bs ]
+        self.output_range = numpy.float32( output_range )
+
+
+    def __call__( self, severity, city_number, resources_remaining ):
+        Inputs = numpy.broadcast_arrays( *[ numpy.asarray( v, dtype = numpy.float32 ) for v in ( severity, city_number, resources_remaining ) ] )
+        x      = numpy.stack( Inputs ).reshape( 3, -1 )
+
+        for W, b in zip( self.Ws, self.bs ):
+            x = 1 / (1 + numpy.exp( -(W @ x + b) ))
+
+      # A (numpy) scalar for scalar inputs, as Agent.Model
+        return (x[ 0 ] * self.output_range).reshape( Inputs[ 0 ].shape )[ () ]
+
+
+    @classmethod
+    def from_model( cls, model ):
+        """
+        Copies the (current) weights of an Agent.Model.
+        """
+        return cls( [ numpy.asarray( W ) for W in model.Ws ], [ numpy.asarray( b ) for b in model.bs ], numpy.asarray( model.output_range ) )
+
+
+    @classmethod
+    def load( cls, Filename = WEIGHTS_NPZ_FILE ):
+        with numpy.load( Filename ) as Weights:
+            NumLayers = sum( Key.startswith( 'W' ) for Key in Weights.files )
+            return cls( [ Weights[ f'W{i}' ] for i in range( NumLayers ) ], [ Weights[ f'b{i}' ] for i in range( NumLayers ) ], Weights[ 'output_range' ] )
+
+
+    def save( self, Filename = WEIGHTS_NPZ_FILE ):
+        Weights = { f'W{i}': W for i, W in enumerate( self.Ws ) }
+        Weights.update( { f'b{i}': b for i, b in enumerate( self.bs ) } )
+        numpy.savez( Filename, output_range = self.output_range, **Weights )
+
+
+
+####################
+### Module functions
+####################
+
+def load_tf_weights( Filename = WEIGHTS_TF_FILE ):
+    """
+    Reads the weights pickled by Agent.Model.save (lists of tf.Variables) as plain numpy arrays, without TensorFlow: the
+    pickled variables are rebuilt directly from their stored initial values.
+    """
+
+    class WeightsUnpickler( pickle.Unpickler ):
+        def find_class( self, module, name ):
+            if not module.startswith( 'tensorflow' ):   return super().find_class( module, name )
+            if name == 'as_dtype'                   :   return numpy.dtype
+            return lambda *args, initial_value, dtype = None, **kwargs: numpy.asarray( initial_value, dtype = dtype )
+
+    with open( Filename, 'rb' ) as f:
+        Unpickler = WeightsUnpickler( f )
+        Ws        = Unpickler.load()
+        bs        = Unpickler.load()
+
+
+    return Ws, bs
+
+
+
+
+def get_agent_model( hidden_layers_sizes = ( 4, 4 ), output_range = 10 ):
+    """
+    Returns the NN-Agent as a NumpyModel, loaded only once. Weights are imported from WEIGHTS_NPZ_FILE, unless
+    WEIGHTS_TF_FILE is newer (i.e. the agent was retrained), in which case they are read from it and re-exported.
+    """
+
+    Key = ( tuple( hidden_layers_sizes ), output_range )
+
+    if Key not in AgentModels:
+        if os.path.isfile( WEIGHTS_NPZ_FILE ) and ( not os.path.isfile( WEIGHTS_TF_FILE ) or os.path.getmtime( WEIGHTS_NPZ_FILE ) >= os.path.getmtime( WEIGHTS_TF_FILE ) ):
+            Model = NumpyModel.load( WEIGHTS_NPZ_FILE )
+        else:
+            Model = NumpyModel( *load_tf_weights( WEIGHTS_TF_FILE ), output_range )
+            Model.save( WEIGHTS_NPZ_FILE )
+
+        assert [ W.shape[ 0 ] for W in Model.Ws ] == list( hidden_layers_sizes ) + [ 1 ], "The stored weights do not match the requested network architecture"
+
+        AgentModels[ Key ] = Model
+
+
+    return AgentModels[ Key ]
+
+
+
+
+def as_numpy_model( model ):
+    """
+    Returns model itself if it is already a NumpyModel, or a NumpyModel copy of an Agent.Model.
+    """
+
+    return model if isinstance( model, NumpyModel ) else NumpyModel.from_model( model )
+
+
+
+
+def initseed(seed, noise):
+    randominstance.seed( seed )
+    global AGENT_NOISE_VARIANCE
+    AGENT_NOISE_VARIANCE= noise
+
+
+
+
+def agent_meta_cognitive(action, output_value_range, resources_left, response_timeout):
+    # What are we doing here is mapping the distance to the boundary of each decision, as
+    # the level of confidence that the NN-Agent has on this decision.
+    # This can be done because the output of the NN-Agent is continuos.
+    centers = [r for r in range(output_value_range)]
+    center = numpy.asarray( centers, dtype=numpy.float32)
+
+    closer = center-action
+    closer = numpy.abs( closer )
+    closervalue = center[numpy.argmin(closer)]
+
+    action = numpy.clip(action, 1, resources_left)
+
+    f = lambda x: x * (-2) + 1
+
+    distance = numpy.clip(numpy.abs(closervalue-action),0,0.5)
+
+    confidence = f( distance )
+
+    response = int(round(action))
+
+    mu, sigma = int(distance * 10), 3
+
+    rt_hold = numpy.random.normal(mu, sigma, 1)[0]
+    rt_release = rt_hold + numpy.random.normal(mu, 1, 1)[0]
+
+    rt_hold = numpy.clip( rt_hold, 0, response_timeout/1000.0)
+    rt_release = numpy.clip( rt_release, 0, response_timeout/1000.0)
+
+    return response, confidence, rt_hold, rt_release
+
+
+
+
+def adjust_response_decay( resp, decay, resources_left):
+
+    rand = numpy.random.random(1)
+
+    COIN_FLIPPING       = 1
+    GAUSSIAN_VARIANCE   = 2
+    NON_HUMANISED       = 3
+
+    modality = GAUSSIAN_VARIANCE
+
+    if (modality == COIN_FLIPPING):
+        if (rand > decay):
+            resp = randominstance.randrange(0,MAX_ALLOCATABLE_RESOURCES+1)
+            resp = numpy.clip( resp, 0, resources_left)
+
+    if (modality == GAUSSIAN_VARIANCE):
+        variance = 1.0-decay
+        variance = int(variance*AGENT_NOISE_VARIANCE)
+        #if (variance>1):
+        delta = randominstance.gauss(resp, variance)
+        resp = numpy.clip( delta, 0, min(resources_left, MAX_ALLOCATABLE_RESOURCES))
+        #else:
+            # 0 is a valid response (delegate response)
+        #    delta = randominstance.uniform(-1,1+1)
+        #    resp = numpy.clip( resp+delta, 0, min(resources_left, MAX_ALLOCATABLE_RESOURCES))
+
+    return resp
+
+
+
+
+def boltzmann_decay( global_seq_no ):
+    # 75 and 4.0 here are parameters that push the shape of the boltzmann decay (as function of temperature, the sequence number in this case).
+    return numpy.exp( ( -75.0) / (4.0 * global_seq_no ) )
+
+
+
+
+def get_random_confidence(value):
+    return (randominstance.randrange(value)+1 )/10.0
+
+
+
+
+def get_calibrated_reported_confidence( right_response, noisy_response):
+    distance = numpy.clip( numpy.abs( right_response - noisy_response),0,MAX_ALLOCATABLE_RESOURCES)
+    dist = distance
+    distance = -distance
+    confidence = (distance - (-(3.0))) / (3.0)
+
+    confidence = numpy.clip( confidence, 0.0, 1.0 )
+
+    return confidence, dist
+
+
+
+
+def calibrated_metacognitive_response_from_agent(g_seq_no, right_response, resources_left):
+    decay = boltzmann_decay( g_seq_no )
+    noisy_response = adjust_response_decay( right_response, decay, resources_left)
+
+    confidence = get_calibrated_reported_confidence( right_response, noisy_response)
+
+    resp = noisy_response
+
+    if (numpy.abs( noisy_response - right_response ) >3):
+        resp = right_response - 3
+        resp = numpy.clip( resp, 0, resources_left)
+
+    if (resp == 0):
+        confidence = -1.0
+
+    resp = round(resp)
+
+    return confidence, resp
@@ -9,6 +9,8 @@ Functions defined here:
  • get_confidence_weighted_mean
  • get_fuzzy_weighted_mean
  • get_valid_responses_and_confidences_for_single_trial_over_all_subjects
+ • hamacher_product
+ • normalise_rows
 """
 
 
@@ -75,54 +77,88 @@ def get_confidence_weighted_mean( ConfidencesPerSubject, AllocationsPerSubject )
 
 
 
+def hamacher_product( a, b ):
+    """
+    Hamacher product t-norm, a·b / (a + b - a·b), defined as 0 when a = b = 0.
+    """
+
+    Denominator = a + b - a * b
+
+
+    return numpy.divide( a * b, Denominator, out = numpy.zeros( numpy.broadcast( a, b ).shape ), where = Denominator != 0 )
+
+
+
+
+# t-norms accepted (by name) as the And operator of get_fuzzy_weighted_mean
+TNORMS = { 'product'    : numpy.multiply,
+           'minimum'    : numpy.minimum,
+           'lukasiewicz': lambda a,b: numpy.maximum( a + b - 1, 0 ),
+           'hamacher'   : hamacher_product
+         }
+
+
+
+
 def get_fuzzy_weighted_mean( ConfidencesPerSubject, ShapleyPerSubject, MMAPerSubject, AllocationsPerSubject,
-                             And = lambda a,b: a * b,
+                             And = 'product',
                              Or  = lambda a,b: a + b - a * b  ):
     """
     Note: MMA = Measure of Metacognitive Accuracy
+
+    At every trial, the confidences, Shapley values and MMAs of the subjects with a valid confidence (i.e. not -1) are
+    each normalised to sum to one (or to be uniform, if they sum to zero), combined with the And t-norm (a name in TNORMS,
+    or any element-wise function of two arrays), and normalised again, to weight the mean of their allocations. Trials
+    with no valid confidence get 0.
+
+    All the channels are stacked into ( trials × subjects ) arrays once, and the trials are processed in groups with the
+    same number of valid subjects, so that every sum runs over exactly the same values, in the same order, as when each
+    trial is processed on its own.
     """
 
-    NumTrials = len( ConfidencesPerSubject[0] )
-    AggregatedAllocations = []
+    if isinstance( And, str ):   And = TNORMS[ And ]
 
-    for t in range( NumTrials ):
+    Confidences = numpy.asarray( ConfidencesPerSubject, dtype = numpy.float64 ).T
+    Valid       = Confidences != -1
+    Order       = numpy.argsort( ~Valid, axis = 1, kind = 'stable' )   # valid subjects first, in subject order
+    NumValid    = Valid.sum( axis = 1 )
 
-      # Filter out allocation-confidence pairs with invalid confidences
-        AllocationsAtTrial, ConfidencesAtTrial = get_valid_responses_and_confidences_for_single_trial_over_all_subjects( ConfidencesPerSubject, AllocationsPerSubject, t )
-        ShapleysAtTrial   , ConfidencesAtTrial = get_valid_responses_and_confidences_for_single_trial_over_all_subjects( ConfidencesPerSubject, ShapleyPerSubject, t )
-        MMAsAtTrial       , ConfidencesAtTrial = get_valid_responses_and_confidences_for_single_trial_over_all_subjects( ConfidencesPerSubject, MMAPerSubject, t )
+    Channels = [ numpy.take_along_axis( numpy.asarray( Values, dtype = numpy.float64 ).T, Order, axis = 1 )
+                 for Values in ( AllocationsPerSubject, ConfidencesPerSubject, ShapleyPerSubject, MMAPerSubject ) ]
 
-      # If no valid allocations / confidences exist at this trial
-        if AllocationsAtTrial.size == 0:   AggregatedAllocations.append( 0 )
-        else:
+    AggregatedAllocations = numpy.zeros( NumValid.shape )
 
-          # If overall confidence is 0, fallback to unweighted average to avoid division by zero errors.
-            MarginalConfidence = numpy.sum( ConfidencesAtTrial )
-            if MarginalConfidence == 0:   ConfidencesAtTrial = 1 / ConfidencesAtTrial.size
-            else                      :   ConfidencesAtTrial = ConfidencesAtTrial / MarginalConfidence
+    for k in numpy.unique( NumValid[ NumValid > 0 ] ):
+        Rows = NumValid == k
 
-            MarginalShapley = numpy.sum( ShapleysAtTrial )
-            if MarginalShapley == 0:   ShapleysAtTrial = 1 / ShapleysAtTrial.size
-            else                   :   ShapleysAtTrial = ShapleysAtTrial / MarginalShapley
+        AllocationsAtTrial, ConfidencesAtTrial, ShapleysAtTrial, MMAsAtTrial = ( numpy.ascontiguousarray( Channel[ Rows, : k ] ) for Channel in Channels )
 
-            MarginalMMA = numpy.sum( MMAsAtTrial )
-            if MarginalMMA == 0:   MMAsAtTrial = 1 / MMAsAtTrial.size
-            else               :   MMAsAtTrial = MMAsAtTrial / MarginalMMA
+      # If overall confidence (Shapley, MMA) is 0, fallback to unweighted average to avoid division by zero errors.
+        ConfidencesAtTrial, ShapleysAtTrial, MMAsAtTrial = ( normalise_rows( Weights ) for Weights in ( ConfidencesAtTrial, ShapleysAtTrial, MMAsAtTrial ) )
 
-            FuzzyWeights = numpy.ones_like( AllocationsAtTrial )
-            FuzzyWeights = And( FuzzyWeights, ShapleysAtTrial)
-            FuzzyWeights = And( FuzzyWeights, MMAsAtTrial )
-            FuzzyWeights = And( FuzzyWeights, ConfidencesAtTrial )
+        FuzzyWeights = numpy.ones_like( AllocationsAtTrial )
+        FuzzyWeights = And( FuzzyWeights, ShapleysAtTrial )
+        FuzzyWeights = And( FuzzyWeights, MMAsAtTrial )
+        FuzzyWeights = And( FuzzyWeights, ConfidencesAtTrial )
 
-            MarginalFuzzyWeights = numpy.sum( FuzzyWeights )
-            if MarginalFuzzyWeights == 0:   FuzzyWeights = 1 / FuzzyWeights.size
-            else                        :   FuzzyWeights = FuzzyWeights / MarginalFuzzyWeights
+      # Calculate weighted average
+        AggregatedAllocations[ Rows ] = numpy.sum( normalise_rows( FuzzyWeights ) * AllocationsAtTrial, axis = 1 )
 
-          # Calculate weighted average
-            FuzzyWeightedMean = numpy.sum( FuzzyWeights * AllocationsAtTrial )
-            AggregatedAllocations.append( FuzzyWeightedMean )
 
-    return numpy.round( numpy.array( AggregatedAllocations ) )
+    return numpy.round( AggregatedAllocations )
+
+
+
+
+def normalise_rows( Weights ):
+    """
+    Divides each row of Weights by its sum, or sets it to a uniform 1 / len( row ) if its sum is zero.
+    """
+
+    Marginals = numpy.sum( Weights, axis = 1 )
+
+
+    return numpy.where( ( Marginals == 0 )[ :, None ], 1 / Weights.shape[ 1 ], Weights / numpy.where( Marginals == 0, 1, Marginals )[ :, None ] )
 
 
 def debias( Allocations, Reference, method = 'subtract mean' ):
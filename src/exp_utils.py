@@ -4,6 +4,7 @@ PES - Pandemic Experiment Scenario
 Utility functions used throughout experiment
  • calculate_normalised_final_severity_performance_metric
  • chain_ops
+ • compact_valid_trial_entries
  • confirm_biosemi_properly_initialised
  • create_random_subject_id
  • create_subject_id
@@ -14,11 +15,15 @@ Utility functions used throughout experiment
  • get_percent_deviation
  • get_sequence_severity_from_allocations
  • get_updated_severity
+ • get_weighted_means
+ • get_weighted_medians
+ • get_weighted_modes
  • next_seq_length
  • random_severity_generator
  • remind_biosemi_properly_finalised
  • rgb_from_severity
  • sampler
+ • stack_messages
 """
 
 
@@ -32,7 +37,6 @@ import numpy
 import matplotlib.backends.backend_agg as agg
 import matplotlib.pyplot as plt
 
-from statsmodels.stats.weightstats import DescrStatsW as WeightedStats
 
 
 # ----------------
@@ -58,6 +62,10 @@ from .. import RESPONSE_MULTIPLIER
 from .. import SEVERITY_MULTIPLIER
 from .. import SEQ_LENGTHS_FILE
 
+from .input_utils import get_experiment_inputs
+from .severity_utils import get_sequence_baselines
+from .severity_utils import get_sequence_final_severities
+
 
 # -----------------------
 # module-global variables
@@ -73,14 +81,16 @@ FeedbackShowIndividualPerformances = FEEDBACK_SHOW_INDIVIDUAL_PERFORMANCES
 ### General utility functions
 #############################
 
-def calculate_normalised_final_severity_performance_metric( SeveritiesFromSequence, InitialSequenceSeverities ):
+def calculate_normalised_final_severity_performance_metric( SeveritiesFromSequence, InitialSequenceSeverities, AbsoluteSequenceIndex = None ):
+    """
+    Normalised performance of a sequence: 1 for the best case (all MAX_ALLOCATABLE_RESOURCES) and 0 for the worst case
+    (all MIN_ALLOCATABLE_RESOURCES). The best and worst cases only depend on the sequence, and are looked up from the
+    baseline cache in severity_utils (by AbsoluteSequenceIndex if given, otherwise by the severities themselves).
+    """
 
-    FinalSequenceSeverity     = numpy.sum( SeveritiesFromSequence )
-    BestCaseAllocations       = numpy.full_like( SeveritiesFromSequence, MAX_ALLOCATABLE_RESOURCES )
-    WorstCaseAllocations      = numpy.full_like( SeveritiesFromSequence, MIN_ALLOCATABLE_RESOURCES )
-    BestCaseSequenceSeverity  = get_sequence_severity_from_allocations( BestCaseAllocations , InitialSequenceSeverities )
-    WorstCaseSequenceSeverity = get_sequence_severity_from_allocations( WorstCaseAllocations, InitialSequenceSeverities )
-    Performance               = (WorstCaseSequenceSeverity - FinalSequenceSeverity) / (WorstCaseSequenceSeverity - BestCaseSequenceSeverity )
+    FinalSequenceSeverity                               = numpy.sum( SeveritiesFromSequence )
+    WorstCaseSequenceSeverity, BestCaseSequenceSeverity = get_sequence_baselines( InitialSequenceSeverities, AbsoluteSequenceIndex )
+    Performance                                         = (WorstCaseSequenceSeverity - FinalSequenceSeverity) / (WorstCaseSequenceSeverity - BestCaseSequenceSeverity )
 
     return Performance, WorstCaseSequenceSeverity, BestCaseSequenceSeverity
 
@@ -106,21 +116,12 @@ def get_array_of_sequence_severities_from_allocations( Allocations, InitialSever
     1.54(5) | 3.12(6)| 8.8 (4)
 
     Each individual severity is clipped to max(0, value)
-    '''
-
-    NumTrialsInSequence = len( InitialSeverities )
-    severities          = []
-    resources           = []
-
-    for Trial in range( NumTrialsInSequence ):
-
-        severities . append( InitialSeverities [ Trial ] )
-        resources  . append( Allocations       [ Trial ] )
-
-        severities = get_updated_severity( len( severities ), resources, severities )
 
+    The whole sequence is evaluated in one go by the closed-form engine in severity_utils, which gives the same numbers
+    as stepping every city through get_updated_severity once per trial.
+    '''
 
-    return severities.copy()
+    return get_sequence_final_severities( Allocations, InitialSeverities ).tolist()
 
 
 
@@ -532,102 +533,220 @@ def next_seq_length(index, seq_per_block):
     """
     Based on current global seq index (0-359), retrieves the next 'seq_per_block' sequence lengths
     """
-    SequenceLengthsCsv = os.path.join( INPUTS_PATH, SEQ_LENGTHS_FILE )
-    s = numpy.loadtxt( SequenceLengthsCsv, delimiter=',' )
+    s = get_experiment_inputs()[ SEQ_LENGTHS_FILE ]
     sequence = s[ index : index + seq_per_block ]
     return sequence
 
 
 
 
-def get_confidence_weighted_mean( all_messages, first_severity, AbsoluteSequenceIndex, AbsoluteTrialCount ):
+def stack_messages( all_messages ):
+    """
+    Stacks the messages of all the players (each a trials × fields array: response, confidence, ...) into a single
+    ( players × trials × fields ) array.
+    """
+    return numpy.asarray( all_messages, dtype = numpy.float64 )
 
-    # First let's get the aggregated allocations
-    NumTrials = numpy.shape( all_messages )[1]
-    AggregatedAllocations = []
 
-    for t in range( NumTrials ):
 
-      # Get only valid responses and confidences for this trial
-        TrialResponses   = numpy.array( all_messages )[ :, t, 0 ]
-        TrialConfidences = numpy.array( all_messages )[ :, t, 1 ]
 
-        OriginalTrialResponses = TrialResponses.copy()
+def compact_valid_trial_entries( Responses, Confidences ):
+    """
+    Given the ( players × trials ) responses and confidences of a sequence, returns, for every trial (rows), the
+    responses and confidences of the players with a valid confidence (i.e. not -1) first, in player order, followed by
+    zeros; together with the number of valid players at each trial.
+    """
 
-        TrialResponses   = TrialResponses   [ TrialConfidences != -1 ]
-        TrialConfidences = TrialConfidences [ TrialConfidences != -1 ]
+    Responses   = numpy.asarray( Responses  , dtype = numpy.float64 ).T
+    Confidences = numpy.asarray( Confidences, dtype = numpy.float64 ).T
+    Valid       = Confidences != -1
+    Order       = numpy.argsort( ~Valid, axis = 1, kind = 'stable' )
 
-      # TrialConfidences cannot be negative (-1 are already excluded)
-      # So if the sum is zero, this means that all the values are zero
-      # so they cannot be used as weight in numpy.average !
-      # Let's all weigth one, and count in the same way (Ticket:085)
-        if (numpy.sum( TrialConfidences ) == 0):
-            TrialConfidences[:] = 1.0
+    CompactResponses   = numpy.take_along_axis( numpy.where( Valid, Responses  , 0.0 ), Order, axis = 1 )
+    CompactConfidences = numpy.take_along_axis( numpy.where( Valid, Confidences, 0.0 ), Order, axis = 1 )
 
-      # In the unlikely case of no valid confidences, set the allocations to the plain mean of all participants
-        if numpy.size( TrialConfidences ) == 0:
-            ConfidenceWeightedMean = numpy.mean( OriginalTrialResponses )
-        else:
-            ConfidenceWeightedMean = numpy.average( TrialResponses, weights = TrialConfidences )
 
-        AggregatedAllocations.append( ConfidenceWeightedMean )
+    return CompactResponses, CompactConfidences, Valid.sum( axis = 1 )
 
-    AggregatedAllocations = numpy.array( AggregatedAllocations )
-    AggregatedAllocations = numpy.round( AggregatedAllocations )
 
-  # Second, let's get the theoretical severity for that aggregate
-    SeverityFromAggregate = get_array_of_sequence_severities_from_allocations( AggregatedAllocations, first_severity[ AbsoluteTrialCount - NumTrials : AbsoluteTrialCount ].copy() )
 
 
-    return AggregatedAllocations, SeverityFromAggregate
+def get_weighted_means( Responses, Confidences ):
+    """
+    Confidence-weighted mean of the ( players × trials ) responses at every trial, ignoring the players with an invalid
+    (-1) confidence. If all the valid confidences of a trial are zero, they all weigh one (Ticket:085); if there is no valid
+    confidence, it is the plain mean of all the responses.
 
+    Trials are processed in groups with the same number of valid players, so that every sum runs over exactly the same
+    values, in the same order, as numpy.average over the valid entries of that trial (i.e. results are bitwise identical).
+    """
 
+    CompactResponses, CompactConfidences, NumValid = compact_valid_trial_entries( Responses, Confidences )
+    Means = numpy.empty( NumValid.shape )
 
+    for k in numpy.unique( NumValid ):
+        Rows = NumValid == k
 
-def get_confidence_weighted_mode():   raise NotImplementedError
+        if k == 0:
+            Means[ Rows ] = numpy.mean( numpy.asarray( Responses, dtype = numpy.float64 ).T[ Rows ], axis = 1 )
+            continue
 
+        TrialResponses   = numpy.ascontiguousarray( CompactResponses  [ Rows, : k ] )
+        TrialConfidences = numpy.ascontiguousarray( CompactConfidences[ Rows, : k ] )
 
+      # Ticket:085
+        TrialConfidences[ numpy.sum( TrialConfidences, axis = 1 ) == 0 ] = 1.0
 
+        Means[ Rows ] = numpy.sum( TrialResponses * TrialConfidences, axis = 1 ) / numpy.sum( TrialConfidences, axis = 1 )
 
-def get_confidence_weighted_median( all_messages, first_severity,  AbsoluteSequenceIndex, AbsoluteTrialCount ):
 
-  # First let's get the aggregated allocations
-    NumTrials = numpy.shape( all_messages )[1]
-    AggregatedAllocations = []
+    return Means
+
+
+
+
+def get_weighted_medians( Responses, Confidences ):
+    """
+    Confidence-weighted median of the ( players × trials ) responses at every trial, ignoring the players with an invalid
+    (-1) confidence; if there is no valid confidence, it is the plain median of all the responses.
+
+    Reproduces the (SAS) definition of DescrStatsW.quantile: the weights of tied responses are summed (with the same
+    compensated summation as its pandas groupby); if half the total weight falls exactly (1e-10) on a cumulative weight,
+    the median is the mean of that response and the next one.
+    """
+
+    CompactResponses, CompactConfidences, NumValid = compact_valid_trial_entries( Responses, Confidences )
+    NumTrials, NumPlayers = CompactResponses.shape
+    Medians = numpy.empty( (NumTrials,) )
 
-    for t in range( NumTrials ):
+    if NumPlayers == 0:   return Medians
 
-      # Get only valid responses and confidences for this trial
-        TrialResponses   = numpy.array( all_messages )[ :, t, 0 ]
-        TrialConfidences = numpy.array( all_messages )[ :, t, 1 ]
+  # Sort the valid responses of every trial (stably, so that tied weights are summed in player order)
+    Columns = numpy.arange( NumPlayers )
+    Valid   = Columns[ None, : ] < NumValid[ :, None ]
+    Order   = numpy.argsort( numpy.where( Valid, CompactResponses, numpy.inf ), axis = 1, kind = 'stable' )
+    Values  = numpy.take_along_axis( CompactResponses  , Order, axis = 1 )
+    Weights = numpy.take_along_axis( CompactConfidences, Order, axis = 1 )
 
-        OriginalTrialResponses = TrialResponses.copy()
+  # Sum the weights of tied responses (Kahan summation, as pandas' group sums)
+    NewGroup       = numpy.ones( Values.shape, dtype = bool )
+    NewGroup[ :, 1: ] = Values[ :, 1: ] != Values[ :, :-1 ]
+    NewGroup      &= Valid
+    GroupIndex     = numpy.cumsum( NewGroup, axis = 1 ) - 1
+    NumGroups      = NewGroup.sum( axis = 1 )
+    GroupValues    = numpy.zeros( Values.shape )
+    GroupWeights   = numpy.zeros( Values.shape )
+    Rows           = numpy.arange( NumTrials )
+    Sum            = numpy.zeros( (NumTrials,) )
+    Compensation   = numpy.zeros( (NumTrials,) )
 
-        TrialResponses   = TrialResponses   [ TrialConfidences != -1 ]
-        TrialConfidences = TrialConfidences [ TrialConfidences != -1 ]
+    for j in range( NumPlayers ):
+        Sum          = numpy.where( NewGroup[ :, j ], 0.0, Sum          )
+        Compensation = numpy.where( NewGroup[ :, j ], 0.0, Compensation )
 
-      # In the unlikely case of no valid confidences, set the allocations to the plain median of all participants
-        if numpy.size( TrialConfidences ) == 0:
-            ConfidenceWeightedMedian = numpy.median( OriginalTrialResponses )
-        else:
+        y            = Weights[ :, j ] - Compensation
+        t            = Sum + y
+        Compensation = numpy.where( Valid[ :, j ], t - Sum - y, Compensation )
+        Sum          = numpy.where( Valid[ :, j ], t, Sum )
 
-          # If only one valid response, duplicate for weightedmedian to work
-            if numpy.size( TrialResponses ) == 1:
-                TrialResponses   = numpy.repeat( TrialResponses  , 2 )
-                TrialConfidences = numpy.repeat( TrialConfidences, 2 )
+        GroupValues [ Rows[ Valid[ :, j ] ], GroupIndex[ Valid[ :, j ], j ] ] = Values[ Valid[ :, j ], j ]
+        GroupWeights[ Rows[ Valid[ :, j ] ], GroupIndex[ Valid[ :, j ], j ] ] = Sum[ Valid[ :, j ] ]
 
-            ConfidenceWeightedMedian = WeightedStats(
-                data    = TrialResponses,
-                weights = TrialConfidences
-            ).quantile(
-                probs = [0.5],
-                return_pandas = False
-            )[0]
+  # First group whose cumulative weight reaches half the total weight (i.e. numpy.searchsorted)
+    HasGroups         = NumGroups > 0
+    CumulativeWeights = numpy.cumsum( GroupWeights, axis = 1 )
+    Targets           = 0.5 * CumulativeWeights[ Rows, numpy.maximum( NumGroups - 1, 0 ) ]
+    Index             = numpy.sum( ( CumulativeWeights < Targets[ :, None ] ) & ( Columns[ None, : ] < NumGroups[ :, None ] ), axis = 1 )
+    Index             = numpy.minimum( Index, numpy.maximum( NumGroups - 1, 0 ) )
 
-        AggregatedAllocations.append( ConfidenceWeightedMedian )
+    ExactHit    = ( numpy.abs( Targets - CumulativeWeights[ Rows, Index ] ) < 1e-10 ) & ( Index < NumGroups - 1 )
+    NextIndex   = numpy.minimum( Index + 1, NumPlayers - 1 )
+
+    Medians[ HasGroups ] = numpy.where( ExactHit, ( GroupValues[ Rows, Index ] + GroupValues[ Rows, NextIndex ] ) / 2, GroupValues[ Rows, Index ] )[ HasGroups ]
+
+  # In the unlikely case of no valid confidences, the plain median of all participants
+    if not numpy.all( HasGroups ):
+        Medians[ ~HasGroups ] = numpy.median( numpy.asarray( Responses, dtype = numpy.float64 ).T[ ~HasGroups ], axis = 1 )
+
+
+    return Medians
+
+
+
+
+def get_weighted_modes( Responses, Confidences ):
+    """
+    Confidence-weighted mode of the ( players × trials ) responses at every trial, ignoring the players with an invalid
+    (-1) confidence: the allocation in [MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES] with the largest total
+    confidence, the smallest such allocation winning ties. If all the valid confidences of a trial are zero, they all
+    weigh one (Ticket:085); if there is no valid confidence, it is the plain mode of all the responses.
+
+    Responses are rounded to the nearest allocation, and clipped to the allocation domain. All trials are counted at once,
+    by a single bincount over ( trial, allocation ) bins.
+    """
+
+    Responses   = numpy.asarray( Responses  , dtype = numpy.float64 ).T
+    Confidences = numpy.asarray( Confidences, dtype = numpy.float64 ).T
+    Valid       = Confidences != -1
+    AnyValid    = Valid.any( axis = 1 )
+    Weights     = numpy.where( Valid, Confidences, 0.0 )
+    NumTrials   = Responses.shape[ 0 ]
+    NumBins     = MAX_ALLOCATABLE_RESOURCES - MIN_ALLOCATABLE_RESOURCES + 1
+
+  # Ticket:085 (all valid confidences are zero), or no valid confidence at all: every response weighs one ...
+    Weights[ numpy.sum( Weights, axis = 1 ) == 0 ] = 1.0
+
+  # ... but invalid responses are still ignored whenever there is a valid one
+    Weights[ AnyValid[ :, None ] & ~Valid ] = 0.0
+
+    Bins    = numpy.clip( numpy.round( Responses ), MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES ).astype( numpy.int64 ) - MIN_ALLOCATABLE_RESOURCES
+    Bins   += numpy.arange( NumTrials )[ :, None ] * NumBins
+    Counts  = numpy.bincount( Bins.ravel(), weights = Weights.ravel(), minlength = NumTrials * NumBins ).reshape( NumTrials, NumBins )
+
+
+    return ( numpy.argmax( Counts, axis = 1 ) + MIN_ALLOCATABLE_RESOURCES ).astype( numpy.float64 )   # argmax: first (smallest) of tied allocations
+
+
+
+
+def get_confidence_weighted_mean( all_messages, first_severity, AbsoluteSequenceIndex, AbsoluteTrialCount ):
+
+  # First let's get the aggregated allocations (see get_weighted_means)
+    Messages              = stack_messages( all_messages )
+    NumTrials             = Messages.shape[ 1 ]
+    AggregatedAllocations = numpy.round( get_weighted_means( Messages[ :, :, 0 ], Messages[ :, :, 1 ] ) )
+
+  # Second, let's get the theoretical severity for that aggregate
+    SeverityFromAggregate = get_array_of_sequence_severities_from_allocations( AggregatedAllocations, first_severity[ AbsoluteTrialCount - NumTrials : AbsoluteTrialCount ].copy() )
+
+
+    return AggregatedAllocations, SeverityFromAggregate
+
+
+
+
+def get_confidence_weighted_mode( all_messages, first_severity, AbsoluteSequenceIndex, AbsoluteTrialCount ):
+
+  # First let's get the aggregated allocations (see get_weighted_modes)
+    Messages              = stack_messages( all_messages )
+    NumTrials             = Messages.shape[ 1 ]
+    AggregatedAllocations = get_weighted_modes( Messages[ :, :, 0 ], Messages[ :, :, 1 ] )
+
+  # Second, let's get the theoretical severity for that aggregate
+    SeverityFromAggregate = get_array_of_sequence_severities_from_allocations( AggregatedAllocations, first_severity[ AbsoluteTrialCount - NumTrials : AbsoluteTrialCount ].copy() )
+
+
+    return AggregatedAllocations, SeverityFromAggregate
+
+
+
+
+def get_confidence_weighted_median( all_messages, first_severity,  AbsoluteSequenceIndex, AbsoluteTrialCount ):
 
-    AggregatedAllocations = numpy.array( AggregatedAllocations )
-    AggregatedAllocations = numpy.round( AggregatedAllocations )
+  # First let's get the aggregated allocations (see get_weighted_medians)
+    Messages              = stack_messages( all_messages )
+    NumTrials             = Messages.shape[ 1 ]
+    AggregatedAllocations = numpy.round( get_weighted_medians( Messages[ :, :, 0 ], Messages[ :, :, 1 ] ) )
 
   # Second, let's get the theoretical severity for that aggregate
     SeverityFromAggregate = get_array_of_sequence_severities_from_allocations( AggregatedAllocations, first_severity[ AbsoluteTrialCount - NumTrials : AbsoluteTrialCount ].copy() )
@@ -0,0 +1,271 @@
+"""
+PES - Pandemic Experiment Scenario
+
+Central access to the input files of the experiment (INPUTS_PATH), each of which is read from disk only once per process.
+
+CSV files are parsed once and converted into a binary cache (one '.npy' file per input, in the INPUTS_CACHE_DIRNAME
+subdirectory of INPUTS_PATH), which is memory-mapped on later runs. A JSON manifest records the modification time, size
+and hash of every source file, and the shape and dtype of its cached array: a cached array is only used while it is
+still valid for its source file (a source file that was touched but not changed keeps its cache). '.npy' inputs are
+memory-mapped directly (except for object arrays, which cannot be).
+
+The fixed schedule of the experiment (SEQ_LENGTHS_FILE and INITIAL_SEVERITY_FILE) is also exposed through derived views:
+per-sequence severity slices, cumulative trial offsets, and maps between absolute trial indices and ( sequence, trial )
+positions.
+
+Functions defined here:
+ • get_experiment_inputs
+ • hash_file
+
+Classes defined here:
+ • ExperimentInputs
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import os
+import json
+import hashlib
+import numpy
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .. import INITIAL_SEVERITY_FILE
+from .. import INPUTS_PATH
+from .. import SEQ_LENGTHS_FILE
+
+
+# -----------------------
+# module-global variables
+# -----------------------
+
+INPUTS_CACHE_DIRNAME = '.inputs_cache'
+INPUTS_MANIFEST_FILE = 'manifest.json'
+
+Inputs = None   # ExperimentInputs for INPUTS_PATH, see get_experiment_inputs
+
+
+
+####################
+### Module classes
+####################
+
+class ExperimentInputs():
+    """
+    The input files of InputsPath, loaded on first use: inputs[ 'sequence_lengths' ] (or inputs[ 'sequence_lengths.csv' ])
+    returns the (read-only) array of that file.
+    """
+
+    def __init__( self, InputsPath = INPUTS_PATH, CachePath = None, SequenceLengthsFile = SEQ_LENGTHS_FILE, InitialSeverityFile = INITIAL_SEVERITY_FILE ):
+        self.InputsPath          = InputsPath
+        self.CachePath           = os.path.join( InputsPath, INPUTS_CACHE_DIRNAME ) if CachePath is None else CachePath
+        self.SequenceLengthsFile = SequenceLengthsFile
+        self.InitialSeverityFile = InitialSeverityFile
+
+        self.Arrays = {}   # Filename -> array
+        self.Views  = {}   # Name -> derived view of the schedule
+
+        try:
+            with open( os.path.join( self.CachePath, INPUTS_MANIFEST_FILE ) ) as f:   self.Manifest = json.load( f )
+        except ( OSError, ValueError ):
+            self.Manifest = {}
+
+
+    def __getitem__( self, Name ):
+        Filename = self.get_filename( Name )
+
+        if Filename not in self.Arrays:
+            self.Arrays[ Filename ] = self.load( Filename )
+
+
+        return self.Arrays[ Filename ]
+
+
+    def __contains__( self, Name ):
+        try                     :   self.get_filename( Name ); return True
+        except FileNotFoundError:   return False
+
+
+    def keys( self ):
+        return sorted( Filename for Filename in os.listdir( self.InputsPath ) if Filename.endswith( ( '.csv', '.npy' ) ) )
+
+
+    def get_filename( self, Name ):
+        for Filename in ( Name, Name + '.csv', Name + '.npy' ):
+            if Filename.endswith( ( '.csv', '.npy' ) ) and os.path.isfile( os.path.join( self.InputsPath, Filename ) ):   return Filename
+
+        raise FileNotFoundError( f"No input file '{Name}' found in {self.InputsPath}" )
+
+
+    def load( self, Filename ):
+        Source = os.path.join( self.InputsPath, Filename )
+
+        if Filename.endswith( '.npy' ):
+            try              :   return numpy.load( Source, mmap_mode = 'r' )
+            except ValueError:   return numpy.load( Source, allow_pickle = True )   # object arrays cannot be memory-mapped
+
+        CacheFile = os.path.join( self.CachePath, Filename + '.npy' )
+        Stat      = os.stat( Source )
+        Entry     = self.Manifest.get( Filename )
+
+        if Entry is not None and os.path.isfile( CacheFile ):
+            Unchanged = ( Entry[ 'mtime_ns' ], Entry[ 'size' ] ) == ( Stat.st_mtime_ns, Stat.st_size )
+
+            if Unchanged or ( Entry[ 'size' ] == Stat.st_size and Entry[ 'sha1' ] == hash_file( Source ) ):
+                Values = numpy.load( CacheFile, mmap_mode = 'r' )
+
+                if list( Values.shape ) == Entry[ 'shape' ] and str( Values.dtype ) == Entry[ 'dtype' ]:
+                    if not Unchanged:   self.update_manifest( Filename, dict( Entry, mtime_ns = Stat.st_mtime_ns ) )
+                    return Values
+
+
+        Values = numpy.loadtxt( Source, delimiter = ',' )
+        Values.setflags( write = False )
+
+        try:
+            os.makedirs( self.CachePath, exist_ok = True )
+
+            TemporaryFile = f'{CacheFile}.{os.getpid()}.tmp'
+            with open( TemporaryFile, 'wb' ) as f:   numpy.save( f, Values )
+            os.replace( TemporaryFile, CacheFile )
+
+            self.update_manifest( Filename, dict( mtime_ns = Stat.st_mtime_ns, size = Stat.st_size, sha1 = hash_file( Source ), shape = list( Values.shape ), dtype = str( Values.dtype ) ) )
+
+        except OSError:
+            pass   # e.g. a read-only INPUTS_PATH: the file will simply be parsed again by the next process
+
+
+        return Values
+
+
+    def update_manifest( self, Filename, Entry ):
+        self.Manifest[ Filename ] = Entry
+
+        ManifestFile  = os.path.join( self.CachePath, INPUTS_MANIFEST_FILE )
+        TemporaryFile = f'{ManifestFile}.{os.getpid()}.tmp'
+
+        with open( TemporaryFile, 'w' ) as f:   json.dump( self.Manifest, f, indent = 1, sort_keys = True )
+        os.replace( TemporaryFile, ManifestFile )
+
+
+    def get_view( self, Name, Function ):
+        if Name not in self.Views:
+            View = Function()
+            View.setflags( write = False )
+            self.Views[ Name ] = View
+
+
+        return self.Views[ Name ]
+
+
+  # ---------------------------------------
+  # Derived views of the experiment schedule
+  # ---------------------------------------
+
+    @property
+    def SequenceLengths( self ):
+        """
+        Number of trials of every sequence (int64).
+        """
+        return self.get_view( 'SequenceLengths', lambda: numpy.atleast_1d( self[ self.SequenceLengthsFile ] ).astype( numpy.int64 ) )
+
+
+    @property
+    def InitialSeverities( self ):
+        """
+        Initial severity of every trial of the session.
+        """
+        return self[ self.InitialSeverityFile ]
+
+
+    @property
+    def SequenceOffsets( self ):
+        """
+        Cumulative trial offsets: sequence i spans the absolute trials SequenceOffsets[ i ] : SequenceOffsets[ i + 1 ].
+        """
+        return self.get_view( 'SequenceOffsets', lambda: numpy.concatenate( ( [ 0 ], numpy.cumsum( self.SequenceLengths ) ) ) )
+
+
+    @property
+    def TrialIndexMap( self ):
+        """
+        ( sequences × longest sequence ) map of absolute trial indices, -1 beyond the end of each sequence.
+        """
+        def build():
+            Positions = numpy.arange( self.SequenceLengths.max( initial = 0 ) )
+            return numpy.where( Positions[ None, : ] < self.SequenceLengths[ :, None ], self.SequenceOffsets[ :-1, None ] + Positions[ None, : ], -1 )
+
+        return self.get_view( 'TrialIndexMap', build )
+
+
+    @property
+    def TrialSequence( self ):
+        """
+        Absolute sequence index of every trial.
+        """
+        return self.get_view( 'TrialSequence', lambda: numpy.repeat( numpy.arange( len( self.SequenceLengths ) ), self.SequenceLengths ) )
+
+
+    @property
+    def TrialPosition( self ):
+        """
+        Position of every trial within its sequence.
+        """
+        return self.get_view( 'TrialPosition', lambda: numpy.arange( self.SequenceOffsets[ -1 ] ) - self.SequenceOffsets[ self.TrialSequence ] )
+
+
+    def get_sequence_severities( self, AbsoluteSequenceIndex, InitialSeverities = None ):
+        """
+        Slice of the initial severities (by default, those of INITIAL_SEVERITY_FILE) of the given sequence.
+        """
+
+        if InitialSeverities is None:   InitialSeverities = self.InitialSeverities
+
+
+        return InitialSeverities[ self.SequenceOffsets[ AbsoluteSequenceIndex ] : self.SequenceOffsets[ AbsoluteSequenceIndex + 1 ] ]
+
+
+    def pad( self, Values ):
+        """
+        Session-like values (one per trial) as a ( sequences × longest sequence ) array, following TrialIndexMap. Entries
+        beyond the end of each sequence, or beyond the end of Values, are 0.
+        """
+
+        Values = numpy.asarray( Values )
+        Map    = self.TrialIndexMap
+        Valid  = ( Map >= 0 ) & ( Map < len( Values ) )
+
+
+        return numpy.where( Valid, Values[ numpy.where( Valid, Map, 0 ) ] if len( Values ) else 0, 0 )
+
+
+
+####################
+### Module functions
+####################
+
+def hash_file( Filename ):
+    with open( Filename, 'rb' ) as f:
+        return hashlib.sha1( f.read() ).hexdigest()
+
+
+
+
+def get_experiment_inputs():
+    """
+    Returns the ExperimentInputs of INPUTS_PATH, created only once per process.
+    """
+
+    global Inputs
+
+    if Inputs is None:
+        Inputs = ExperimentInputs()
+
+
+    return Inputs
@@ -0,0 +1,133 @@
+"""
+PES - Pandemic Experiment Scenario
+
+Contains functions relating to the calculation of each player's Measure of Metacognitive Accuracy (MMA), for use as the
+MMAPerSubject input of allocationCalculator.get_fuzzy_weighted_mean.
+
+The MMA of a player is their type-2 AUROC: the probability that their confidence on a trial where their allocation was
+correct is higher than on a trial where it was not (ties counting half), 0.5 being chance level. An allocation is
+correct if it is within MMA_ERROR_TOLERANCE resources of the analytical optimum (see analysis/analyticalAgent) for that
+city.
+
+The estimator is streaming: every player only keeps a histogram of their (binned) confidences on correct and on
+incorrect trials, so that each trial is a constant-time update, and the MMA is read off the histograms without
+rescanning the session.
+
+Functions defined here:
+ • get_mma_per_trial
+ • get_optimal_allocations
+
+Classes defined here:
+ • MMAEstimator
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import numpy
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .. import MAX_ALLOCATABLE_RESOURCES
+from .. import MIN_ALLOCATABLE_RESOURCES
+from .. import PANDEMIC_PARAMETER
+
+from ..analysis.analyticalAgent import get_analytical_solution_for_given_lengths
+
+
+# -----------------------
+# module-global variables
+# -----------------------
+
+MMA_CONFIDENCE_BINS = 21   # i.e. confidence steps of 0.05 (see CONFIDENCE_UPDATE_AMOUNT)
+MMA_ERROR_TOLERANCE = 1    # Largest absolute difference from the optimal allocation still counted as correct
+
+
+
+####################
+### Module classes
+####################
+
+class MMAEstimator():
+    """
+    Streaming type-2 AUROC of NumPlayers players. Per trial, update takes the allocation and confidence of every player,
+    and the optimal allocation for that city; trials with an invalid (-1) confidence are ignored. get_mma returns the
+    current MMA of every player, which is 0.5 until a player has both correct and incorrect trials.
+    """
+
+    def __init__( self, NumPlayers, NumBins = MMA_CONFIDENCE_BINS, ErrorTolerance = MMA_ERROR_TOLERANCE ):
+        self.NumBins        = NumBins
+        self.ErrorTolerance = ErrorTolerance
+        self.Counts         = numpy.zeros( (NumPlayers, 2, NumBins) )   # players × ( incorrect, correct ) × confidence bins
+
+
+    def update( self, Responses, Confidences, OptimalAllocation ):
+        Responses   = numpy.asarray( Responses  , dtype = numpy.float64 )
+        Confidences = numpy.asarray( Confidences, dtype = numpy.float64 )
+        Valid       = Confidences != -1
+
+        Correct = numpy.abs( Responses - OptimalAllocation ) <= self.ErrorTolerance
+        Bins    = numpy.clip( numpy.round( Confidences * (self.NumBins - 1) ), 0, self.NumBins - 1 ).astype( numpy.int64 )
+
+        self.Counts[ numpy.flatnonzero( Valid ), Correct[ Valid ].astype( numpy.int64 ), Bins[ Valid ] ] += 1
+
+
+        return self.get_mma()
+
+
+    def get_mma( self ):
+        Incorrect, Correct = self.Counts[ :, 0 ], self.Counts[ :, 1 ]
+
+        IncorrectBelow = numpy.cumsum( Incorrect, axis = 1 ) - Incorrect
+        Pairs          = Incorrect.sum( axis = 1 ) * Correct.sum( axis = 1 )
+        Concordant     = numpy.sum( Correct * (IncorrectBelow + 0.5 * Incorrect), axis = 1 )
+
+
+        return numpy.divide( Concordant, Pairs, out = numpy.full( Pairs.shape, 0.5 ), where = Pairs > 0 )
+
+
+
+####################
+### Module functions
+####################
+
+def get_optimal_allocations( InitialSeverities, StepsRemaining ):
+    """
+    Analytical optimal allocation for cities with the given initial severities and number of updates left until the end
+    of their sequence (i.e. len( sequence ) - position).
+    """
+
+    return get_analytical_solution_for_given_lengths( numpy.atleast_1d( numpy.asarray( InitialSeverities, dtype = numpy.float64 ) ),
+                                                      numpy.atleast_1d( numpy.asarray( StepsRemaining   , dtype = numpy.int64   ) ),
+                                                      PANDEMIC_PARAMETER, MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES )
+
+
+
+
+def get_mma_per_trial( Responses, Confidences, InitialSeverities, SequenceLengths, **kwargs ):
+    """
+    ( players × trials ) MMA of every player after each trial, given their ( players × trials ) allocations and
+    confidences over consecutive sequences of the given lengths (see MMAEstimator, which also accepts the keyword
+    arguments).
+    """
+
+    Responses       = numpy.asarray( Responses, dtype = numpy.float64 )
+    SequenceLengths = numpy.atleast_1d( numpy.asarray( SequenceLengths ).astype( numpy.int64 ) )
+    NumTrials       = SequenceLengths.sum()
+    StepsRemaining  = numpy.repeat( numpy.cumsum( SequenceLengths ), SequenceLengths ) - numpy.arange( NumTrials )
+
+    OptimalAllocations = get_optimal_allocations( numpy.asarray( InitialSeverities )[ : NumTrials ], StepsRemaining )
+
+    Estimator = MMAEstimator( len( Responses ), **kwargs )
+    MMAs      = numpy.empty( (len( Responses ), NumTrials) )
+
+    for t in range( NumTrials ):
+        MMAs[ :, t ] = Estimator.update( Responses[ :, t ], numpy.asarray( Confidences )[ :, t ], OptimalAllocations[ t ] )
+
+
+    return MMAs
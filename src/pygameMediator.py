@@ -16,6 +16,11 @@ Functions defined here:
  • get_age_from_user
  • get_gender_from_user
  • get_handedness_from_user
+ • get_entropy_bounds
+ • get_replay_store
+ • get_rl_decision_table
+ • get_rl_q_table
+ • get_trial_severity_index
  • get_user_input
  • gracefully_quit_pygame
  • hide_mouse_cursor
@@ -53,7 +58,6 @@ import numpy
 import os
 import pygame
 import sys
-import tensorflow as tf
 
 # ----------------
 # internal imports
@@ -83,7 +87,6 @@ from .. import RESPONSE_TIMEOUT
 from .. import TRUST_MAX
 from .. import VERBOSE
 from .. import WHITE, YELLOW, BLACK, DARK_RED, DARK_CYAN, DARK_GREEN, GREEN, RED, GRAY, LIGHTGRAY, LIGHTBLUE
-from .. import SEQ_LENGTHS_FILE
 from .. import SHOW_PYGAME_IF_NONHUMAN_PLAYER
 from .. import AGENT_NOISE_VARIANCE
 from .. import AGENT_WAIT 
@@ -91,9 +94,11 @@ from .. import AGENT_WAIT
 if PLAYER_TYPE == 'playback': from .. import PLAYBACK_ID
 
 from . import exp_utils
+from . import input_utils
 from . import log_utils
-from . import Agent
-from . Agent import agent_meta_cognitive, adjust_response_decay, boltzmann_decay, get_random_confidence 
+from . import agent_utils
+from . import replay_utils
+from . agent_utils import agent_meta_cognitive, adjust_response_decay, boltzmann_decay, get_random_confidence
 from . exp_utils import chain_ops
 from . import eventMarker
 from . eventMarker import evmrk
@@ -101,6 +106,7 @@ from .. import printinfo
 from .. import printcolor
 from .. ext.tools import pick_human_reported_confidence, humanise_this_reported_confidence 
 from .. ext.tools import convert_globalseq_to_seqs 
+from .. ext.tools import build_rl_decision_table, get_rl_agent_decision
 # -----------------------------------------------------------
 # module variables requiring initialisation before module use
 # -----------------------------------------------------------
@@ -108,6 +114,11 @@ from .. ext.tools import convert_globalseq_to_seqs
 screen                = None
 first_severity        = None
 number_of_trials      = None
+EntropyBounds         = {}     # Replicates -> (min, max) reference entropies, see get_entropy_bounds
+RLQTable              = None   # Read-only (memory-mapped) Q-Table of the RL-Agent, see get_rl_q_table
+RLDecisionTable       = None   # Precomputed decisions of the RL-Agent for every state, see get_rl_decision_table
+ReplaySessions        = None   # Recorded sessions of 'playback' players, see get_replay_store
+TrialSeverityIndex    = None   # ( first_severity, sequences x trials severity index ), see get_trial_severity_index
 
 
 # -------------------------
@@ -126,6 +137,11 @@ MedicImage_pgsurface = pygame.image.load( MedicImage_filename )
 MedicImage_pgsurface = pygame.transform.scale( MedicImage_pgsurface, (16, 16) )
 Avatar_pgsurfaces    = [ pygame.image.load( Filename ) for Filename in Avatar_filenames ]
 
+AGENT_CONFIDENCE_REPLICATES = 1000   # Default number of noisy model evaluations behind the NN-Agent's confidence
+
+RL_Q_TABLE_FILE        = os.path.join( INPUTS_PATH, 'q.npy' )
+RL_DECISION_TABLE_FILE = os.path.join( INPUTS_PATH, input_utils.INPUTS_CACHE_DIRNAME, 'q_decisions.npy' )   # Derived from RL_Q_TABLE_FILE, hence kept with the other cached inputs
+
 FONT              = 'ubuntumono'   # previously: Arial
 BACKGROUND_COLOUR = GRAY
 
@@ -136,6 +152,21 @@ SHOW_PYGAME = PLAYER_TYPE == 'human' or SHOW_PYGAME_IF_NONHUMAN_PLAYER
 ### Module functions
 ####################
 
+def __getattr__( Name ):
+    """
+    The Agent module (needed to train the NN-Agent, and requiring TensorFlow) is only imported when it is first asked
+    for, e.g. by 'from PES.src.pygameMediator import Agent': inference runs on agent_utils, without TensorFlow.
+    """
+
+    if Name == 'Agent':
+        from . import Agent
+        return Agent
+
+    raise AttributeError( f"module {__name__!r} has no attribute {Name!r}" )
+
+
+
+
 def set_window_title( Title ):
     if SHOW_PYGAME:   pygame.display.set_caption( Title )
     else          :   pass
@@ -814,49 +845,19 @@ def provide_replay_response(img,
     assert number_of_trials is not None
     assert isinstance( SubjectId, str ) and len( SubjectId ) >= 3
 
-    SequenceLengthsCsv = os.path.join( INPUTS_PATH, SEQ_LENGTHS_FILE)
-    sequence_length = numpy.loadtxt( SequenceLengthsCsv , delimiter=',')
-
-    Responses_filename = os.path.join(
-        OUTPUTS_PATH,
-        f'{OUTPUT_FILE_PREFIX}responses_{ SubjectId }.txt'
-    )
-
   # Verify playback file exists, otherwise gracefully abort.
     try:
-        temp = numpy.loadtxt( Responses_filename, delimiter=',', skiprows=1)
-
-    except OSError as E:
-
-        if E.args[0].endswith('not found.'):
-            log_utils.tee( f"{ANSI.RED}ERROR: No corresponding 'responses' file found for ID specified for playback! Aborting experiment ...{ANSI.RESET}" )
-            sys.exit(1)
-        else:
-            raise
-
-
-    n_trials =  int( sum( sum( number_of_trials ) ) )
-    stimuli = numpy.zeros((n_trials))                ## These are the initial stimulus, exactly.
-    response = numpy.zeros((n_trials))
-    reported_confidence = numpy.zeros( (n_trials))
-    hold_rts = numpy.zeros(( n_trials))
-    release_rts = numpy.zeros((n_trials))
+        Record = get_replay_store().get_trial( SubjectId, session_no, sequence_no, trial_no )
 
-    stimuli = temp[:,0]
-    response = temp[:, 1]
-    reported_confidence = numpy.clip(temp[:, 2], .0, 1.0)  ## 0-1 real
-    hold_rts = temp[:, 3]                               ## When they press the button ms
-    release_rts = temp[:, 4]                            ## When they release the button ms
+    except FileNotFoundError:
+        log_utils.tee( f"{ANSI.RED}ERROR: No corresponding 'responses' file found for ID specified for playback! Aborting experiment ...{ANSI.RESET}" )
+        sys.exit(1)
 
-    response_in_series = convert_globalseq_to_seqs(sequence_length, response)
-    reported_confidence_in_series = convert_globalseq_to_seqs(sequence_length, reported_confidence)
-    hold_rts_in_series = convert_globalseq_to_seqs(sequence_length, hold_rts)
-    release_rts_in_series = convert_globalseq_to_seqs(sequence_length, release_rts)
 
-    resp       = response_in_series            [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
-    rt_hold    = hold_rts_in_series            [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
-    rt_release = release_rts_in_series         [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
-    confidence = reported_confidence_in_series [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
+    resp       = Record[ 'response'   ]
+    rt_hold    = Record[ 'hold_rt'    ]                       ## When they press the button ms
+    rt_release = Record[ 'release_rt' ]                       ## When they release the button ms
+    confidence = numpy.clip( Record[ 'confidence' ], .0, 1.0 )  ## 0-1 real
 
     resp = numpy.clip(resp, 0, resources_left) 
 
@@ -889,17 +890,122 @@ def entropy(x, bins=None):
 
 
 
-def calculate_agent_response_and_confidence(model, city_severity, trial_no, resource_remaining):
-    repl = 1000
-    M_entropy = entropy(numpy.linspace(MIN_ALLOCATABLE_RESOURCES,MAX_ALLOCATABLE_RESOURCES, repl), bins=MAX_ALLOCATABLE_RESOURCES-MIN_ALLOCATABLE_RESOURCES+1)
-    m_entropy = entropy(numpy.ones((repl,)), bins=MAX_ALLOCATABLE_RESOURCES-MIN_ALLOCATABLE_RESOURCES+1)
-    allocated_resources = numpy.asarray([])
-    for i in range(0,repl):
-        r_remaining = resource_remaining + numpy.random.normal(MIN_ALLOCATABLE_RESOURCES,MAX_ALLOCATABLE_RESOURCES,1)[0]
-        c_severity = city_severity +  numpy.random.normal( 0,3,1)[0]
-        t_no = trial_no + numpy.random.normal(0,3,1)[0]
-        resp = model( tf.Variable(c_severity, dtype=tf.float32), tf.Variable(t_no, dtype=tf.float32), tf.Variable(r_remaining, dtype=tf.float32) )
-        allocated_resources = numpy.append( allocated_resources, resp.numpy())
+def get_entropy_bounds( Replicates = AGENT_CONFIDENCE_REPLICATES ):
+    """
+    Reference entropies (for a single-valued, and for a uniform set of responses) used to normalise the entropy of
+    Replicates responses into a confidence. These are constant for a given number of replicates, so they are cached.
+    """
+
+    if Replicates not in EntropyBounds:
+        Bins = MAX_ALLOCATABLE_RESOURCES - MIN_ALLOCATABLE_RESOURCES + 1
+        EntropyBounds[ Replicates ] = ( entropy( numpy.ones( (Replicates,) ), bins = Bins ),
+                                        entropy( numpy.linspace( MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES, Replicates ), bins = Bins ) )
+
+
+    return EntropyBounds[ Replicates ]
+
+
+
+
+def get_rl_q_table( Filename = RL_Q_TABLE_FILE ):
+    """
+    Returns the Q-Table of the RL-Agent, loaded only once per process. It is memory-mapped read-only, so that several
+    RL-Agents running on the same host share the same pages.
+    """
+
+    global RLQTable
+
+    if RLQTable is None:
+        RLQTable = numpy.load( Filename, mmap_mode = 'r' )
+
+
+    return RLQTable
+
+
+
+
+def get_replay_store():
+    """
+    Returns the store of recorded sessions replayed by 'playback' players (see replay_utils.ReplayStore), created only
+    once per process. Each recorded session (i.e. each PLAYBACK_ID) is loaded into it on first use.
+    """
+
+    global ReplaySessions
+
+    if ReplaySessions is None:
+        ReplaySessions = replay_utils.ReplayStore()
+
+
+    return ReplaySessions
+
+
+
+
+def get_rl_decision_table():
+    """
+    Returns the response, confidence and reaction time parameters of the RL-Agent for every state of its Q-Table (see
+    ext.tools.build_rl_decision_table), loaded only once per process (memory-mapped) from RL_DECISION_TABLE_FILE. The
+    table is (re)built from the Q-Table whenever RL_Q_TABLE_FILE is newer.
+    """
+
+    global RLDecisionTable
+
+    if RLDecisionTable is None:
+        if os.path.isfile( RL_DECISION_TABLE_FILE ) and os.path.getmtime( RL_DECISION_TABLE_FILE ) >= os.path.getmtime( RL_Q_TABLE_FILE ):
+            RLDecisionTable = numpy.load( RL_DECISION_TABLE_FILE, mmap_mode = 'r' )
+        else:
+            RLDecisionTable = build_rl_decision_table( get_rl_q_table() )
+
+          # Written to a temporary file first, as several RL-Agents may be doing the same
+            try:
+                os.makedirs( os.path.dirname( RL_DECISION_TABLE_FILE ), exist_ok = True )
+
+                TemporaryFile = f'{RL_DECISION_TABLE_FILE}.{os.getpid()}.tmp'
+                with open( TemporaryFile, 'wb' ) as f:   numpy.save( f, RLDecisionTable )
+                os.replace( TemporaryFile, RL_DECISION_TABLE_FILE )
+
+            except OSError:
+                pass   # e.g. a read-only INPUTS_PATH: the table will simply be built again by the next process
+
+
+    return RLDecisionTable
+
+
+
+
+def get_trial_severity_index():
+    """
+    Returns the (integer) severity of every trial of the session as a (sequences x trials) array, i.e. the severity index
+    into the Q-Table of the RL-Agent for each trial. It is computed only once for the current 'first_severity'.
+    """
+
+    global TrialSeverityIndex
+
+    if TrialSeverityIndex is None or TrialSeverityIndex[ 0 ] is not first_severity:
+      # Trials not covered by first_severity (if any) are left at 0
+        TrialSeverityIndex = ( first_severity, input_utils.get_experiment_inputs().pad( first_severity ).astype( numpy.int64 ) )
+
+
+    return TrialSeverityIndex[ 1 ]
+
+
+
+
+def calculate_agent_response_and_confidence(model, city_severity, trial_no, resource_remaining, Replicates = AGENT_CONFIDENCE_REPLICATES):
+    """
+    Feeds the NN-Agent with Replicates noisy versions of its inputs, all at once, and returns the mean response and the
+    confidence derived from the entropy of the responses. The perturbations are drawn in a single call, in the same order
+    as drawing them one replicate at a time (resources, severity, trial number).
+    """
+
+    m_entropy, M_entropy = get_entropy_bounds( Replicates )
+
+    Perturbations = numpy.random.normal( [ MIN_ALLOCATABLE_RESOURCES, 0, 0 ], [ MAX_ALLOCATABLE_RESOURCES, 3, 3 ], (Replicates, 3) )
+    r_remaining   = resource_remaining + Perturbations[ :, 0 ]
+    c_severity    = city_severity      + Perturbations[ :, 1 ]
+    t_no          = trial_no           + Perturbations[ :, 2 ]
+
+    allocated_resources = numpy.asarray( agent_utils.as_numpy_model( model )( c_severity, t_no, r_remaining ), dtype = numpy.float64 )
 
     resp = allocated_resources.mean()
     entrp = entropy(allocated_resources, bins=MAX_ALLOCATABLE_RESOURCES-MIN_ALLOCATABLE_RESOURCES+1)
@@ -916,7 +1022,7 @@ def calculate_agent_response_and_confidence_alternative(model, city_severity, tr
     t_no = trial_no
     c_severity = city_severity
 
-    action = model( tf.Variable(c_severity, dtype=tf.float32), tf.Variable(t_no, dtype=tf.float32), tf.Variable(r_remaining, dtype=tf.float32) )
+    action = agent_utils.as_numpy_model( model )( c_severity, t_no, r_remaining )
 
     response, confidence, rt_hold, rt_release = agent_meta_cognitive(action, MAX_ALLOCATABLE_RESOURCES+1, resource_remaining,RESPONSE_TIMEOUT)
 
@@ -932,7 +1038,6 @@ def rl_agent_meta_cognitive(options, resources_left, response_timeout):
         pdf = pdf + numpy.abs(numpy.min( pdf ))
         p =  pdf / numpy.sum(pdf)  # log(0)
         p[ p==0 ] += 0.000001
-        print( p )
         H = -numpy.dot( p, numpy.log2( p ) )
         return H
 
@@ -952,6 +1057,8 @@ def rl_agent_meta_cognitive(options, resources_left, response_timeout):
     o = [i for i in range(len(options))]
     o = numpy.asarray(o, dtype=numpy.float32)
 
+  # A copy, so that the caller's Q-Table row is not modified
+    options = numpy.array( options, dtype = numpy.float64 )
     options[o>resources_left] = 0.00001
 
     log_utils.tee( 'Agent Feasible Options:', options)
@@ -993,31 +1100,26 @@ def provide_rl_agent_response( img,
     assert first_severity is not None, \
            "The 'first_severity' module-global variable needs to be set by caller before calling this function"
 
-    Q = numpy.load(os.path.join( INPUTS_PATH,'q.npy'))
-    rewards = numpy.load(os.path.join( INPUTS_PATH,'rewards.npy'))
+  # The decisions for every state of the Q-Table are precomputed, and loaded only once (see get_rl_decision_table)
+    DecisionTable = get_rl_decision_table()
 
     if VERBOSE:
-        printinfo( "Reading preloaded Q-Table for RL-Agent" )
-
-    resources_remaining = tf.Variable(resources_left, dtype=tf.float32)
+        printinfo( "Reading precomputed decisions of the RL-Agent" )
 
     if VERBOSE:
         printinfo( 'Resources remaining...' )
-        printcolor( resources_remaining, ANSI.ORANGE )
+        printcolor( resources_left, ANSI.ORANGE )
         print()
 
-    SequenceLengthsCsv = os.path.join( INPUTS_PATH, SEQ_LENGTHS_FILE )
-    sequence_length = numpy.loadtxt( SequenceLengthsCsv , delimiter=',')
-    sevs = convert_globalseq_to_seqs(sequence_length, first_severity)
-
-    sever = sevs[ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
+    sever = get_trial_severity_index()[ session_no * NUM_SEQUENCES + sequence_no, trial_no ]
     city_number = trial_no
 
     print( resources_left )
     print( city_number )
     print( sever )
-  # Calculate the response and confidence feeding the NN with noisy inputs, getting the mean and entropy from the responses.
-    resp, confidence, rt_hold, rt_release = rl_agent_meta_cognitive(Q[int(resources_left), int(city_number),int(sever)],resources_left,RESPONSE_TIMEOUT)
+  # Look up the response and confidence of the RL-Agent for this state (as rl_agent_meta_cognitive would calculate them)
+    resp, confidence, rt_hold, rt_release = get_rl_agent_decision(DecisionTable, resources_left, city_number, sever, RESPONSE_TIMEOUT)
+    log_utils.tee( 'Agent Decision:', resp, confidence )
 
     if ( (LOBBY_PLAYERS > 1 or PLAYER_TYPE == 'human' or SHOW_PYGAME_IF_NONHUMAN_PLAYER) and AGENT_WAIT): pygame.time.wait( int(rt_release) * 1000)
 
@@ -1042,8 +1144,8 @@ def provide_agent_response( img,
     assert first_severity is not None, \
            "The 'first_severity' module-global variable needs to be set by caller before calling this function"
 
-    model = Agent.Model([4, 4], 10)
-    model.load()
+  # The NN-Agent weights are loaded only once (as numpy arrays, see agent_utils)
+    model = agent_utils.get_agent_model( [4, 4], 10 )
 
     if VERBOSE:
         printinfo( "Model parameters: " )
@@ -1051,25 +1153,16 @@ def provide_agent_response( img,
             printcolor( m, ANSI.ORANGE )
         print()
 
-    resources_remaining = tf.Variable(resources_left, dtype=tf.float32)
-
     if VERBOSE:
         printinfo( 'Resources remaining...' )
-        printcolor( resources_remaining, ANSI.ORANGE )
+        printcolor( resources_left, ANSI.ORANGE )
         print()
 
-    SequenceLengthsCsv = os.path.join( INPUTS_PATH, SEQ_LENGTHS_FILE )
-    sequence_length = numpy.loadtxt( SequenceLengthsCsv , delimiter=',')
-    sevs = convert_globalseq_to_seqs(sequence_length, first_severity)
-    
-    # Latest version of TF are strict in terms of using only tensors as inputs.
-    t_sevs = tf.Variable( sevs[ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ], dtype=tf.float32)
-    t_trial_no = tf.Variable( trial_no, dtype=tf.float32 )
-    
-    resp = model( t_sevs, t_trial_no, resources_remaining ).numpy()
+    AbsoluteTrialIndex = input_utils.get_experiment_inputs().TrialIndexMap[ session_no * NUM_SEQUENCES + sequence_no, trial_no ]
+
 
   # Calculate the response and confidence feeding the NN with noisy inputs, getting the mean and entropy from the responses.
-    confidence, resp, rt_hold, rt_release = calculate_agent_response_and_confidence_alternative(model, sevs[ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ], trial_no, resources_left)
+    confidence, resp, rt_hold, rt_release = calculate_agent_response_and_confidence_alternative(model, first_severity[ AbsoluteTrialIndex ], trial_no, resources_left)
 
     print( "DEBUG: rt_release = ", rt_release )         # typically between 0 and 10
     DelayModifier = 0.5
@@ -1476,41 +1569,9 @@ def provide_replay_confidence(img,
 
     assert number_of_trials is not None
 
-    SequenceLengthsCsv = os.path.join( INPUTS_PATH, SEQ_LENGTHS_FILE )
-    sequence_length = numpy.loadtxt( SequenceLengthsCsv , delimiter=',')
-
   # @TODO Verify if the sequence/trial structure of the responses is compatible with the one for this experiment.
 
-    Responses_filename = os.path.join(
-        OUTPUTS_PATH,
-        f'{OUTPUT_FILE_PREFIX}responses_{ SubjectId }.txt'
-    )
-
-    temp = numpy.loadtxt( Responses_filename, delimiter=',', skiprows=1)
-
-    n_trials =  int( sum( sum( number_of_trials ) ) )
-
-    stimuli = numpy.zeros((n_trials))                ## These are the initial stimulus, exactly.
-    response = numpy.zeros((n_trials))
-    reported_confidence = numpy.zeros( (n_trials))
-    hold_rts = numpy.zeros(( n_trials))
-    release_rts = numpy.zeros((n_trials))
-
-    stimuli = temp[:,0]
-    response = temp[:, 1]
-    reported_confidence = numpy.clip(temp[:, 2], .0, 1.0)  ## 0-1 real
-    hold_rts = temp[:, 3]                                  ## When they press the button ms
-    release_rts = temp[:, 4]                               ## When they release the button ms
-
-    response_in_series = convert_globalseq_to_seqs(sequence_length, response)
-    reported_confidence_in_series = convert_globalseq_to_seqs(sequence_length, reported_confidence)
-    hold_rts_in_series = convert_globalseq_to_seqs(sequence_length, hold_rts)
-    release_rts_in_series = convert_globalseq_to_seqs(sequence_length, release_rts)
-
-    resp                   = response_in_series            [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
-    rt_hold                = hold_rts_in_series            [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
-    rt_release             = release_rts_in_series         [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
-    CurrentConfidenceValue = reported_confidence_in_series [ session_no * NUM_SEQUENCES + sequence_no ][ trial_no ]
+    CurrentConfidenceValue = numpy.clip( get_replay_store().get_trial( SubjectId, session_no, sequence_no, trial_no )[ 'confidence' ], .0, 1.0 )  ## 0-1 real
 
     assert False, 'This method should not be called anymore.'
     return CurrentConfidenceValue
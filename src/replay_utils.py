@@ -0,0 +1,150 @@
+"""
+PES - Pandemic Experiment Scenario
+
+Replay store for 'playback' players. A recorded session ('responses_<ID>.txt' in OUTPUTS_PATH) is parsed only once, into
+a structured array indexed by ( block, sequence, trial ), from which every response of the replayed player is a lookup.
+Several recorded sessions can be held by the same store, so that a single process can host several replayed players.
+
+The parsed records of each session are also cached into a binary '.npy' file next to the text file, which is used
+instead of the text file for as long as it is not older than it.
+
+Functions defined here:
+ • get_responses_filename
+ • read_responses
+
+Classes defined here:
+ • ReplayStore
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import os
+import numpy
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .. import NUM_SEQUENCES
+from .. import OUTPUT_FILE_PREFIX
+from .. import OUTPUTS_PATH
+
+from .input_utils import get_experiment_inputs
+from .severity_utils import pad_sequences
+
+
+# -----------------------
+# module-global variables
+# -----------------------
+
+# One record per trial, with the columns of the responses file
+REPLAY_DTYPE = numpy.dtype( [ ( 'initial_severity', numpy.float64 ),
+                              ( 'response'        , numpy.float64 ),
+                              ( 'confidence'      , numpy.float64 ),
+                              ( 'hold_rt'         , numpy.float64 ),
+                              ( 'release_rt'      , numpy.float64 ) ] )
+
+
+
+####################
+### Module functions
+####################
+
+def get_responses_filename( SubjectId, OutputsPath = OUTPUTS_PATH ):
+    return os.path.join( OutputsPath, f'{OUTPUT_FILE_PREFIX}responses_{ SubjectId }.txt' )
+
+
+
+
+def read_responses( Filename, UseCache = True ):
+    """
+    Returns the trials of a responses file as a 1D array of REPLAY_DTYPE records. With UseCache, they are read from
+    (or otherwise stored into) the binary cache next to the text file, '<Filename>.npy'.
+    """
+
+    CacheFilename = Filename + '.npy'
+
+    if UseCache and os.path.isfile( CacheFilename ) and os.path.getmtime( CacheFilename ) >= os.path.getmtime( Filename ):
+        return numpy.load( CacheFilename )
+
+    Columns = numpy.loadtxt( Filename, delimiter = ',', skiprows = 1, ndmin = 2 )
+    Records = numpy.zeros( (Columns.shape[ 0 ],), dtype = REPLAY_DTYPE )
+
+    for Column, Field in enumerate( REPLAY_DTYPE.names ):
+        Records[ Field ] = Columns[ :, Column ]
+
+    if UseCache:
+        try:
+            TemporaryFile = f'{CacheFilename}.{os.getpid()}.tmp'
+            with open( TemporaryFile, 'wb' ) as f:   numpy.save( f, Records )
+            os.replace( TemporaryFile, CacheFilename )
+        except OSError:
+            pass   # e.g. a read-only outputs directory: the text file will be parsed again next time
+
+
+    return Records
+
+
+
+####################
+### Module classes
+####################
+
+class ReplayStore():
+    """
+    Recorded sessions, each loaded once (see read_responses) into a ( blocks × sequences × trials ) array of REPLAY_DTYPE
+    records, following the sequence lengths of the experiment. Trials beyond the end of a sequence (or of the recording)
+    are zero-filled.
+    """
+
+    def __init__( self, SequenceLengths = None, NumSequences = NUM_SEQUENCES, OutputsPath = OUTPUTS_PATH, UseCache = True ):
+        if SequenceLengths is None:   SequenceLengths = get_experiment_inputs().SequenceLengths
+
+        self.SequenceLengths = numpy.atleast_1d( numpy.asarray( SequenceLengths ).astype( numpy.int64 ) )
+        self.NumSequences    = NumSequences
+        self.OutputsPath     = OutputsPath
+        self.UseCache        = UseCache
+        self.Sessions        = {}   # SubjectId -> ( blocks × sequences × trials ) records
+
+
+    def __getitem__( self, SubjectId ):
+        """
+        The whole recorded session of SubjectId, loaded on first use (FileNotFoundError if there is no such recording).
+        """
+
+        if SubjectId not in self.Sessions:
+            self.Sessions[ SubjectId ] = self.index_records( read_responses( get_responses_filename( SubjectId, self.OutputsPath ), self.UseCache ) )
+
+        return self.Sessions[ SubjectId ]
+
+
+    def __contains__( self, SubjectId ):
+        return SubjectId in self.Sessions
+
+
+    def index_records( self, Records ):
+        NumTrials = self.SequenceLengths.sum()
+        Flat      = numpy.zeros( (NumTrials,), dtype = REPLAY_DTYPE )
+        Flat[ : min( len( Records ), NumTrials ) ] = Records[ : NumTrials ]
+
+      # Whole blocks of NumSequences sequences (the last one padded with empty sequences, if needs be)
+        NumBlocks = -( -len( self.SequenceLengths ) // self.NumSequences )
+        Indexed   = numpy.zeros( (NumBlocks * self.NumSequences, self.SequenceLengths.max( initial = 0 )), dtype = REPLAY_DTYPE )
+
+        for Field in REPLAY_DTYPE.names:
+            Indexed[ Field ][ : len( self.SequenceLengths ) ], _ = pad_sequences( Flat[ Field ], self.SequenceLengths )
+
+
+        return Indexed.reshape( NumBlocks, self.NumSequences, -1 )
+
+
+    def get_trial( self, SubjectId, session_no, sequence_no, trial_no ):
+        """
+        The record of a single trial of SubjectId (session_no being the block).
+        """
+
+        return self[ SubjectId ][ session_no, sequence_no, trial_no ]
@@ -0,0 +1,122 @@
+"""
+PES - Pandemic Experiment Scenario
+
+Incremental state of the sequence being played. Each trial appends the player's response to the message sent to the
+other players, aggregates only the new trial of everybody's messages, and brings the final severities of every city up
+to date. The performances of every player and of the aggregate are then read off the cached severities at the end of
+the sequence (for the feedback screens), instead of being recomputed from the whole history.
+
+All the numbers are the same as rebuilding the messages, re-running the aggregator over all previous trials, and scoring
+the sequence from scratch (see severity_utils.score_sequences).
+
+Classes defined here:
+ • SequenceState
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import numpy
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .severity_utils import get_baselines
+from .severity_utils import get_final_severities
+
+
+
+####################
+### Module classes
+####################
+
+class SequenceState():
+    """
+    State of a sequence of len( InitialSeverities ) trials. Aggregator is one of the exp_utils aggregators (e.g.
+    get_confidence_weighted_median), which is only ever called on the last trial of the messages.
+
+    Per trial:
+      - add_my_trial  : appends the player's response, and returns the message to send to the other players
+      - add_all_trials: appends the messages of all the players (the player's first), and returns the aggregated
+                        allocations and their final severities so far
+    """
+
+    def __init__( self, InitialSeverities, Aggregator, AbsoluteSequenceIndex = None ):
+        self.InitialSeverities     = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+        self.Aggregator            = Aggregator
+        self.AbsoluteSequenceIndex = AbsoluteSequenceIndex
+        self.NumTrials             = 0
+
+        NumCities = len( self.InitialSeverities )
+
+        self.Message               = numpy.zeros( (NumCities, 4) )   # response, confidence, final severity, circle radius
+        self.AggregatedAllocations = numpy.zeros( (NumCities,) )
+        self.PlayerAllocations     = numpy.zeros( (0, NumCities) )   # players × trials (the player first)
+        self.FinalSeverities       = numpy.zeros( (1, 0) )           # ( players + aggregate ) × trials
+        self.Performances          = None
+
+
+    def get_final_severities( self, Allocations ):
+        """
+        Final severities of the cities seen so far (last axis), given their allocations.
+        """
+
+        return get_final_severities( self.InitialSeverities[ : self.NumTrials ], Allocations, self.NumTrials - numpy.arange( self.NumTrials ) )
+
+
+    def add_my_trial( self, Response, Confidence, CircleRadius ):
+        """
+        Returns the player's message (one row per trial so far) after appending this trial.
+        """
+
+        t = self.NumTrials
+        self.NumTrials += 1
+
+        self.Message[ t, [0, 1, 3] ] = Response, Confidence, CircleRadius
+        self.Message[ : t + 1, 2 ]   = self.get_final_severities( self.Message[ : t + 1, 0 ] )
+
+
+        return self.Message[ : t + 1 ].copy()
+
+
+    def add_all_trials( self, AllMessages, first_severity, AbsoluteTrialCount ):
+        """
+        Aggregates the last trial of AllMessages (all the players' messages, the player's first), and returns the
+        aggregated allocations and their final severities for the trials so far.
+        """
+
+        t = self.NumTrials - 1
+
+        AggregatedAllocation, _ = self.Aggregator( [ Msg[ -1:, : ] for Msg in AllMessages ], first_severity, self.AbsoluteSequenceIndex, AbsoluteTrialCount )
+        self.AggregatedAllocations[ t ] = AggregatedAllocation[ 0 ]
+
+      # The allocations of the players who joined (if any) are taken in full
+        if len( self.PlayerAllocations ) != len( AllMessages ):
+            self.PlayerAllocations = numpy.zeros( (len( AllMessages ), len( self.InitialSeverities )) )
+            for p, Msg in enumerate( AllMessages ):   self.PlayerAllocations[ p, : t + 1 ] = Msg[ :, 0 ]
+        else:
+            self.PlayerAllocations[ :, t ] = [ Msg[ -1, 0 ] for Msg in AllMessages ]
+
+        self.FinalSeverities = self.get_final_severities( numpy.vstack( [ self.PlayerAllocations[ :, : t + 1 ], self.AggregatedAllocations[ None, : t + 1 ] ] ) )
+        self.Performances    = None
+
+
+        return self.AggregatedAllocations[ : t + 1 ].copy(), self.FinalSeverities[ -1 ].tolist()
+
+
+    def get_performances( self ):
+        """
+        Normalised performance of every player, and of the aggregate (last entry), on the trials so far.
+        """
+
+        if self.Performances is None:
+            WorstCaseSequenceSeverity, BestCaseSequenceSeverity = get_baselines( [ self.NumTrials ], self.InitialSeverities[ : self.NumTrials ] )
+            SequenceSeverities = numpy.ascontiguousarray( self.FinalSeverities ).sum( axis = -1 )
+            self.Performances  = (WorstCaseSequenceSeverity - SequenceSeverities) / (WorstCaseSequenceSeverity - BestCaseSequenceSeverity)
+
+
+        return self.Performances
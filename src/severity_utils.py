@@ -0,0 +1,356 @@
+"""
+PES - Pandemic Experiment Scenario
+
+Vectorised severity engine. The per-city update rule used throughout the experiment,
+
+    s <- max( 0, SEVERITY_MULTIPLIER * s - RESPONSE_MULTIPLIER * a )
+
+is monotone, and once a city's severity reaches zero it stays at zero. The final severity of a city that is updated k
+times with the same allocation therefore has the closed form
+
+    max( 0, β^k s - R a (β^k - 1) / (β - 1) )
+
+For the integer domain used by the experiment (severities 0-10, allocations MIN-MAX_ALLOCATABLE_RESOURCES) the values
+are read from a precomputed lookup table, built by iterating the exact same floating point operations as
+exp_utils.get_updated_severity, so that results are bitwise identical to the iterative implementation. Values outside
+that domain fall back to the closed form.
+
+Functions defined here:
+ • build_severity_lookup_table
+ • get_baselines
+ • get_final_severities
+ • get_sequence_final_severities
+ • get_severity_evolution_matrix
+ • get_padded_final_severities
+ • get_sequence_baselines
+ • init_session_baselines
+ • pad_sequences
+ • score_sequences
+ • sum_padded_sequences
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import numpy
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .. import MAX_ALLOCATABLE_RESOURCES
+from .. import MIN_ALLOCATABLE_RESOURCES
+from .. import RESPONSE_MULTIPLIER
+from .. import SEVERITY_MULTIPLIER
+
+from .input_utils import get_experiment_inputs
+
+
+# -----------------------
+# module-global variables
+# -----------------------
+
+LOOKUP_TABLE_MAX_SEVERITY = 10   # Largest (integer) initial severity covered by the lookup table
+LOOKUP_TABLE_MAX_STEPS    = 20   # Largest number of updates covered by the lookup table (i.e. longest sequence)
+BASELINE_CACHE_MAX_SIZE   = 100000   # The cache is simply emptied when full (ad-hoc sequences, e.g. random episodes)
+
+BaselineCache    = {}     # (lengths, severities) bytes -> (WorstCaseSequenceSeverities, BestCaseSequenceSeverities)
+SessionBaselines = None   # Same, for the experiment's fixed schedule, indexed by absolute sequence index (see init_session_baselines)
+SessionSchedule  = None   # ( SequenceOffsets, SequenceLengths, InitialSeverities ) the session baselines were computed for
+
+
+
+####################
+### Module functions
+####################
+
+def build_severity_lookup_table( MaxSeverity = LOOKUP_TABLE_MAX_SEVERITY, MaxSteps = LOOKUP_TABLE_MAX_STEPS ):
+    """
+    Returns a (severity × allocation × steps) array, where entry [s, a - MIN_ALLOCATABLE_RESOURCES, k] holds the severity
+    of a city with initial severity s, after k updates with allocation a.
+    """
+
+    Severities, Allocations = numpy.meshgrid( numpy.arange( MaxSeverity + 1, dtype = numpy.float64 ),
+                                              numpy.arange( MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES + 1, dtype = numpy.float64 ),
+                                              indexing = 'ij' )
+
+    LookupTable = numpy.empty( Severities.shape + (MaxSteps + 1,) )
+    LookupTable[ :, :, 0 ] = Severities
+
+  # Iterate the update rule with the same operations (and in the same order) as get_updated_severity
+    for k in range( 1, MaxSteps + 1 ):
+        LookupTable[ :, :, k ] = numpy.maximum( SEVERITY_MULTIPLIER * LookupTable[ :, :, k - 1 ] - RESPONSE_MULTIPLIER * Allocations, 0 )
+
+
+    return LookupTable
+
+
+
+
+SEVERITY_LOOKUP_TABLE = build_severity_lookup_table()
+
+
+
+
+def get_final_severities( InitialSeverities, Allocations, StepsRemaining ):
+    """
+    Element-wise final severity of cities with the given initial severities, after StepsRemaining updates with the given
+    allocations. Inputs are broadcast against each other, so any array shape is accepted.
+    """
+
+    Severities  = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+    Allocations = numpy.asarray( Allocations      , dtype = numpy.float64 )
+    Steps       = numpy.asarray( StepsRemaining   , dtype = numpy.int64   )
+
+    NumSeverities, NumAllocations, NumSteps = SEVERITY_LOOKUP_TABLE.shape
+
+    SeverityIndices   = Severities .astype( numpy.int64 )
+    AllocationIndices = Allocations.astype( numpy.int64 ) - MIN_ALLOCATABLE_RESOURCES
+
+    InTable = ( (SeverityIndices == Severities) & (AllocationIndices + MIN_ALLOCATABLE_RESOURCES == Allocations)
+              & ((SeverityIndices | AllocationIndices | Steps) >= 0)
+              & (SeverityIndices < NumSeverities) & (AllocationIndices < NumAllocations) & (Steps < NumSteps) )
+
+  # Fast path: the whole input lies in the experiment's integer domain
+    if InTable.all():   return SEVERITY_LOOKUP_TABLE[ SeverityIndices, AllocationIndices, Steps ]
+
+    Severities, Allocations, Steps, SeverityIndices, AllocationIndices = numpy.broadcast_arrays( Severities, Allocations, Steps, SeverityIndices, AllocationIndices )
+
+    FinalSeverities            = numpy.empty( InTable.shape )
+    FinalSeverities[ InTable ] = SEVERITY_LOOKUP_TABLE[ SeverityIndices[ InTable ], AllocationIndices[ InTable ], Steps[ InTable ] ]
+
+  # Closed form for anything not covered by the table (non-integer or out-of-range values)
+    OffTable     = ~InTable
+    Growth       = SEVERITY_MULTIPLIER ** Steps[ OffTable ]
+    GeometricSum = Steps[ OffTable ] if SEVERITY_MULTIPLIER == 1 else (Growth - 1) / (SEVERITY_MULTIPLIER - 1)
+    FinalSeverities[ OffTable ] = numpy.maximum( Growth * Severities[ OffTable ] - RESPONSE_MULTIPLIER * Allocations[ OffTable ] * GeometricSum, 0 )
+
+
+    return FinalSeverities
+
+
+
+
+def get_sequence_final_severities( Allocations, InitialSeverities ):
+    """
+    Final severities of all cities in a sequence (last axis), once all trials have been played. The i-th city (zero-based)
+    in a sequence of length n is updated n - i times. Leading axes are treated as independent sequences of equal length.
+    """
+
+    InitialSeverities = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+    NumTrials         = InitialSeverities.shape[ -1 ]
+    Allocations       = numpy.asarray( Allocations, dtype = numpy.float64 )[ ..., : NumTrials ]
+    StepsRemaining    = NumTrials - numpy.arange( NumTrials )
+
+
+    return get_final_severities( InitialSeverities, Allocations, StepsRemaining )
+
+
+
+
+def get_severity_evolution_matrix( Allocations, InitialSeverities ):
+    """
+    Returns the (n+1 × n) matrix of city severities across trials, laid out as in Pandemic.severity_evolution: row t holds
+    the severities of all cities seen so far at the start of trial t (row n holds the final severities), and cities that
+    have not appeared yet are 0.
+    """
+
+    InitialSeverities = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+    NumTrials         = InitialSeverities.shape[ -1 ]
+    Allocations       = numpy.asarray( Allocations, dtype = numpy.float64 )[ : NumTrials ]
+
+    Steps   = numpy.arange( NumTrials + 1 )[ :, None ] - numpy.arange( NumTrials )[ None, : ]   # E[t,c] = g( s_c, a_c, t - c )
+    Visible = Steps >= 0
+
+    EvolutionMatrix = get_final_severities( InitialSeverities, Allocations, numpy.maximum( Steps, 0 ) )
+    EvolutionMatrix[ ~Visible ] = 0
+
+
+    return EvolutionMatrix
+
+
+
+
+def pad_sequences( Values, SequenceLengths ):
+    """
+    Splits the last axis of Values (e.g. the 360 trials of a whole session) into consecutive sequences of the given
+    lengths, and returns them zero-padded as a (... × sequences × max_len) array, together with the (sequences × max_len)
+    boolean mask of valid entries. Any leading axes (e.g. subjects) are preserved.
+    """
+
+    Values          = numpy.asarray( Values, dtype = numpy.float64 )
+    SequenceLengths = numpy.asarray( SequenceLengths ).astype( numpy.int64 )
+
+    if Values.shape[ -1 ] < SequenceLengths.sum():
+        raise ValueError( f"Not enough trials ({Values.shape[ -1 ]}) to fill sequences totalling {SequenceLengths.sum()} trials" )
+
+    Offsets   = numpy.cumsum( SequenceLengths ) - SequenceLengths
+    Positions = numpy.arange( SequenceLengths.max( initial = 0 ) )
+    Mask      = Positions[ None, : ] < SequenceLengths[ :, None ]
+    Indices   = numpy.where( Mask, Offsets[ :, None ] + Positions[ None, : ], 0 )
+
+    Padded = numpy.where( Mask, Values[ ..., Indices ], 0 )
+
+
+    return Padded, Mask
+
+
+
+
+def get_padded_final_severities( PaddedAllocations, PaddedInitialSeverities, Mask ):
+    """
+    Final severities for a padded batch of sequences (see pad_sequences). Padded entries come out as 0.
+    """
+
+    SequenceLengths = Mask.sum( axis = -1 )
+    StepsRemaining  = numpy.where( Mask, SequenceLengths[ :, None ] - numpy.arange( Mask.shape[ -1 ] )[ None, : ], 0 )
+
+
+    return get_final_severities( numpy.where( Mask, PaddedInitialSeverities, 0 ), numpy.where( Mask, PaddedAllocations, 0 ), StepsRemaining )
+
+
+
+
+def sum_padded_sequences( Padded, SequenceLengths ):
+    """
+    Sums a padded batch of sequences over its last axis. Sequences are summed in groups of equal length, so that the
+    summation order (and hence the result, to the last bit) matches numpy.sum over the unpadded sequence.
+    """
+
+    SequenceLengths = numpy.asarray( SequenceLengths ).astype( numpy.int64 )
+    Totals          = numpy.empty( Padded.shape[ : -1 ] )
+
+    for Length in numpy.unique( SequenceLengths ):
+        Selected = SequenceLengths == Length
+        Totals[ ..., Selected ] = numpy.ascontiguousarray( Padded[ ..., Selected, : Length ] ).sum( axis = -1 )
+
+
+    return Totals
+
+
+
+
+def score_sequences( Allocations, SequenceLengths = None, InitialSeverities = None ):
+    """
+    Scores a whole session in one vectorised call. Allocations holds the allocations for every trial of the session
+    (e.g. the 360-trial vector), optionally with leading axes (e.g. subjects × trials). SequenceLengths and
+    InitialSeverities default to the experiment's SEQ_LENGTHS_FILE and INITIAL_SEVERITY_FILE.
+
+    Returns a tuple of:
+      - Performances               : normalised performance per sequence (... × sequences)
+      - SequenceSeverities         : final total severity per sequence (... × sequences)
+      - WorstCaseSequenceSeverities: total severity when allocating MIN_ALLOCATABLE_RESOURCES throughout (sequences)
+      - BestCaseSequenceSeverities : total severity when allocating MAX_ALLOCATABLE_RESOURCES throughout (sequences)
+      - FinalSeverities            : per-city final severities, as a masked (... × sequences × max_len) array
+
+    Each entry is identical to what calculate_normalised_final_severity_performance_metric returns for that sequence.
+    """
+
+    if SequenceLengths   is None:   SequenceLengths   = get_experiment_inputs().SequenceLengths
+    if InitialSeverities is None:   InitialSeverities = get_experiment_inputs().InitialSeverities
+
+    SequenceLengths = numpy.atleast_1d( numpy.asarray( SequenceLengths ).astype( numpy.int64 ) )
+
+    PaddedInitialSeverities, Mask = pad_sequences( InitialSeverities, SequenceLengths )
+    PaddedAllocations      , _    = pad_sequences( Allocations      , SequenceLengths )
+
+    FinalSeverities    = get_padded_final_severities( PaddedAllocations, PaddedInitialSeverities, Mask )
+    SequenceSeverities = sum_padded_sequences( FinalSeverities, SequenceLengths )
+
+    WorstCaseSequenceSeverities, BestCaseSequenceSeverities = get_baselines( SequenceLengths, InitialSeverities )
+
+    Performances = (WorstCaseSequenceSeverities - SequenceSeverities) / (WorstCaseSequenceSeverities - BestCaseSequenceSeverities)
+
+    FinalSeverities = numpy.ma.masked_array( FinalSeverities, mask = numpy.broadcast_to( ~Mask, FinalSeverities.shape ) )
+
+
+    return Performances, SequenceSeverities, WorstCaseSequenceSeverities, BestCaseSequenceSeverities, FinalSeverities
+
+
+
+
+def get_baselines( SequenceLengths, InitialSeverities ):
+    """
+    Returns the worst-case (all MIN_ALLOCATABLE_RESOURCES) and best-case (all MAX_ALLOCATABLE_RESOURCES) total
+    severities of each sequence. These only depend on the sequences themselves, so they are memoised in BaselineCache,
+    keyed by the contents of SequenceLengths and InitialSeverities.
+    """
+
+    SequenceLengths   = numpy.atleast_1d( numpy.asarray( SequenceLengths ).astype( numpy.int64 ) )
+    InitialSeverities = numpy.asarray( InitialSeverities, dtype = numpy.float64 )[ : SequenceLengths.sum() ]
+    Key               = ( SequenceLengths.tobytes(), InitialSeverities.tobytes() )
+
+    Baselines = BaselineCache.get( Key )
+
+    if Baselines is None:
+        PaddedInitialSeverities, Mask = pad_sequences( InitialSeverities, SequenceLengths )
+
+        WorstCaseSequenceSeverities = sum_padded_sequences( get_padded_final_severities( numpy.full( Mask.shape, MIN_ALLOCATABLE_RESOURCES ), PaddedInitialSeverities, Mask ), SequenceLengths )
+        BestCaseSequenceSeverities  = sum_padded_sequences( get_padded_final_severities( numpy.full( Mask.shape, MAX_ALLOCATABLE_RESOURCES ), PaddedInitialSeverities, Mask ), SequenceLengths )
+
+        if len( BaselineCache ) >= BASELINE_CACHE_MAX_SIZE:   BaselineCache.clear()
+
+        Baselines = BaselineCache[ Key ] = ( WorstCaseSequenceSeverities, BestCaseSequenceSeverities )
+
+
+    return Baselines
+
+
+
+
+def get_sequence_baselines( InitialSequenceSeverities, AbsoluteSequenceIndex = None ):
+    """
+    Returns ( WorstCaseSequenceSeverity, BestCaseSequenceSeverity ) for a single sequence. If an AbsoluteSequenceIndex
+    is given, and the session baselines have been initialised for a schedule whose sequence at that index has these very
+    initial severities, they are read directly off the session table (any other sequence, e.g. a practice or partial
+    one, falls back to get_baselines).
+    """
+
+    if AbsoluteSequenceIndex is not None and SessionBaselines is not None:
+        Offsets, Lengths, Severities = SessionSchedule
+
+        if 0 <= AbsoluteSequenceIndex < len( Lengths ) and Lengths[ AbsoluteSequenceIndex ] == len( InitialSequenceSeverities ):
+            Offset = Offsets[ AbsoluteSequenceIndex ]
+
+            if numpy.array_equal( Severities[ Offset : Offset + Lengths[ AbsoluteSequenceIndex ] ], InitialSequenceSeverities ):
+                return SessionBaselines[ 0 ][ AbsoluteSequenceIndex ], SessionBaselines[ 1 ][ AbsoluteSequenceIndex ]
+
+    WorstCaseSequenceSeverities, BestCaseSequenceSeverities = get_baselines( [ len( InitialSequenceSeverities ) ], InitialSequenceSeverities )
+
+
+    return WorstCaseSequenceSeverities[ 0 ], BestCaseSequenceSeverities[ 0 ]
+
+
+
+
+def init_session_baselines( SequenceLengths = None, InitialSeverities = None ):
+    """
+    Computes the baselines for every sequence of the experiment's fixed schedule in one go (defaulting to
+    SEQ_LENGTHS_FILE and INITIAL_SEVERITY_FILE), and seeds the cache with each individual sequence, so that later calls
+    of the performance metric reduce to a lookup.
+    """
+
+    global SessionBaselines
+    global SessionSchedule
+
+    if SequenceLengths   is None:   SequenceLengths   = get_experiment_inputs().SequenceLengths
+    if InitialSeverities is None:   InitialSeverities = get_experiment_inputs().InitialSeverities
+
+    SequenceLengths   = numpy.atleast_1d( numpy.asarray( SequenceLengths ).astype( numpy.int64 ) )
+    InitialSeverities = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+
+    SessionBaselines = WorstCaseSequenceSeverities, BestCaseSequenceSeverities = get_baselines( SequenceLengths, InitialSeverities )
+
+    Offsets = numpy.cumsum( SequenceLengths ) - SequenceLengths
+
+    SessionSchedule = ( Offsets, SequenceLengths, InitialSeverities )
+
+    for i, ( Offset, Length ) in enumerate( zip( Offsets, SequenceLengths ) ):
+        Key = ( SequenceLengths[ i : i + 1 ].tobytes(), InitialSeverities[ Offset : Offset + Length ].tobytes() )
+        BaselineCache[ Key ] = ( WorstCaseSequenceSeverities[ i : i + 1 ], BestCaseSequenceSeverities[ i : i + 1 ] )
+
+
+    return SessionBaselines
@@ -0,0 +1,254 @@
+"""
+PES - Pandemic Experiment Scenario
+
+Contains functions relating to the calculation of each player's Shapley value, i.e. their contribution to the group's
+performance, for use as the ShapleyPerSubject input of allocationCalculator.get_fuzzy_weighted_mean.
+
+The value of a coalition of players is the normalised severity performance (0 = worst case, 1 = best case) of the
+rounded confidence-weighted aggregate of its members' responses, on the trials of the sequence played so far. The empty
+coalition allocates MIN_ALLOCATABLE_RESOURCES throughout, i.e. has a value of 0.
+
+Up to MAX_EXACT_SHAPLEY_PLAYERS players, Shapley values are computed exactly, by enumerating all the coalitions once;
+beyond that, they are estimated by averaging the marginal contributions of the players over NUM_SHAPLEY_PERMUTATIONS
+random orderings of the players (the coalitions they give rise to being evaluated only once). In both cases the values
+of all the coalitions are memoised per trial, so that adding a trial only aggregates that trial, and scores the new
+prefix of the sequence, for all the coalitions at once.
+
+Functions defined here:
+ • get_all_coalitions
+ • get_coalition_allocations
+ • get_coalition_performances
+ • get_exact_shapley_values
+ • get_permutation_coalitions
+ • get_sampled_shapley_values
+ • get_shapley_values
+
+Classes defined here:
+ • ShapleyCalculator
+"""
+
+
+# ----------------
+# external imports
+# ----------------
+
+import math
+import numpy
+
+
+# ----------------
+# internal imports
+# ----------------
+
+from .. import MIN_ALLOCATABLE_RESOURCES
+
+from .exp_utils import get_weighted_means
+from .severity_utils import get_baselines
+from .severity_utils import get_final_severities
+
+
+# -----------------------
+# module-global variables
+# -----------------------
+
+MAX_EXACT_SHAPLEY_PLAYERS = 10     # Largest group enumerated exactly (2^10 coalitions; also the generate_feedback limit)
+NUM_SHAPLEY_PERMUTATIONS  = 500    # Orderings of the players sampled for larger groups
+
+
+
+####################
+### Module classes
+####################
+
+class ShapleyCalculator():
+    """
+    Shapley values of NumPlayers players over a sequence with the given initial severities. Aggregator is one of the
+    exp_utils kernels taking ( players × trials ) responses and confidences (e.g. get_weighted_medians).
+
+    Per trial (or batch of trials):
+      - add_trials        : aggregates and scores the new trials for all the coalitions
+      - get_shapley_values: returns the ( players × trials ) Shapley values, column t being each player's contribution to
+                            the performance on trials 0 - t (the last column is their contribution to the sequence)
+    """
+
+    def __init__( self, NumPlayers, InitialSeverities, Aggregator = get_weighted_means,
+                  MaxExactPlayers = MAX_EXACT_SHAPLEY_PLAYERS, NumPermutations = NUM_SHAPLEY_PERMUTATIONS, Seed = None ):
+
+        self.NumPlayers        = NumPlayers
+        self.InitialSeverities = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+        self.Aggregator        = Aggregator
+
+        if NumPlayers <= MaxExactPlayers:
+            self.Members      = get_all_coalitions( NumPlayers )
+            self.Permutations = None
+        else:
+            self.Permutations = numpy.random.default_rng( Seed ).permuted( numpy.tile( numpy.arange( NumPlayers ), (NumPermutations, 1) ), axis = 1 )
+            self.Members, self.PermutationCoalitions = get_permutation_coalitions( self.Permutations )
+
+        self.Allocations = numpy.zeros( (len( self.Members ), 0) )   # coalitions × trials
+        self.Values      = numpy.zeros( (len( self.Members ), 0) )   # coalitions × trials (value on trials 0 - t)
+
+
+    def add_trials( self, Responses, Confidences ):
+        """
+        Adds the ( players × new trials ) responses and confidences of the players, and returns the Shapley values.
+        """
+
+        NumTrials = self.Allocations.shape[ 1 ]
+
+        self.Allocations = numpy.hstack( [ self.Allocations, get_coalition_allocations( Responses, Confidences, self.Members, self.Aggregator ) ] )
+        self.Values      = numpy.hstack( [ self.Values, get_coalition_performances( self.Allocations, self.InitialSeverities, NumTrials ) ] )
+
+
+        return self.get_shapley_values()
+
+
+    def get_shapley_values( self ):
+        if self.Permutations is None:   return get_exact_shapley_values( self.Values, self.Members )
+        else                        :   return get_sampled_shapley_values( self.Values, self.Permutations, self.PermutationCoalitions )
+
+
+
+####################
+### Module functions
+####################
+
+def get_all_coalitions( NumPlayers ):
+    """
+    Returns the ( 2^NumPlayers × NumPlayers ) boolean membership of every coalition, coalition c having player i as a
+    member if bit i of c is set.
+    """
+
+    return ( numpy.arange( 2 ** NumPlayers )[ :, None ] >> numpy.arange( NumPlayers )[ None, : ] ) & 1 == 1
+
+
+
+
+def get_permutation_coalitions( Permutations ):
+    """
+    Given ( permutations × players ) orderings of the players, returns the ( coalitions × players ) boolean membership of
+    the distinct coalitions formed by the first j players of any ordering (j = 0 ... players), and the
+    ( permutations × players + 1 ) index of the coalition of the first j players of each ordering.
+    """
+
+    NumPermutations, NumPlayers = Permutations.shape
+
+    Positions = numpy.argsort( Permutations, axis = 1 )   # position of every player in every ordering
+    Members   = Positions[ :, None, : ] < numpy.arange( NumPlayers + 1 )[ None, :, None ]
+
+    Members, Coalitions = numpy.unique( Members.reshape( -1, NumPlayers ), axis = 0, return_inverse = True )
+
+
+    return Members, Coalitions.reshape( NumPermutations, NumPlayers + 1 )
+
+
+
+
+def get_coalition_allocations( Responses, Confidences, Members, Aggregator = get_weighted_means ):
+    """
+    Returns the ( coalitions × trials ) rounded aggregate of the ( players × trials ) responses of the members of every
+    coalition, as if only they had played: the aggregator is run once over all coalitions and trials, with the
+    confidences of non-members set to -1 (invalid). At trials where no member has a valid confidence, members weigh one
+    (i.e. the plain aggregate of their responses). The empty coalition allocates MIN_ALLOCATABLE_RESOURCES.
+    """
+
+    Responses   = numpy.asarray( Responses  , dtype = numpy.float64 )
+    Confidences = numpy.asarray( Confidences, dtype = numpy.float64 )
+
+    NumPlayers , NumTrials = Responses.shape
+    NumCoalitions          = len( Members )
+
+    CoalitionResponses   = numpy.broadcast_to( Responses[ :, None, : ], (NumPlayers, NumCoalitions, NumTrials) )
+    CoalitionConfidences = numpy.where( Members.T[ :, :, None ], Confidences[ :, None, : ], -1.0 )
+
+    NoValidConfidence = numpy.all( CoalitionConfidences == -1, axis = 0 )
+    CoalitionConfidences[ NoValidConfidence[ None, :, : ] & Members.T[ :, :, None ] ] = 1.0
+
+    Allocations = numpy.round( Aggregator( CoalitionResponses.reshape( NumPlayers, -1 ), CoalitionConfidences.reshape( NumPlayers, -1 ) ) ).reshape( NumCoalitions, NumTrials )
+    Allocations[ ~Members.any( axis = 1 ) ] = MIN_ALLOCATABLE_RESOURCES
+
+
+    return Allocations
+
+
+
+
+def get_coalition_performances( Allocations, InitialSeverities, FirstTrial = 0 ):
+    """
+    Returns the ( coalitions × trials ) normalised performance of the ( coalitions × trials ) allocations on every prefix
+    of the sequence (trials 0 - t), from trial FirstTrial onwards. Each prefix is scored for all the coalitions at once,
+    with exactly the same numbers as severity_utils.score_sequences gives for that prefix.
+    """
+
+    Allocations       = numpy.asarray( Allocations, dtype = numpy.float64 )
+    InitialSeverities = numpy.asarray( InitialSeverities, dtype = numpy.float64 )
+    NumTrials         = Allocations.shape[ 1 ]
+
+    Performances = numpy.empty( (len( Allocations ), NumTrials - FirstTrial) )
+
+    for t in range( FirstTrial, NumTrials ):
+        Length          = t + 1
+        FinalSeverities = get_final_severities( InitialSeverities[ : Length ], Allocations[ :, : Length ], Length - numpy.arange( Length ) )
+
+        WorstCaseSequenceSeverity, BestCaseSequenceSeverity = get_baselines( [ Length ], InitialSeverities[ : Length ] )
+        SequenceSeverities = numpy.ascontiguousarray( FinalSeverities ).sum( axis = -1 )
+
+        Performances[ :, t - FirstTrial ] = (WorstCaseSequenceSeverity - SequenceSeverities) / (WorstCaseSequenceSeverity - BestCaseSequenceSeverity)
+
+
+    return Performances
+
+
+
+
+def get_exact_shapley_values( Values, Members ):
+    """
+    Shapley values of every player (rows) given the ( coalitions × ... ) values of all the coalitions of get_all_coalitions:
+    the average of their marginal contributions v( S ∪ {i} ) - v( S ) over all coalitions S without them, weighted by
+    |S|! (n - |S| - 1)! / n!.
+    """
+
+    NumCoalitions, NumPlayers = Members.shape
+
+    Sizes   = Members.sum( axis = 1 )
+    Weights = numpy.array( [ math.factorial( s ) * math.factorial( NumPlayers - s - 1 ) / math.factorial( NumPlayers ) for s in range( NumPlayers ) ] )
+
+    ShapleyValues = numpy.empty( (NumPlayers,) + Values.shape[ 1: ] )
+
+    for i in range( NumPlayers ):
+        Without = numpy.flatnonzero( ~Members[ :, i ] )
+        ShapleyValues[ i ] = numpy.tensordot( Weights[ Sizes[ Without ] ], Values[ Without | (1 << i) ] - Values[ Without ], axes = 1 )
+
+
+    return ShapleyValues
+
+
+
+
+def get_sampled_shapley_values( Values, Permutations, PermutationCoalitions ):
+    """
+    Monte Carlo estimate of the Shapley values of every player (rows) given the ( coalitions × ... ) values of the
+    coalitions of get_permutation_coalitions: the average, over the sampled orderings, of each player's marginal
+    contribution to the coalition of the players preceding them.
+    """
+
+    MarginalContributions = Values[ PermutationCoalitions[ :, 1: ] ] - Values[ PermutationCoalitions[ :, :-1 ] ]   # permutations × positions × ...
+    Positions             = numpy.argsort( Permutations, axis = 1 )
+    Positions             = Positions.reshape( Positions.shape + (1,) * (Values.ndim - 1) )
+
+
+    return numpy.take_along_axis( MarginalContributions, Positions, axis = 1 ).mean( axis = 0 )
+
+
+
+
+def get_shapley_values( Responses, Confidences, InitialSeverities, Aggregator = get_weighted_means, **kwargs ):
+    """
+    ( players × trials ) Shapley values of the players, given their ( players × trials ) responses and confidences over
+    a sequence (see ShapleyCalculator, which also accepts the keyword arguments).
+    """
+
+    Calculator = ShapleyCalculator( len( Responses ), InitialSeverities, Aggregator, **kwargs )
+
+
+    return Calculator.add_trials( Responses, Confidences )
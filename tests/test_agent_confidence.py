@@ -259,6 +259,35 @@ class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
         assert rt_release >= rt_hold, 'Release time must be bigger than hold time'
         assert rt_release <= RESPONSE_TIMEOUT and rt_hold <= RESPONSE_TIMEOUT, 'The response values cannot be greater than the response timeout'
 
+    def test_humanised_confidence_mapper(self):
+        from statsmodels.distributions.empirical_distribution import ECDF
+        from scipy.stats import beta
+        from PES.ext.tools import HumanisedConfidenceMapper
+
+        corpus = numpy.round(numpy.random.default_rng(0).uniform(0, 1, 300), 2)
+        mapper = HumanisedConfidenceMapper(corpus[:100])
+        mapper.add(corpus[100:])
+
+        for reported_confidence in [numpy.array([0.3]), numpy.array([0.0, 0.5, 1.0, 0.5]), numpy.array([-0.1, 1.1])]:
+            # The transform as originally computed, with a new ECDF of the whole corpus
+            I = beta.ppf(ECDF(numpy.concatenate([corpus, reported_confidence]))(numpy.concatenate([corpus, reported_confidence])), 5.0, 1.8)
+            expected = numpy.clip((I - numpy.min(I)) * (1.0 / (numpy.max(I) - numpy.min(I))), 0.0, 1.0)[-len(reported_confidence):]
+
+            # The ECDF values may differ by 1 ulp, depending on how statsmodels builds them
+            assert numpy.allclose(mapper(reported_confidence), expected, rtol=1e-12, atol=1e-12), 'The humanised confidences differ from the ECDF transform'
+
+    def test_human_confidence_sampler(self):
+        from PES.ext.tools import HumanConfidenceSampler
+
+        lookuptable = {alloc: list(numpy.linspace(0, 1, alloc + 2)[1:] * 0.9 + alloc) for alloc in range(11)}
+        sampler = HumanConfidenceSampler(lookuptable, seed=0)
+
+        allocations = numpy.arange(11).repeat(100)
+        confidences = sampler.sample(allocations)
+        assert all(confidence in lookuptable[alloc] for alloc, confidence in zip(allocations, confidences)), 'Sampled a confidence of another allocation'
+        assert sampler.sample(7, size=20).shape == (20,), 'Invalid batch shape'
+        assert len(numpy.unique(sampler.sample(10, size=1000))) == len(lookuptable[10]), 'Not every recorded confidence is sampled'
+
 
 
 
@@ -0,0 +1,89 @@
+'''
+Test the NumPy-only inference path of the NN-Agent against the TensorFlow model.
+'''
+
+
+import unittest
+import os
+import sys
+import subprocess
+import tempfile
+import numpy
+
+from PES.src.agent_utils import NumpyModel, get_agent_model, load_tf_weights
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module agent_utils" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        model = get_agent_model( [4,4], 10 )
+
+        self.assertIs( model, get_agent_model( [4,4], 10 ) )
+        self.assertEqual( [ W.shape for W in model.Ws ], [ (4,3), (4,4), (1,4) ] )
+
+
+class Test_numpy_model( unittest.TestCase ):
+
+    def test_matches_stored_weights( self ):
+        Ws, bs = load_tf_weights()
+        model  = get_agent_model( [4,4], 10 )
+
+        for W, Wnpz in zip( Ws, model.Ws ):   self.assertTrue( numpy.array_equal( W, Wnpz ) )
+        for b, bnpz in zip( bs, model.bs ):   self.assertTrue( numpy.array_equal( b, bnpz ) )
+
+    def test_batch_matches_scalar( self ):
+        model = get_agent_model( [4,4], 10 )
+
+        severities = numpy.arange( 11, dtype = numpy.float32 )
+        batch      = model( severities, 3, 20 )
+
+        self.assertEqual( batch.shape, severities.shape )
+        for s in range( 11 ):   self.assertAlmostEqual( batch[ s ], model( severities[ s ], 3, 20 ), places = 5 )
+
+    def test_npz_roundtrip( self ):
+        model = get_agent_model( [4,4], 10 )
+
+        with tempfile.TemporaryDirectory() as d:
+            model.save( os.path.join( d, 'weights.npz' ) )
+            loaded = NumpyModel.load( os.path.join( d, 'weights.npz' ) )
+
+        self.assertEqual( loaded( 5, 1, 30 ), model( 5, 1, 30 ) )
+
+    def test_mediator_does_not_import_tensorflow( self ):
+        script = "import sys, PES.src.pygameMediator; print( 'tensorflow' in sys.modules )"
+        output = subprocess.run( [ sys.executable, '-c', script ], capture_output = True, text = True, check = True,
+                                 env = dict( os.environ, PYTHONPATH = os.pathsep.join( sys.path ) ) ).stdout
+
+        self.assertEqual( output.strip().splitlines()[ -1 ], 'False' )
+
+    def test_matches_tensorflow_model( self ):
+        try:
+            import tensorflow as tf
+            from PES.src import Agent
+        except ImportError:
+            self.skipTest( 'TensorFlow is not available' )
+
+        model = Agent.Model( [4,4], 10 )
+        model.load()
+
+        for severity, city_number, resources in [ (5,1,30), (8,4,12.5), (0,9,0) ]:
+            expected = model( tf.Variable( severity, dtype = tf.float32 ), tf.Variable( city_number, dtype = tf.float32 ), tf.Variable( resources, dtype = tf.float32 ) ).numpy()
+            self.assertTrue( numpy.isclose( NumpyModel.from_model( model )( severity, city_number, resources ), expected, rtol = 1e-6 ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
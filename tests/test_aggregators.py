@@ -0,0 +1,89 @@
+'''
+Test the vectorised confidence-weighted aggregators against aggregating each trial on its own (numpy.average and the
+weighted quantiles of statsmodels' DescrStatsW).
+'''
+
+
+import unittest
+import numpy
+
+from statsmodels.stats.weightstats import DescrStatsW
+
+from PES.src.exp_utils import get_weighted_means, get_weighted_medians, get_weighted_modes
+from PES.src.exp_utils import get_confidence_weighted_mean, get_confidence_weighted_median, get_confidence_weighted_mode
+
+
+def aggregate_trial( Responses, Confidences, Median ):
+    Valid = Confidences != -1
+
+    if not numpy.any( Valid ):
+        return numpy.median( Responses ) if Median else numpy.mean( Responses )
+
+    Responses, Confidences = Responses[ Valid ], Confidences[ Valid ]
+
+    if Median:
+        return DescrStatsW( data = Responses, weights = Confidences ).quantile( probs = [0.5], return_pandas = False )[0]
+
+    if numpy.sum( Confidences ) == 0:   Confidences = numpy.ones_like( Confidences )
+    return numpy.average( Responses, weights = Confidences )
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for the aggregators of module exp_utils" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng = numpy.random.default_rng( 0 )
+
+        for _ in range( 200 ):
+            players, trials = rng.integers( 1, 10, 2 )
+            responses       = rng.integers( 0, 11, (players, trials) ).astype( float )
+            confidences     = rng.choice( [ -1, 0.0, 0.1, 0.25, 0.3, 0.5, 0.7, 1.0 ], (players, trials) )
+
+            if rng.random() < 0.2:   confidences[ confidences != -1 ] = 0.0   # Ticket:085 fallback
+
+            for Median, aggregate in [ ( False, get_weighted_means ), ( True, get_weighted_medians ) ]:
+                expected = [ aggregate_trial( responses[ :, t ], confidences[ :, t ], Median ) for t in range( trials ) ]
+                self.assertTrue( numpy.array_equal( aggregate( responses, confidences ), expected ) )
+
+    def test_messages( self ):
+        messages = [ numpy.c_[ [3, 5, 7], [0.5, -1, 0.0], [0, 0, 0], [0, 0, 0] ],
+                     numpy.c_[ [4, 9, 1], [0.5, -1, 0.0], [0, 0, 0], [0, 0, 0] ] ]
+
+        allocations, _ = get_confidence_weighted_mean( messages, numpy.full( 10, 5.0 ), 0, 3 )
+        self.assertTrue( numpy.array_equal( allocations, numpy.round( [3.5, 7.0, 4.0] ) ) )
+
+        allocations, _ = get_confidence_weighted_median( messages, numpy.full( 10, 5.0 ), 0, 3 )
+        self.assertTrue( numpy.array_equal( allocations, numpy.round( [3.5, 7.0, 4.0] ) ) )
+
+    def test_modes( self ):
+        responses   = numpy.asarray( [ [3, 5, 7, 2, 4],
+                                       [4, 9, 1, 2, 6],
+                                       [4, 9, 1, 8, 4] ], dtype = float )
+        confidences = numpy.asarray( [ [0.9, -1, 0.0, 0.5, 0.3],
+                                       [0.5, -1, 0.0, 0.5, 0.6],
+                                       [0.5, -1, 0.0, 0.2, 0.3] ] )
+
+      # Weighted mode; plain mode when nothing is valid; Ticket:085; smallest allocation on ties (0.6 vs 0.3 + 0.3)
+        self.assertTrue( numpy.array_equal( get_weighted_modes( responses, confidences ), [4, 9, 1, 2, 4] ) )
+
+        messages = [ numpy.c_[ responses[ p ], confidences[ p ], numpy.zeros( (5, 2) ) ] for p in range( 3 ) ]
+        allocations, severities = get_confidence_weighted_mode( messages, numpy.full( 10, 5.0 ), 0, 5 )
+        self.assertTrue( numpy.array_equal( allocations, [4, 9, 1, 2, 4] ) )
+        self.assertEqual( len( severities ), 5 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,9 +8,12 @@ import tensorflow as tf
 
 
 import sys, os
+import tempfile
 
+from PES.src import pygameMediator
 from PES.src.pygameMediator import entropy, calculate_agent_response_and_confidence
 from PES.src.pygameMediator import convert_globalseq_to_seqs
+from PES.ext.tools import build_rl_decision_table, get_rl_agent_decision
 
 from PES import VERBOSE
 from PES import MAX_ALLOCATABLE_RESOURCES
@@ -80,6 +83,59 @@ class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
 
         print ( 'Done')
 
+    def test_replicates( self ):
+        model = Agent.Model([4,4],10)
+        model.load()
+
+        for replicates in [10, 100, 1000]:
+            numpy.random.seed(0)
+            confidence, resp = calculate_agent_response_and_confidence( model, 5, 2, 25, Replicates=replicates )
+            numpy.random.seed(0)
+            confidence2, resp2 = calculate_agent_response_and_confidence( model, 5, 2, 25, Replicates=replicates )
+
+            assert 0 <= confidence <= 1
+            assert 0 <= resp <= MAX_ALLOCATABLE_RESOURCES
+            assert (confidence, resp) == (confidence2, resp2)
+
+    def test_rl_tables( self ):
+        sequence_lengths = numpy.loadtxt( os.path.join( INPUTS_PATH, 'sequence_lengths.csv' ), delimiter=',' )
+        pygameMediator.first_severity = numpy.loadtxt( os.path.join( INPUTS_PATH, 'initial_severity.csv' ), delimiter=',' )
+
+        index = pygameMediator.get_trial_severity_index()
+        for seq, sevs in enumerate( convert_globalseq_to_seqs( sequence_lengths, pygameMediator.first_severity ) ):
+            assert index[ seq, :len(sevs) ].tolist() == [ int(sev) for sev in sevs ]
+        assert pygameMediator.get_trial_severity_index() is index
+
+        with tempfile.TemporaryDirectory() as d:
+            numpy.save( os.path.join( d, 'q.npy' ), numpy.random.rand( 31, 11, 11, 11 ) )
+            pygameMediator.RLQTable = None
+            Q = pygameMediator.get_rl_q_table( os.path.join( d, 'q.npy' ) )
+
+            assert isinstance( Q, numpy.memmap ) and not Q.flags.writeable
+            assert pygameMediator.get_rl_q_table() is Q
+
+            pygameMediator.RLQTable = None
+            del Q
+
+    def test_rl_decision_table( self ):
+        Q = numpy.random.default_rng( 0 ).uniform( -1, 1, (31, 11, 11, 11) )
+        Q_copy = Q.copy()
+
+        table = build_rl_decision_table( Q )
+
+        for resources_left, trial_no, severity in [ (30,0,5), (3,2,9), (0,4,2), (10,9,10) ]:
+            numpy.random.seed( 0 )
+            with unittest.mock.patch.object( pygameMediator.log_utils, 'tee' ):
+                expected = pygameMediator.rl_agent_meta_cognitive( Q[ resources_left, trial_no, severity ], resources_left, 10000 )
+            numpy.random.seed( 0 )
+            decision = get_rl_agent_decision( table, resources_left, trial_no, severity, 10000 )
+
+            assert decision[ 0 ] == expected[ 0 ]
+            assert numpy.isclose( decision[ 1 ], expected[ 1 ] )
+            assert decision[ 2: ] == expected[ 2: ]
+
+        assert numpy.array_equal( Q, Q_copy )
+
 
 if __name__ == '__main__':
     t = Test_()
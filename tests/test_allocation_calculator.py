@@ -0,0 +1,66 @@
+'''
+Test the vectorised fuzzy weighted mean against combining the channels of each trial on its own.
+'''
+
+
+import unittest
+import numpy
+
+from PES.src.allocationCalculator import get_fuzzy_weighted_mean, TNORMS
+
+
+def fuzzy_weighted_mean_at_trial( Confidences, Shapleys, MMAs, Allocations, And ):
+    Valid = Confidences != -1
+
+    if not numpy.any( Valid ):   return 0
+
+    FuzzyWeights = numpy.ones_like( Allocations[ Valid ] )
+    for Weights in ( Shapleys, MMAs, Confidences ):
+        Weights      = Weights[ Valid ]
+        Weights      = 1 / Weights.size if numpy.sum( Weights ) == 0 else Weights / numpy.sum( Weights )
+        FuzzyWeights = And( FuzzyWeights, Weights )
+
+    FuzzyWeights = 1 / FuzzyWeights.size if numpy.sum( FuzzyWeights ) == 0 else FuzzyWeights / numpy.sum( FuzzyWeights )
+    return numpy.sum( FuzzyWeights * Allocations[ Valid ] )
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module allocationCalculator" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng = numpy.random.default_rng( 0 )
+
+        for _ in range( 200 ):
+            subjects, trials = rng.integers( 1, 10, 2 )
+            confidences      = rng.choice( [ -1, 0.0, 0.1, 0.25, 0.5, 1.0 ], (subjects, trials) )
+            shapleys         = rng.choice( [ 0.0, rng.random() ], (subjects, trials) )
+            mmas             = rng.random( (subjects, trials) )
+            allocations      = rng.integers( 0, 11, (subjects, trials) )
+
+            for name, And in TNORMS.items():
+                expected = numpy.round( [ fuzzy_weighted_mean_at_trial( confidences[ :, t ], shapleys[ :, t ], mmas[ :, t ], allocations[ :, t ], And ) for t in range( trials ) ] )
+                result   = get_fuzzy_weighted_mean( confidences, shapleys, mmas, allocations, And = name )
+
+                if name == 'product':   self.assertTrue( numpy.array_equal( result, expected ) )
+                else                :   self.assertTrue( numpy.allclose( result, expected ) )
+
+          # Lists of per-subject lists, as passed by the callers
+            self.assertTrue( numpy.array_equal( get_fuzzy_weighted_mean( confidences.tolist(), shapleys.tolist(), mmas.tolist(), allocations.tolist() ),
+                                                get_fuzzy_weighted_mean( confidences, shapleys, mmas, allocations, And = lambda a,b: a * b ) ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+'''
+Test the counterfactual replay engine against replaying every session, aggregation method, allocation type and player
+trial by trial, with the aggregators and the resource bookkeeping of the experiment.
+'''
+
+
+import unittest
+import os
+import tempfile
+import numpy
+
+from PES import ALLOCATION_TYPE, OUTPUT_FILE_PREFIX
+from PES.src import exp_utils
+from PES.src.severity_utils import score_sequences
+from PES.src.allocationCalculator import get_fuzzy_weighted_mean
+from PES.src.shapleyCalculator import get_shapley_values
+from PES.src.mmaCalculator import MMAEstimator, get_optimal_allocations
+from PES.ext.counterfactual_replay import run_counterfactual_replay, METHODS, ALLOCATION_TYPES, AVAILABLE_RESOURCES
+
+
+AGGREGATORS = { 'confidence_weighted_median': exp_utils.get_confidence_weighted_median,
+                'confidence_weighted_mean'  : exp_utils.get_confidence_weighted_mean,
+                'confidence_weighted_mode'  : exp_utils.get_confidence_weighted_mode }
+
+
+def get_fuzzy_aggregates( responses, confidences, severities, lengths ):
+    '''
+    Fuzzy mean of every trial, from the MMAs and Shapley values known before it (after the previous trial of its sequence).
+    '''
+    starts    = numpy.cumsum( lengths ) - lengths
+    optimal   = get_optimal_allocations( severities, numpy.repeat( numpy.cumsum( lengths ), lengths ) - numpy.arange( lengths.sum() ) )
+    estimator = MMAEstimator( len( responses ) )
+    aggregates = []
+
+    for start, length in zip( starts, lengths ):
+        for t in range( start, start + length ):
+            if t == start:
+                mmas     = numpy.full( len( responses ), 0.5 )
+                shapleys = numpy.ones( len( responses ) )
+            else:
+                mmas     = estimator.get_mma()
+                shapleys = numpy.maximum( get_shapley_values( responses[ :, start : t ], confidences[ :, start : t ], severities[ start : t ] )[ :, -1 ], 0 )
+            aggregates.append( get_fuzzy_weighted_mean( confidences[ :, t : t + 1 ], shapleys[ :, None ], mmas[ :, None ], responses[ :, t : t + 1 ] )[ 0 ] )
+            estimator.update( responses[ :, t ], confidences[ :, t ], optimal[ t ] )
+
+    return aggregates
+
+
+def replay_player( aggregator, allocation_type, responses, confidences, player, severities, lengths ):
+    exp_utils.AllocationType = allocation_type
+    allocations = []
+    start = 0
+
+    for length in lengths:
+        resources_left = AVAILABLE_RESOURCES
+        for t in range( start, start + length ):
+            messages    = [ numpy.c_[ responses[ p, start : t + 1 ], confidences[ p, start : t + 1 ], numpy.zeros( (t + 1 - start, 2) ) ] for p in range( len( responses ) ) ]
+            aggregated, _ = aggregator( messages, severities, None, t + 1 )
+            allocations.append( exp_utils.get_actual_allocation_given_allocation_type( aggregated, messages[ player ], messages ) if resources_left > 0 else 0 )
+            resources_left = exp_utils.get_resources_left_given_allocation_type( resources_left, aggregated, messages[ player ], messages )
+        start += length
+
+    return score_sequences( numpy.asarray( allocations, dtype = float ), lengths, severities )[ 0 ]
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module counterfactual_replay" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng        = numpy.random.default_rng( 0 )
+        lengths    = numpy.asarray( [ 4, 6, 5 ] )
+        severities = rng.integers( 2, 9, lengths.sum() ).astype( float )
+        sessions   = [ [ 'a', 'b', 'c' ], [ 'd', 'e' ] ]
+        recorded   = {}
+
+        # The recording of 'e' stops within the last sequence: only the second session is cut to the first two
+        session_lengths = [ lengths, lengths[ :2 ] ]
+
+        with tempfile.TemporaryDirectory() as d:
+            for subject_id in 'abcde':
+                num_trials  = 12 if subject_id == 'e' else lengths.sum()
+                responses   = rng.integers( 0, 11, num_trials ).astype( float )
+                confidences = numpy.where( rng.random( num_trials ) < 0.3, -1, numpy.round( rng.random( num_trials ), 2 ) )
+                recorded[ subject_id ] = responses, confidences
+                numpy.savetxt( os.path.join( d, f'{OUTPUT_FILE_PREFIX}responses_{subject_id}.txt' ), numpy.c_[ severities[ : num_trials ], responses, confidences, numpy.zeros( (num_trials, 2) ) ],
+                               delimiter = ',', header = 'InitialSeverity, Response, Confidence, PressEvent_seconds, ReleaseEvent_seconds' )
+
+            performances, group_performances = run_counterfactual_replay( sessions, d, lengths, max_workers = 2 )
+
+        self.assertEqual( performances.shape, (len( METHODS ), len( ALLOCATION_TYPES ), 2, 3, 3) )
+        self.assertTrue( numpy.all( numpy.isnan( performances[ :, :, 1, 2 ] ) ) )
+        self.assertTrue( numpy.all( numpy.isnan( performances[ :, :, 1, :, 2 ] ) ) )
+        self.assertTrue( numpy.all( numpy.isnan( group_performances[ :, :, 1, 2 ] ) ) )
+        self.assertTrue( numpy.all( numpy.isfinite( group_performances[ :, :, 0 ] ) ) )
+        self.assertTrue( numpy.all( numpy.isfinite( group_performances[ :, :, 1, :2 ] ) ) )
+
+        for s, session in enumerate( sessions ):
+            lengths     = session_lengths[ s ]
+            responses   = numpy.asarray( [ recorded[ subject_id ][ 0 ][ : lengths.sum() ] for subject_id in session ] )
+            confidences = numpy.asarray( [ recorded[ subject_id ][ 1 ][ : lengths.sum() ] for subject_id in session ] )
+            q           = len( lengths )
+
+            for m, method in enumerate( METHODS[ :3 ] ):
+                for a, allocation_type in enumerate( ALLOCATION_TYPES ):
+                    for p in range( len( session ) ):
+                        expected = replay_player( AGGREGATORS[ method ], allocation_type, responses, confidences, p, severities, lengths )
+                        self.assertTrue( numpy.array_equal( performances[ m, a, s, p, : q ], expected ), (method, allocation_type, s, p) )
+
+                    self.assertTrue( numpy.allclose( group_performances[ m, a, s, : q ], numpy.mean( performances[ m, a, s, : len( session ), : q ], axis = 0 ) ) )
+
+            fuzzy_aggregates = get_fuzzy_aggregates( responses, confidences, severities[ : lengths.sum() ], lengths )
+            fuzzy_aggregator = lambda messages, severities, _, num_trials: ( fuzzy_aggregates[ : num_trials ], None )
+            m = METHODS.index( 'fuzzy_weighted_mean' )
+
+            for a, allocation_type in enumerate( ALLOCATION_TYPES ):
+                for p in range( len( session ) ):
+                    expected = replay_player( fuzzy_aggregator, allocation_type, responses, confidences, p, severities, lengths )
+                    self.assertTrue( numpy.array_equal( performances[ m, a, s, p, : q ], expected ), ('fuzzy_weighted_mean', allocation_type, s, p) )
+
+        exp_utils.AllocationType = ALLOCATION_TYPE
+
+
+if __name__ == '__main__':
+    unittest.main()
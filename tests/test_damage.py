@@ -38,7 +38,7 @@ from PES import INPUTS_PATH
 from PES import NUM_SEQUENCES
 from PES import LOBBY_PLAYERS
 from PES.src.pygameMediator import Agent
-from PES.ext.pandemic import Pandemic
+from PES.ext.pandemic import Pandemic, VecPandemic
 
 from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric,get_sequence_severity_from_allocations
 from PES.src.exp_utils import get_updated_severity,get_sequence_severity_from_allocations
@@ -112,6 +112,57 @@ class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
         assert perf>=0, "The normalised performance cannot be negative."
         assert f== numpy.sum( env.severities)
 
+    def test_vectorised_environment( self ):
+        trials_per_sequence = numpy.asarray([3,6,4])
+        severities  = [3,4,8, 8,3,4,8,8,6, 1,2,3,9]
+        allocations = [5,6,4, 0,1,5,3,0,6, 0,0,0,10]
+
+        vec = VecPandemic(3, auto_reset=False)
+        vec.set_fixed_sequences(trials_per_sequence, severities, allocations)
+        states = vec.reset()
+        final_rewards = numpy.zeros((3,))
+
+        while not vec.done.all():
+            states, rewards, dones, info = vec.step(vec.sample())
+            final_rewards[dones] = rewards[dones]
+
+        sevs = convert_globalseq_to_seqs(trials_per_sequence, severities)
+        allocs = convert_globalseq_to_seqs(trials_per_sequence, allocations)
+
+        for i in range(3):
+            env = Pandemic()
+            env.verbose = False
+            env.set_fixed_sequence(trials_per_sequence[i], sevs[i], allocs[i])
+            state = env.reset()
+            done = False
+            while not done:
+                state, reward, done, info = env.step(env.sample())
+
+            assert vec.severities[i, :trials_per_sequence[i]].tolist() == env.severities
+            assert numpy.array_equal(vec.severity_evolution[i, :trials_per_sequence[i]+1, :trials_per_sequence[i]], env.severity_evolution)
+            assert final_rewards[i] == reward
+
+    def test_closed_form_damage( self ):
+        for severity, allocation, time in [(3.,5.,3), (8.,0.,6), (4.,1.,2), (9.,10.,1), (6.,2.5,4)]:
+            damage = Agent.damage_cities(tf.constant(severity), tf.constant(allocation), tf.constant(float(time)))
+            assert numpy.isclose(damage.numpy(), Agent.damage_city(tf.constant(severity), tf.constant(allocation), time).numpy())
+
+    def test_batched_game_damage( self ):
+        model = Agent.Model([4,4],10)
+        frozen = tf.keras.optimizers.SGD(learning_rate=0.)   # train_one_game then leaves the weights as they are
+        games = [[3.,4.,8.], [8.,3.,4.,8.,8.,6.], [5.]]
+
+        # Each game alone, as train_one_game plays it
+        expected = [float(Agent.train_one_game(model, frozen, [tf.constant(s) for s in game], 30.)) for game in games]
+
+        for width in [6, 9]:
+            mask = numpy.asarray([[k < len(game) for k in range(width)] for game in games], dtype=numpy.float32)
+            # padded cities contribute nothing, whatever their severity
+            severities = numpy.where(mask == 1, numpy.asarray([game + [0.]*(width-len(game)) for game in games], dtype=numpy.float32), 10.)
+
+            damage = Agent.get_batch_damage(model, tf.constant(severities), tf.constant(mask), tf.constant(30.))
+            assert numpy.allclose(damage.numpy(), expected, rtol=1e-5), (width, damage.numpy(), expected)
+
 
 if __name__ == '__main__':
     t = Test_()
@@ -0,0 +1,81 @@
+'''
+Test the ExperimentInputs cache against parsing the input files directly, and its derived views of the schedule against
+splitting the session sequence by sequence.
+'''
+
+
+import unittest
+import os
+import time
+import tempfile
+import numpy
+
+from PES import INPUTS_PATH
+from PES.src.input_utils import ExperimentInputs, INPUTS_CACHE_DIRNAME
+from PES.ext.tools import convert_globalseq_to_seqs
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module input_utils" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        with tempfile.TemporaryDirectory() as d:
+            lengths    = numpy.asarray( [3,5,4] )
+            severities = numpy.arange( lengths.sum() ) + 1.0
+            numpy.savetxt( os.path.join( d, 'sequence_lengths.csv' ), lengths, fmt = '%d', delimiter = ',' )
+            numpy.savetxt( os.path.join( d, 'initial_severity.csv' ), severities, fmt = '%d', delimiter = ',' )
+            numpy.save( os.path.join( d, 'table.npy' ), numpy.eye( 3 ) )
+
+            inputs = ExperimentInputs( d )
+            self.assertEqual( inputs.keys(), [ 'initial_severity.csv', 'sequence_lengths.csv', 'table.npy' ] )
+            self.assertTrue( numpy.array_equal( inputs[ 'initial_severity' ], severities ) )
+            self.assertTrue( numpy.array_equal( inputs[ 'table.npy' ], numpy.eye( 3 ) ) )
+            self.assertTrue( os.path.isfile( os.path.join( d, INPUTS_CACHE_DIRNAME, 'initial_severity.csv.npy' ) ) )
+            self.assertFalse( 'missing' in inputs )
+
+          # Derived views
+            self.assertEqual( inputs.SequenceLengths.dtype, numpy.int64 )
+            self.assertTrue( numpy.array_equal( inputs.SequenceOffsets, [0,3,8,12] ) )
+            for seq, values in enumerate( convert_globalseq_to_seqs( lengths, severities ) ):
+                self.assertTrue( numpy.array_equal( inputs.get_sequence_severities( seq ), values ) )
+                self.assertTrue( numpy.array_equal( inputs.pad( severities )[ seq, : len( values ) ], values ) )
+                self.assertTrue( numpy.all( inputs.TrialIndexMap[ seq, len( values ): ] == -1 ) )
+                for trial, value in enumerate( values ):
+                    absolute = inputs.TrialIndexMap[ seq, trial ]
+                    self.assertEqual( severities[ absolute ], value )
+                    self.assertEqual( ( inputs.TrialSequence[ absolute ], inputs.TrialPosition[ absolute ] ), ( seq, trial ) )
+
+          # A new process uses the (memory-mapped) cache, unless the source file has changed
+            cached = ExperimentInputs( d )
+            self.assertIsInstance( cached[ 'initial_severity.csv' ], numpy.memmap )
+            self.assertTrue( numpy.array_equal( cached[ 'initial_severity.csv' ], severities ) )
+
+            time.sleep( 0.01 )
+            numpy.savetxt( os.path.join( d, 'initial_severity.csv' ), severities * 2, fmt = '%d', delimiter = ',' )
+            changed = ExperimentInputs( d )
+            self.assertTrue( numpy.array_equal( changed[ 'initial_severity.csv' ], severities * 2 ) )
+
+    def test_experiment_schedule( self ):
+        with tempfile.TemporaryDirectory() as d:
+            inputs = ExperimentInputs( INPUTS_PATH, CachePath = d )
+            lengths = numpy.loadtxt( os.path.join( INPUTS_PATH, 'sequence_lengths.csv' ), delimiter=',' )
+            self.assertTrue( numpy.array_equal( inputs.SequenceLengths, lengths ) )
+            self.assertTrue( numpy.array_equal( inputs.InitialSeverities, numpy.loadtxt( os.path.join( INPUTS_PATH, 'initial_severity.csv' ), delimiter=',' ) ) )
+            self.assertEqual( inputs.SequenceOffsets[ -1 ], lengths.sum() )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+'''
+Test the streaming MMA estimator against the type-2 AUROC of each player's whole history (all pairs of correct and
+incorrect trials).
+'''
+
+
+import unittest
+import numpy
+
+from PES.analysis.analyticalAgent import get_analytical_solution_for_sequence
+from PES.src.mmaCalculator import MMAEstimator, get_mma_per_trial, get_optimal_allocations
+
+
+def auroc( confidences, correct ):
+    pairs = [ ( c1 > c0 ) + 0.5 * ( c1 == c0 ) for c1 in confidences[ correct ] for c0 in confidences[ ~correct ] ]
+    return numpy.mean( pairs ) if pairs else 0.5
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module mmaCalculator" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng         = numpy.random.default_rng( 0 )
+        responses   = rng.integers( 0, 11, (3, 40) ).astype( float )
+        confidences = numpy.round( rng.random( (3, 40) ) * 20 ) / 20
+        confidences[ rng.random( (3, 40) ) < 0.1 ] = -1
+        optimal     = rng.integers( 0, 11, 40 ).astype( float )
+
+        estimator = MMAEstimator( 3 )
+        for t in range( 40 ):
+            mma = estimator.update( responses[ :, t ], confidences[ :, t ], optimal[ t ] )
+
+            for p in range( 3 ):
+                valid = confidences[ p, : t + 1 ] != -1
+                self.assertAlmostEqual( mma[ p ], auroc( confidences[ p, : t + 1 ][ valid ], numpy.abs( responses[ p, : t + 1 ] - optimal[ : t + 1 ] )[ valid ] <= 1 ) )
+
+    def test_optimal_allocations( self ):
+        severities = numpy.asarray( [ 3.0, 5.0, 2.0, 4.0 ] )
+        optimal    = get_optimal_allocations( severities, [ 4, 3, 2, 1 ] )
+        self.assertTrue( numpy.array_equal( optimal, numpy.clip( get_analytical_solution_for_sequence( severities, 0.4, numpy.inf, 0, 10 ), 0, 10 ) ) )
+
+      # A player allocating optimally with high confidence, and randomly with low confidence, is perfectly metacognitive
+        lengths     = [ 4, 3 ]
+        severities  = numpy.asarray( [ 3.0, 5.0, 2.0, 4.0, 6.0, 2.0, 7.0 ] )
+        optimal     = numpy.concatenate( [ get_optimal_allocations( severities[ :4 ], [ 4, 3, 2, 1 ] ), get_optimal_allocations( severities[ 4: ], [ 3, 2, 1 ] ) ] )
+        responses   = numpy.asarray( [ numpy.where( [ 1, 0, 1, 0, 1, 0, 1 ], optimal, ( optimal + 5 ) % 11 ) ] )
+        confidences = numpy.asarray( [ [ 0.9, 0.1, 0.8, 0.2, 0.9, 0.1, 0.7 ] ] )
+
+        mmas = get_mma_per_trial( responses, confidences, severities, lengths )
+        self.assertEqual( mmas.shape, (1, 7) )
+        self.assertEqual( mmas[ 0, 0 ], 0.5 )
+        self.assertEqual( mmas[ 0, -1 ], 1.0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+'''
+Test the dynamic-programming optimal allocator against enumerating every allocation of short sequences, and the count
+of allocations against the enumeration of integerpartition.py.
+'''
+
+
+import unittest
+import itertools
+import numpy
+
+from PES import SEVERITY_MULTIPLIER, RESPONSE_MULTIPLIER
+from PES.src.input_utils import get_experiment_inputs
+from PES.ext.optimal_allocator import get_optimal_allocations, count_allocations, AVAILABLE_RESOURCES
+
+
+def partition( n, d, limit, depth = 0 ):
+  # As in integerpartition.py (which runs on import)
+    if d == depth:
+        return [ [] ]
+    return [ item + [ i ] for i in range( n + 1 ) if i <= limit for item in partition( n - i, d, limit, depth = depth + 1 ) ]
+
+
+def brute_force( severities, resources, min_allocation = 0, max_allocation = 10 ):
+    '''
+    All the allocations of the sequence that add up to no more than resources, and the sum of their final severities,
+    playing the cities trial by trial.
+    '''
+    allocations = numpy.asarray( list( itertools.product( range( min_allocation, max_allocation + 1 ), repeat = len( severities ) ) ), dtype = float )
+    allocations = allocations[ allocations.sum( axis = 1 ) <= resources ]
+
+    current = numpy.zeros( allocations.shape )
+    for t, severity in enumerate( severities ):
+        current[ :, t ] = severity
+        active          = numpy.arange( len( severities ) ) <= t
+        current         = numpy.where( active, numpy.maximum( SEVERITY_MULTIPLIER * current - RESPONSE_MULTIPLIER * allocations, 0 ), 0 )
+
+    return allocations, current.sum( axis = 1 )
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module optimal_allocator" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng        = numpy.random.default_rng( 0 )
+        lengths    = numpy.asarray( [ 1, 3, 4, 2, 4 ] )
+        severities = rng.integers( 0, 11, lengths.sum() ).astype( float )
+        offsets    = numpy.concatenate( ( [ 0 ], numpy.cumsum( lengths ) ) )
+
+        for resources, min_allocation in ( (AVAILABLE_RESOURCES, 0), (12, 0), (12, 2) ):
+            optimal, totals = get_optimal_allocations( lengths, severities, resources, min_allocation, 10 )
+
+            for s in range( len( lengths ) ):
+                allocations, expected = brute_force( severities[ offsets[ s ] : offsets[ s + 1 ] ], resources, min_allocation, 10 )
+                found,       = numpy.flatnonzero( numpy.all( allocations == optimal[ s ], axis = 1 ) )
+
+                self.assertAlmostEqual( totals[ s ], expected.min(), msg = (resources, min_allocation, s) )
+                self.assertAlmostEqual( expected[ found ], expected.min(), msg = (resources, min_allocation, s) )
+
+    def test_experiment_sequence( self ):
+        severities = get_experiment_inputs().get_sequence_severities( 0 )
+        optimal, totals = get_optimal_allocations( get_experiment_inputs().SequenceLengths[ :1 ], severities )
+
+        _, expected = brute_force( severities, AVAILABLE_RESOURCES )
+
+        self.assertAlmostEqual( totals[ 0 ], expected.min() )
+        self.assertAlmostEqual( totals[ 0 ], 12.85, places = 2 )
+        self.assertEqual( optimal[ 0 ].tolist(), [ 6, 8, 6, 10, 0 ] )
+
+    def test_count_allocations( self ):
+        for resources, length in itertools.product( [ 0, 5, 12, 40 ], range( 5 ) ):
+            self.assertEqual( count_allocations( resources, length, 0, 10 ), len( partition( resources, length, 10 ) ), (resources, length) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+'''
+Test the batched joint-game damage of the oracle calibrator against playing every joint game on its own, as
+train_one_joint_game does.
+'''
+
+
+import unittest
+import numpy
+import tensorflow as tf
+
+from PES.ext.oracle_agent_calibrator import Calibrator, train_one_joint_game, pad_joint_games, get_joint_batch_damage
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module oracle_agent_calibrator" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng                = numpy.random.default_rng( 0 )
+        lengths            = numpy.asarray( [ 3, 5, 1 ] )
+        severities         = rng.integers( 0, 11, lengths.sum() ).astype( float )
+        allocations        = rng.integers( 0, 11, lengths.sum() ).astype( float )
+        paired_allocations = rng.integers( 0, 11, lengths.sum() ).astype( float )
+        paired_confidences = numpy.round( rng.random( lengths.sum() ), 2 )
+        paired_confidences[ 1 ] = 0
+
+        calibrator = Calibrator( [4,4], 1 )
+        frozen     = tf.keras.optimizers.SGD( learning_rate = 0. )   # train_one_joint_game then leaves the weights as they are
+        offsets    = numpy.concatenate( ( [ 0 ], numpy.cumsum( lengths ) ) )
+
+      # Each joint game alone, as train_one_joint_game plays it
+        expected = [ float( train_one_joint_game( calibrator, frozen, [ tf.constant( s, dtype = tf.float32 ) for s in severities[ start : end ] ], 30.,
+                                                  allocations[ start : end ], paired_allocations[ start : end ], paired_confidences[ start : end ] ) )
+                     for start, end in zip( offsets[ :-1 ], offsets[ 1: ] ) ]
+
+        games = pad_joint_games( lengths, severities, allocations, paired_allocations, paired_confidences )
+        mask  = games[ -1 ]
+
+        self.assertEqual( [ values.shape for values in games ], [ (3, 5) ] * 5 )
+        self.assertTrue( numpy.array_equal( mask.sum( axis = 1 ), lengths ) )
+
+      # Padded cities contribute nothing, whatever their values, and however wide the batch
+        for width in [ 5, 8 ]:
+            padded = [ numpy.pad( values, ((0, 0), (0, width - 5)) ) for values in games ]
+            padded = [ numpy.where( padded[ -1 ] == 1, values, 10. ).astype( numpy.float32 ) for values in padded[ :-1 ] ] + [ padded[ -1 ] ]
+
+            damage = get_joint_batch_damage( calibrator, *[ tf.constant( values ) for values in padded ], tf.constant( 30. ) )
+            self.assertTrue( numpy.allclose( damage.numpy(), expected, rtol = 1e-5 ), (width, damage.numpy(), expected) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+'''
+Test the batched Q-learning trainer and the exact Q solver of the pandemic environment on a tiny game.
+'''
+
+
+import unittest
+import itertools
+import numpy
+from gym import spaces
+
+from PES.src.exp_utils import get_updated_severity
+from PES.ext.pandemic import VecPandemic, QLearningBatch, QBackwardInduction
+
+
+def tiny_env( num_envs, number_cities_prob, severity_prob, max_resources = 6, seed = 0 ):
+    env = VecPandemic( num_envs, record_evolution = False, seed = seed )
+    env.max_resources              = max_resources
+    env.available_resources_states = max_resources + 1
+    env.number_cities_prob         = numpy.asarray( number_cities_prob, dtype = float )
+    env.severity_prob              = numpy.asarray( severity_prob, dtype = float )
+    return env
+
+
+def brute_force_q( number_cities_prob, severity_prob, max_resources, num_actions, discount = 1.0, final_severity = False ):
+    '''
+    Q of every ( resources × trial × severity × action ) state, by enumerating every continuation of the game (every
+    sequence length and severity to come, and the best action at every later trial), playing the cities trial by trial.
+    '''
+    survival = lambda k: sum( p for n, p in number_cities_prob if n >= k )
+
+    def cost( cities ):
+      # Cost of the cities played from the decision on, until the end of the sequence
+        severities, resources, total = [], [], 0.0
+        for step, (severity, allocation) in enumerate( cities ):
+            severities.append( severity )
+            resources .append( allocation )
+            severities = get_updated_severity( len( severities ), resources, severities )
+            total     += 0.0 if final_severity else discount ** step * sum( severities )
+        return sum( severities ) if final_severity else total
+
+    def expected_cost( resources, t, cities ):
+      # Expected cost once trial t has been played (hence n >= t + 1)
+        total = sum( p for n, p in number_cities_prob if n == t + 1 ) / survival( t + 1 ) * cost( cities )
+        if survival( t + 2 ) > 0:
+            total += survival( t + 2 ) / survival( t + 1 ) * sum( p * min( expected_cost( resources - min( a, resources ), t + 1, cities + [ (severity, min( a, resources )) ] )
+                                                                          for a in range( num_actions ) ) for severity, p in severity_prob )
+        return total
+
+    Q = numpy.zeros( (max_resources + 1, max( n for n, _ in number_cities_prob ), 11, num_actions) )
+    for r, t, (severity, _), a in itertools.product( range( max_resources + 1 ), range( Q.shape[ 1 ] ), severity_prob, range( num_actions ) ):
+        Q[ r, t, severity, a ] = -expected_cost( r - min( a, r ), t, [ (severity, min( a, r )) ] )
+    return Q
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module pandemic" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_qlearning_batch( self ):
+      # A deterministic game (two cities of severity 5), so that Q-learning converges to the exact Q of the first trial,
+      # whatever the number of episodes played side by side
+        exact = QBackwardInduction( tiny_env( 1, [ [ 2, 1.0 ] ], [ [ 5, 1.0 ] ] ) )[ 6, 0, 5 ]
+
+        for num_envs, episodes in ( (1, 3000), (256, 40000) ):
+            _, Q, _ = QLearningBatch( tiny_env( num_envs, [ [ 2, 1.0 ] ], [ [ 5, 1.0 ] ] ), 0.1, 1.0, 1.0, 1.0, episodes, report_every = numpy.inf )
+
+            self.assertLess( numpy.abs( Q ).max(), 100, num_envs )
+            self.assertTrue( numpy.allclose( Q[ 6, 0, 5 ], exact, atol = 1e-4 ), (num_envs, Q[ 6, 0, 5 ], exact) )
+
+    def test_backward_induction( self ):
+        number_cities_prob = [ [ 1, 0.2 ], [ 2, 0.3 ], [ 3, 0.5 ] ]
+        severity_prob      = [ [ 2, 0.4 ], [ 6, 0.6 ] ]
+
+        for discount, final_severity in ( (1.0, False), (0.9, False), (1.0, True) ):
+            env = tiny_env( 1, number_cities_prob, severity_prob, max_resources = 4 )
+            env.action_space = spaces.Discrete( 6 )   # more actions than resources, to cover the clipped allocations
+
+            Q        = QBackwardInduction( env, discount, final_severity )
+            expected = brute_force_q( number_cities_prob, severity_prob, 4, 6, discount, final_severity )
+
+            self.assertTrue( numpy.allclose( Q[ :, : 3, [ 2, 6 ] ], expected[ :, :, [ 2, 6 ] ] ), (discount, final_severity) )
+            self.assertTrue( numpy.all( Q[ :, 3: ] == 0 ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+'''
+Test the replay store of 'playback' players against splitting the recorded responses sequence by sequence.
+'''
+
+
+import unittest
+import os
+import tempfile
+import numpy
+
+from PES.src.replay_utils import ReplayStore, get_responses_filename
+from PES.ext.tools import convert_globalseq_to_seqs
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module replay_utils" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        lengths = numpy.asarray( [3,5,4,6] )
+        columns = numpy.random.default_rng( 0 ).uniform( -1, 10, (lengths.sum(), 5) )
+
+        with tempfile.TemporaryDirectory() as d:
+            for subject in [ '001', '002' ]:
+                numpy.savetxt( get_responses_filename( subject, d ), columns + int( subject ), delimiter = ',', header = 'InitialSeverity, Response, Confidence, PressEvent_seconds, ReleaseEvent_seconds' )
+
+            store = ReplayStore( lengths, NumSequences = 2, OutputsPath = d )
+
+            for subject in [ '001', '002' ]:
+                self.assertEqual( store[ subject ].shape, (2, 2, 6) )
+
+                for column, field in enumerate( [ 'initial_severity', 'response', 'confidence', 'hold_rt', 'release_rt' ] ):
+                    for seq, values in enumerate( convert_globalseq_to_seqs( lengths, columns[ :, column ] + int( subject ) ) ):
+                        for trial, value in enumerate( values ):
+                            self.assertEqual( store.get_trial( subject, seq // 2, seq % 2, trial )[ field ], value )
+
+            self.assertTrue( os.path.isfile( get_responses_filename( '001', d ) + '.npy' ) )
+
+            cached = ReplayStore( lengths, NumSequences = 2, OutputsPath = d )
+            self.assertTrue( numpy.array_equal( cached[ '002' ], store[ '002' ] ) )
+
+            with self.assertRaises( FileNotFoundError ):   store[ '003' ]
+
+
+if __name__ == '__main__':
+    unittest.main()
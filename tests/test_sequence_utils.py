@@ -0,0 +1,63 @@
+'''
+Test the incremental sequence state against rebuilding the messages, aggregating all previous trials and scoring the
+sequence from scratch on every trial.
+'''
+
+
+import unittest
+import numpy
+
+from PES.src import exp_utils
+from PES.src.severity_utils import score_sequences
+from PES.src.sequence_utils import SequenceState
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module sequence_utils" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng            = numpy.random.default_rng( 0 )
+        first_severity = rng.integers( 2, 9, 30 ).astype( float )
+        start, trials  = 12, 8
+        severities     = first_severity[ start : start + trials ]
+
+        for aggregator in [ exp_utils.get_confidence_weighted_mean, exp_utils.get_confidence_weighted_median ]:
+            responses   = rng.integers( 0, 11, (3, trials) ).astype( float )
+            confidences = rng.choice( [ -1, 0.0, 0.2, 0.5, 0.9 ], (3, trials) )
+            radii       = rng.uniform( 5, 20, trials )
+            sequence    = SequenceState( severities, aggregator, 1 )
+
+            for t in range( trials ):
+                expected_messages = [ numpy.c_[ responses[ p, : t + 1 ], confidences[ p, : t + 1 ],
+                                                exp_utils.get_array_of_sequence_severities_from_allocations( responses[ p, : t + 1 ], severities[ : t + 1 ] ),
+                                                radii[ : t + 1 ] ] for p in range( 3 ) ]
+
+                my_message = sequence.add_my_trial( responses[ 0, t ], confidences[ 0, t ], radii[ t ] )
+                self.assertTrue( numpy.array_equal( my_message, expected_messages[ 0 ] ) )
+
+                messages = [ my_message ] + expected_messages[ 1: ]
+                allocations, final_severities = sequence.add_all_trials( messages, first_severity, start + t + 1 )
+                expected_allocations, expected_severities = aggregator( messages, first_severity, 1, start + t + 1 )
+
+                self.assertTrue( numpy.array_equal( allocations, expected_allocations ) )
+                self.assertEqual( final_severities, expected_severities )
+
+            performances, *_ = score_sequences( numpy.vstack( [ responses, expected_allocations ] ), [ trials ], severities )
+            self.assertTrue( numpy.array_equal( sequence.get_performances(), performances[ :, 0 ] ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+'''
+Test the vectorised severity engine against the iterative, trial-by-trial update rule.
+'''
+
+
+import unittest
+import random
+import numpy
+
+from PES.src.exp_utils import get_updated_severity
+from PES.src.exp_utils import get_array_of_sequence_severities_from_allocations
+from PES.src.exp_utils import calculate_normalised_final_severity_performance_metric
+from PES.src.severity_utils import get_sequence_final_severities, get_severity_evolution_matrix
+from PES.src.severity_utils import score_sequences, init_session_baselines, get_sequence_baselines
+from PES.src import severity_utils
+
+from PES import MAX_ALLOCATABLE_RESOURCES
+from PES import MIN_ALLOCATABLE_RESOURCES
+
+
+def iterate_sequence( Allocations, InitialSeverities ):
+    severities = []
+    resources  = []
+    evolution  = numpy.zeros( (len( InitialSeverities ) + 1, len( InitialSeverities )) )
+
+    for Trial in range( len( InitialSeverities ) ):
+        severities.append( InitialSeverities[ Trial ] )
+        resources .append( Allocations      [ Trial ] )
+        evolution[ Trial, : len( severities ) ] = severities
+        severities = get_updated_severity( len( severities ), resources, severities )
+
+    evolution[ -1, : ] = severities
+
+    return severities, evolution
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module severity_utils" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        severities  = [3,4,8]
+        allocations = [5,6,4]
+
+        f = get_array_of_sequence_severities_from_allocations( allocations, severities )
+
+        print( f )
+
+        assert numpy.allclose( f, [0.0, 2.08, 9.6] )
+
+
+class Test_severity_engine( unittest.TestCase ):
+
+    def tearDown( self ):
+        severity_utils.SessionBaselines = None   # init_session_baselines sets the module-global session table
+        severity_utils.SessionSchedule  = None
+
+    def test_integer_domain_is_exact( self ):
+        random.seed( 0 )
+        for _ in range( 2000 ):
+            n           = random.randint( 0, 12 )
+            severities  = [ random.randint( 0, 10 ) for _ in range( n ) ]
+            allocations = [ random.randint( MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES ) for _ in range( n ) ]
+
+            expected, evolution = iterate_sequence( allocations, severities )
+
+            self.assertEqual( get_array_of_sequence_severities_from_allocations( allocations, severities ), expected )
+            self.assertTrue( numpy.array_equal( get_severity_evolution_matrix( allocations, severities ), evolution ) )
+
+    def test_closed_form_outside_table( self ):
+        random.seed( 1 )
+        for _ in range( 500 ):
+            n           = random.randint( 1, 25 )
+            severities  = [ random.uniform( 0, 12 ) for _ in range( n ) ]
+            allocations = [ random.uniform( 0, 11 ) for _ in range( n ) ]
+
+            expected, _ = iterate_sequence( allocations, severities )
+
+            self.assertTrue( numpy.allclose( get_sequence_final_severities( allocations, severities ), expected ) )
+
+    def test_leading_axes( self ):
+        severities  = numpy.array( [[3,4,8],[2,2,2]] )
+        allocations = numpy.array( [[5,6,4],[0,0,0]] )
+
+        Batch = get_sequence_final_severities( allocations, severities )
+
+        for i in range( 2 ):
+            self.assertEqual( Batch[ i ].tolist(), iterate_sequence( allocations[ i ].tolist(), severities[ i ].tolist() )[ 0 ] )
+
+    def test_batched_scoring_matches_metric( self ):
+        numpy.random.seed( 0 )
+        lengths     = numpy.random.randint( 3, 11, size = 20 )
+        severities  = numpy.random.randint( 2, 9 , size = lengths.sum() ).astype( float )
+        allocations = numpy.random.randint( MIN_ALLOCATABLE_RESOURCES, MAX_ALLOCATABLE_RESOURCES + 1, size = (4, lengths.sum()) ).astype( float )
+
+        Performances, SequenceSeverities, Worst, Best, FinalSeverities = score_sequences( allocations, lengths, severities )
+
+        for subject in range( 4 ):
+            offset = 0
+            for seq, length in enumerate( lengths ):
+                final = get_array_of_sequence_severities_from_allocations( allocations[ subject, offset : offset + length ], severities[ offset : offset + length ] )
+                perf, worst, best = calculate_normalised_final_severity_performance_metric( final, severities[ offset : offset + length ] )
+
+                self.assertEqual( Performances[ subject, seq ], perf  )
+                self.assertEqual( Worst[ seq ]               , worst )
+                self.assertEqual( Best [ seq ]               , best  )
+                self.assertEqual( FinalSeverities[ subject, seq ].compressed().tolist(), final )
+                offset += length
+
+    def test_session_baselines( self ):
+        numpy.random.seed( 1 )
+        lengths    = numpy.random.randint( 3, 11, size = 10 )
+        severities = numpy.random.randint( 2, 9 , size = lengths.sum() ).astype( float )
+
+        init_session_baselines( lengths, severities )
+
+        offset = 0
+        for seq, length in enumerate( lengths ):
+            sequence = severities[ offset : offset + length ]
+            worst    = numpy.sum( iterate_sequence( [ MIN_ALLOCATABLE_RESOURCES ] * length, sequence.tolist() )[ 0 ] )
+            best     = numpy.sum( iterate_sequence( [ MAX_ALLOCATABLE_RESOURCES ] * length, sequence.tolist() )[ 0 ] )
+
+            self.assertEqual( get_sequence_baselines( sequence      ), ( worst, best ) )
+            self.assertEqual( get_sequence_baselines( sequence, seq ), ( worst, best ) )
+            offset += length
+
+      # A sequence that is not the one of the session at that index (e.g. practice, or partial) is not read off the table
+        practice = severities[ : lengths[ 1 ] ] + 1
+        partial  = severities[ : lengths[ 0 ] - 1 ]
+        for sequence in [ practice, partial ]:
+            worst = numpy.sum( iterate_sequence( [ MIN_ALLOCATABLE_RESOURCES ] * len( sequence ), sequence.tolist() )[ 0 ] )
+            best  = numpy.sum( iterate_sequence( [ MAX_ALLOCATABLE_RESOURCES ] * len( sequence ), sequence.tolist() )[ 0 ] )
+            self.assertEqual( get_sequence_baselines( sequence, 1 if sequence is practice else 0 ), ( worst, best ) )
+            self.assertEqual( get_sequence_baselines( sequence, len( lengths ) ), ( worst, best ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
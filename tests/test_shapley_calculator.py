@@ -0,0 +1,92 @@
+'''
+Test the Shapley values of module shapleyCalculator against aggregating and scoring every coalition on its own, and
+averaging the marginal contributions over every ordering of the players.
+'''
+
+
+import unittest
+import itertools
+import math
+import numpy
+
+from PES.src.exp_utils import get_weighted_means, get_weighted_medians
+from PES.src.severity_utils import score_sequences
+from PES.src.shapleyCalculator import ShapleyCalculator, get_all_coalitions, get_coalition_allocations, get_shapley_values
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module shapleyCalculator" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def test_( self ):
+        rng         = numpy.random.default_rng( 0 )
+        players     = 4
+        trials      = 6
+        severities  = rng.integers( 2, 9, trials ).astype( float )
+        responses   = rng.integers( 0, 11, (players, trials) ).astype( float )
+        confidences = rng.choice( [ -1, 0.0, 0.2, 0.5, 0.9 ], (players, trials) )
+        members     = get_all_coalitions( players )
+
+        def value( coalition, length ):
+            if not coalition:   return 0.0
+            allocations = numpy.round( get_weighted_means( responses[ list( coalition ), : length ], numpy.where( numpy.all( confidences[ list( coalition ), : length ] == -1, axis = 0 ), 1.0, confidences[ list( coalition ), : length ] ) ) )
+            return score_sequences( allocations, [ length ], severities[ : length ] )[ 0 ][ 0 ]
+
+      # Every coalition aggregates as if only its members had played
+        allocations = get_coalition_allocations( responses, confidences, members, get_weighted_medians )
+        for c in range( 1, len( members ) ):
+            sub_confidences = confidences[ members[ c ] ]
+            sub_confidences = numpy.where( numpy.all( sub_confidences == -1, axis = 0 ), 1.0, sub_confidences )
+            self.assertTrue( numpy.array_equal( allocations[ c ], numpy.round( get_weighted_medians( responses[ members[ c ] ], sub_confidences ) ) ) )
+
+      # Exact Shapley values, averaging over all orderings of the players
+        shapley = get_shapley_values( responses, confidences, severities )
+        self.assertEqual( shapley.shape, (players, trials) )
+
+        for length in range( 1, trials + 1 ):
+            expected = numpy.zeros( players )
+            for order in itertools.permutations( range( players ) ):
+                for j, player in enumerate( order ):
+                    expected[ player ] += value( order[ : j + 1 ], length ) - value( order[ : j ], length )
+            expected /= math.factorial( players )
+
+            self.assertTrue( numpy.allclose( shapley[ :, length - 1 ], expected ) )
+            self.assertAlmostEqual( shapley[ :, length - 1 ].sum(), value( tuple( range( players ) ), length ) )
+
+      # Online, one trial at a time
+        calculator = ShapleyCalculator( players, severities )
+        for t in range( trials ):   online = calculator.add_trials( responses[ :, t : t + 1 ], confidences[ :, t : t + 1 ] )
+        self.assertTrue( numpy.array_equal( online, shapley ) )
+
+      # Monte Carlo (efficient, and close to the exact values)
+        sampled = get_shapley_values( responses, confidences, severities, MaxExactPlayers = 0, NumPermutations = 4000, Seed = 1 )
+        self.assertTrue( numpy.allclose( sampled.sum( axis = 0 ), shapley.sum( axis = 0 ) ) )
+        self.assertTrue( numpy.allclose( sampled, shapley, atol = 0.02 ) )
+
+    def test_many_players( self ):
+        rng         = numpy.random.default_rng( 1 )
+        responses   = rng.integers( 0, 11, (14, 5) ).astype( float )
+        confidences = rng.choice( [ -1, 0.2, 0.5, 0.9 ], (14, 5) )
+        severities  = rng.integers( 2, 9, 5 ).astype( float )
+
+        shapley = get_shapley_values( responses, confidences, severities, NumPermutations = 50, Seed = 0 )
+        grand   = score_sequences( numpy.round( get_weighted_means( responses, confidences ) ), [ 5 ], severities )[ 0 ][ 0 ]
+
+        self.assertEqual( shapley.shape, (14, 5) )
+        self.assertAlmostEqual( shapley[ :, -1 ].sum(), grand )
+
+
+if __name__ == '__main__':
+    unittest.main()
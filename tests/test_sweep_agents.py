@@ -0,0 +1,83 @@
+'''
+Test that the sweep runner resumes from its results table: only the variants without all their rows are run again.
+'''
+
+
+import unittest
+import os
+import csv
+import tempfile
+
+from PES.ext import sweep_agents
+from PES.ext.sweep_agents import run_sweep, read_results, get_num_rows, FIELDS
+
+
+VARIANTS = [ dict( variant = 'nn_done'   , agent = 'nn', seed = 0 ),
+             dict( variant = 'nn_partial', agent = 'nn', seed = 0 ),
+             dict( variant = 'rl_cut'    , agent = 'rl', seed = 0 ),
+             dict( variant = 'rl_new'    , agent = 'rl', seed = 0 ) ]
+
+
+def fake_run_variant( variant, sweep_path ):
+  # Runs in a worker process: leaves a mark of the run instead of training anything
+    with open( os.path.join( sweep_path, 'variants', variant[ 'variant' ] + '.ran' ), 'a' ) as f:   f.write( 'x' )
+    return [ dict( { field: '' for field in FIELDS }, variant = variant[ 'variant' ], agent = variant[ 'agent' ], noise_variance = n,
+                   performance = 0.5, performance_std = 0.1, seconds = 1.0, weights = variant[ 'variant' ] ) for n in range( get_num_rows( variant ) ) ]
+
+
+def fake_init_worker():
+    pass
+
+
+# --------------------------------------------------------
+# Print a nice header identifying the module under testing
+# --------------------------------------------------------
+
+class Test_( unittest.TestCase ):   # Note: the name 'Test_' guarantees
+                                    # (alphabetically) this TestCase is run
+                                    # before other TestCases in this module
+
+    def setUpClass():
+        print(                                                          )
+        print( "******************************************************" )
+        print( "*** Unit tests for module sweep_agents" )
+        print( "******************************************************" )
+        print(                                                          )
+    def tearDownClass ():   print( )
+
+    def setUp( self ):
+        for name, fake in ( ('run_variant', fake_run_variant), ('init_worker', fake_init_worker) ):
+            self.addCleanup( setattr, sweep_agents, name, getattr( sweep_agents, name ) )
+            setattr( sweep_agents, name, fake )
+
+    def test_resume( self ):
+        with tempfile.TemporaryDirectory() as d:
+            os.makedirs( os.path.join( d, 'variants' ) )
+            row = lambda variant, agent, noise, weights: dict( { field: '' for field in FIELDS }, variant = variant, agent = agent, noise_variance = noise, performance = 0.25, weights = weights )
+
+          # nn_done has all its rows, nn_partial only one of them, the row of rl_cut was cut short, and rl_gone is no longer a variant
+            with open( os.path.join( d, 'results.csv' ), 'w', newline = '' ) as f:
+                writer = csv.DictWriter( f, fieldnames = FIELDS )
+                writer.writeheader()
+                writer.writerows( [ row( 'nn_done', 'nn', 0, 'w' ), row( 'nn_partial', 'nn', 0, 'w' ), row( 'nn_done', 'nn', 1, 'w' ),
+                                    row( 'rl_gone', 'rl', '', 'w' ), row( 'rl_cut', 'rl', '', '' ) ] )
+
+            results = run_sweep( d, VARIANTS, max_workers = 2 )
+
+            ran = sorted( name[ : -len( '.ran' ) ] for name in os.listdir( os.path.join( d, 'variants' ) ) )
+            self.assertEqual( ran, [ 'nn_partial', 'rl_cut', 'rl_new' ] )
+
+            for rows in ( results, read_results( os.path.join( d, 'results.csv' ) ) ):
+                self.assertEqual( sorted( (row[ 'variant' ], str( row[ 'noise_variance' ] )) for row in rows ),
+                                  [ ('nn_done', '0'), ('nn_done', '1'), ('nn_partial', '0'), ('nn_partial', '1'), ('rl_cut', '0'), ('rl_new', '0') ] )
+
+            self.assertEqual( [ row[ 'performance' ] for row in results if row[ 'variant' ] == 'nn_done' ], [ '0.25', '0.25' ] )
+
+          # Nothing is left to run
+            run_sweep( d, VARIANTS, max_workers = 2 )
+            for name in ran:
+                with open( os.path.join( d, 'variants', name + '.ran' ) ) as f:   self.assertEqual( f.read(), 'x' )
+
+
+if __name__ == '__main__':
+    unittest.main()